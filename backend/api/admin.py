@@ -0,0 +1,197 @@
+"""
+Admin configuration for the TrackEase API application.
+
+The expense tables grow to millions of rows, so every admin here avoids the
+queries the stock changelist runs per page view:
+
+- ``COUNT(*)`` over the table is replaced by a count that stops at
+  ``settings.ADMIN_EXACT_COUNT_LIMIT`` rows, with an estimate beyond it
+  (``EstimatedCountPaginator``), and the unfiltered total is never counted.
+- In the default newest-first order pages are fetched by primary key
+  (``KeysetChangeList``) instead of ``OFFSET``, so the last page is as
+  cheap as the first. Sorting by a column falls back to numbered pages.
+- Foreign keys are shown with ``list_select_related`` and edited with
+  autocomplete widgets, which never render every user or group.
+- The actions settle, archive and re-split the selection with set-based
+  queries that also keep the balance ledger and group counters right.
+
+The admin reads and writes the ``default`` database, so with
+``DB_SHARDS`` set it only sees groups placed there.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.utils.functional import cached_property
+
+from .archive import archive_expenses
+from .balances import resplit_evenly, settle_shares
+from .models import Expense, ExpenseShare, Group, UserProfile
+
+CURSOR_VAR = 'cursor'
+
+
+def estimate_count(queryset):
+    """
+    Return an estimate of the rows in ``queryset``, or None when it is filtered.
+
+    PostgreSQL's planner statistics are used when available, otherwise the
+    span of primary keys, which is exact until rows are deleted.
+    """
+    if queryset.query.where:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+    bounds = queryset.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    return bounds['high'] - bounds['low'] + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts at most ``ADMIN_EXACT_COUNT_LIMIT`` rows.
+
+    Larger results are estimated with ``estimate_count``, or reported as the
+    limit when they are filtered; ``estimated`` is then True.
+    """
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        queryset = self.object_list.order_by()
+        count = queryset.values('pk')[:limit + 1].count()
+        if count <= limit:
+            return count
+        self.estimated = True
+        return max(estimate_count(queryset) or 0, limit)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages by primary key while the list is in its default order.
+
+    ``?cursor=<pk>`` shows the rows with a lower primary key; ``first_url``
+    and ``next_url`` link the pages for the pagination template.
+    """
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_results(self, request):
+        super().get_results(request)
+        # Leave the cursor out of the sort, filter and search links.
+        cursor = self.params.pop(CURSOR_VAR, None)
+        self.keyset = (
+            ORDER_VAR not in self.params
+            and list(self.model_admin.get_ordering(request)) == ['-pk']
+            and self.multi_page
+            and not (self.show_all and self.can_show_all)
+        )
+        self.cursor = self.first_url = self.next_url = None
+        if not self.keyset:
+            return
+
+        queryset = self.queryset
+        if cursor is not None:
+            try:
+                self.cursor = int(cursor)
+            except ValueError:
+                raise IncorrectLookupParameters
+            queryset = queryset.filter(pk__lt=self.cursor)
+            self.first_url = self.get_query_string(remove=[CURSOR_VAR])
+        self.result_list = queryset[:self.list_per_page]
+        rows = list(self.result_list)
+        if len(rows) == self.list_per_page:
+            self.next_url = self.get_query_string({CURSOR_VAR: rows[-1].pk})
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Base admin for large tables, see the module docstring."""
+
+    ordering = ['-pk']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+@admin.register(Group)
+class GroupAdmin(ScalableAdmin):
+    list_display = ['id', 'name', 'created_by', 'member_count', 'expense_count', 'total_amount', 'last_activity_at']
+    list_select_related = ['created_by']
+    search_fields = ['^name']
+    autocomplete_fields = ['created_by', 'members']
+    readonly_fields = ['version', *Group.COUNTER_FIELDS]
+
+
+@admin.register(Expense)
+class ExpenseAdmin(ScalableAdmin):
+    list_display = ['id', 'description', 'amount', 'currency', 'group', 'paid_by', 'created_at']
+    list_select_related = ['group', 'paid_by']
+    search_fields = ['^description']
+    autocomplete_fields = ['group', 'paid_by']
+    raw_id_fields = ['recurring']
+    readonly_fields = ['version']
+    actions = ['settle', 'archive', 'resplit']
+
+    @admin.action(description='Settle all shares of the selected expenses')
+    def settle(self, request, queryset):
+        shares = ExpenseShare.objects.using(queryset.db).filter(expense__in=queryset.values('pk'))
+        with transaction.atomic(using=queryset.db):
+            settled = len(settle_shares(shares))
+        self.message_user(request, f'Settled {settled} shares.')
+
+    @admin.action(description='Archive the selected expenses that are fully settled')
+    def archive(self, request, queryset):
+        archived = archive_expenses(queryset)
+        self.message_user(request, f'Archived {archived} expenses.')
+
+    @admin.action(description='Split the selected expenses evenly again')
+    def resplit(self, request, queryset):
+        with transaction.atomic(using=queryset.db):
+            changed = resplit_evenly(queryset)
+        self.message_user(request, f'Changed {changed} shares; expenses with settled shares were skipped.')
+
+
+@admin.register(ExpenseShare)
+class ExpenseShareAdmin(ScalableAdmin):
+    list_display = ['id', 'expense', 'user', 'amount', 'is_settled', 'settled_at']
+    list_select_related = ['expense', 'user']
+    list_filter = ['is_settled']
+    autocomplete_fields = ['expense', 'user']
+    actions = ['settle']
+
+    @admin.action(description='Settle the selected shares')
+    def settle(self, request, queryset):
+        with transaction.atomic(using=queryset.db):
+            settled = len(settle_shares(queryset))
+        self.message_user(request, f'Settled {settled} shares.')
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(ScalableAdmin):
+    list_display = ['id', 'user', 'phone_number']
+    list_select_related = ['user']
+    search_fields = ['^user__email']
+    autocomplete_fields = ['user']
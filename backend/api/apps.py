@@ -0,0 +1,18 @@
+"""
+Application configuration for the TrackEase API application.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    name = 'api'
+
+    def ready(self):
+        # Connect the signal receivers that maintain the group counters,
+        # the balance ledger, the email filter and the shard directory.
+        from . import counters, email_filter, ledger, sharding  # noqa: F401
@@ -0,0 +1,112 @@
+"""
+Expense archival for the TrackEase API application.
+
+Fully settled expenses older than ``settings.ARCHIVE_AFTER_DAYS`` are moved
+with their shares from the Expense and ExpenseShare tables into
+ArchivedExpense and ArchivedExpenseShare. The hot tables, and every index
+that balance and list queries use, then only grow with recent and open
+data, however long a group has been around.
+
+An expense is fully settled when no share owed by someone other than the
+payer is open. Archived expenses therefore never contribute to group
+balances; only the "paid" dashboard total reads the archive.
+
+Lists and exports include the archive when asked with ``?archived=true``.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import counters, ledger, sharding
+from .models import ArchivedExpense, ArchivedExpenseShare, Expense, ExpenseShare
+
+
+def include_archived(request):
+    """Return whether the request asks for archived expenses with ``?archived=true``."""
+    return request.query_params.get('archived', '').lower() in ('1', 'true', 'yes')
+
+
+def settled_expenses(expenses):
+    """Return the fully settled expenses among ``expenses``."""
+    open_shares = ExpenseShare.objects.filter(
+        expense=OuterRef('pk'), is_settled=False
+    ).exclude(user=OuterRef('paid_by'))
+    return expenses.exclude(Exists(open_shares))
+
+
+def archivable_expenses(before):
+    """Return the fully settled expenses created before ``before``."""
+    return settled_expenses(Expense.objects.filter(created_at__lt=before))
+
+
+def _columns(model):
+    """Return the columns an archive model shares with its hot table."""
+    return [field.attname for field in model._meta.concrete_fields if field.name != 'archived_at']
+
+
+def archive_settled(before=None, batch_size=1000):
+    """
+    Move archivable expenses and their shares into the archive tables.
+
+    ``before`` defaults to ``ARCHIVE_AFTER_DAYS`` days ago. Expenses are
+    moved in batches of ``batch_size``, one transaction per batch, so the
+    hot tables are never locked for long. Shards are archived one after the
+    other. Returns the number of archived expenses.
+    """
+    if before is None:
+        before = timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    archived = 0
+    for alias in sharding.all_shards():
+        with sharding.use_shard(alias):
+            archived += _archive(alias, lambda: archivable_expenses(before), batch_size)
+    return archived
+
+
+def archive_expenses(expenses, batch_size=1000):
+    """
+    Move the fully settled expenses among ``expenses`` into the archive.
+
+    Expenses with open shares are left alone. Returns the number of
+    archived expenses.
+    """
+    with sharding.use_shard(expenses.db):
+        return _archive(expenses.db, lambda: settled_expenses(expenses.all()), batch_size)
+
+
+def _archive(alias, archivable, batch_size):
+    expense_columns = _columns(ArchivedExpense)
+    share_columns = _columns(ArchivedExpenseShare)
+    archived = 0
+
+    while True:
+        with transaction.atomic(using=alias):
+            ids = list(
+                archivable().select_for_update()
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return archived
+
+            ArchivedExpense.objects.bulk_create([
+                ArchivedExpense(**row)
+                for row in Expense.objects.filter(pk__in=ids).values(*expense_columns)
+            ])
+            ArchivedExpenseShare.objects.bulk_create([
+                ArchivedExpenseShare(**row)
+                for row in ExpenseShare.objects.filter(expense_id__in=ids).values(*share_columns)
+            ])
+            # Archived shares move no money, so the ledger has nothing to
+            # record, and archived expenses still count towards the group
+            # counters.
+            with ledger.paused(), counters.paused():
+                ExpenseShare.objects.filter(expense_id__in=ids).delete()
+                Expense.objects.filter(pk__in=ids).delete()
+            archived += len(ids)
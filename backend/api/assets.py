@@ -0,0 +1,313 @@
+"""
+Static, media and frontend asset serving for the TrackEase API application.
+
+The deployment builds the assets once::
+
+    cd frontend && npm run build
+    cd backend && python manage.py collectstatic --noinput
+
+``collectstatic`` collects the static files of the apps and of the React
+build (``FRONTEND_BUILD_DIR/static``) with ``CompressedManifestStaticFilesStorage``:
+every file is also stored under a content-hashed name, and next to it go
+gzip and brotli versions compressed at the highest levels, which are too
+slow to use per request.
+
+``api.middleware.AssetMiddleware`` serves ``STATIC_ROOT``, ``MEDIA_ROOT``
+and the top-level files of the React build from the Django process, before
+any other middleware runs, and ``frontend`` answers every other page URL
+with the SPA's ``index.html``. Responses:
+
+- use the precompressed file the client accepts (brotli first), with the
+  encoding appended to the ETag like ``CompressionMiddleware`` does;
+- are cached for a year and marked ``immutable`` when the name contains a
+  content hash (Django's and the React build's), and revalidated with
+  ETag or Last-Modified otherwise;
+- answer single byte ``Range`` requests with 206 (on the uncompressed file);
+- are file responses, so WSGI servers with ``wsgi.file_wrapper`` (gunicorn)
+  send them with ``sendfile()``.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+from .middleware import parse_accept_encoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Precompressed variants in order of preference, as (encoding, suffix).
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+# Formats that are compressed already.
+INCOMPRESSIBLE = {
+    '.avif', '.br', '.gif', '.gz', '.jpeg', '.jpg', '.mp3', '.mp4', '.ogg',
+    '.png', '.webm', '.webp', '.woff', '.woff2', '.zip',
+}
+# Django's manifest storage and the React build put a hex content hash
+# between the name and the extension, e.g. ``main.3f2a1b9c.js``.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,32}\.')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_found = {}
+
+
+def _compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # A fixed mtime keeps the output identical between builds.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(path):
+    """
+    Write the gzip and brotli versions of the file at ``path`` next to it.
+
+    Small files, compressed formats and variants that save less than 5% are
+    skipped; variants newer than the file are kept. Returns the encodings
+    that ``path`` has afterwards.
+    """
+    if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE:
+        return []
+    source = os.stat(path)
+    if source.st_size < settings.COMPRESSION_MIN_SIZE:
+        return []
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    encodings = []
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        variant = path + suffix
+        try:
+            if os.stat(variant).st_mtime >= source.st_mtime:
+                encodings.append(encoding)
+                continue
+        except FileNotFoundError:
+            pass
+        compressed = _compress(encoding, data)
+        if len(compressed) < len(data) * 0.95:
+            with open(variant, 'wb') as file:
+                file.write(compressed)
+            encodings.append(encoding)
+        elif os.path.exists(variant):
+            os.remove(variant)
+    return encodings
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also precompresses every collected file, see ``precompress``."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if self.exists(name):
+                precompress(self.path(name))
+
+
+class Asset:
+    """A servable file, its precompressed variants and its response headers."""
+
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'content_type', 'cache_control', 'variants')
+
+    def __init__(self, path, info, cache_control):
+        self.path = path
+        self.size = info.st_size
+        self.mtime = int(info.st_mtime)
+        self.etag = f'"{self.mtime:x}-{self.size:x}"'
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.cache_control = cache_control
+        # Encoding -> (path, size) of the precompressed versions.
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            try:
+                self.variants[encoding] = (path + suffix, os.stat(path + suffix).st_size)
+            except OSError:
+                pass
+
+
+def find(root, name, cache_control=None, cache=False):
+    """
+    Return the Asset for the file ``name`` under ``root``, or None.
+
+    ``cache_control`` defaults to a year for content-hashed names and to
+    revalidation otherwise. With ``cache`` the lookup is remembered for the
+    life of the process, for roots that only change on deployment.
+    """
+    key = (root, name)
+    if cache and key in _found:
+        return _found[key]
+    try:
+        path = safe_join(root, name)
+        info = os.stat(path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(info.st_mode):
+        return None
+    if cache_control is None:
+        cache_control = IMMUTABLE if HASHED_NAME.search(os.path.basename(name)) else REVALIDATE
+    asset = Asset(path, info, cache_control)
+    if cache:
+        _found[key] = asset
+    return asset
+
+
+def frontend_files(build_dir):
+    """Return the names of the files in the React build, except those under ``static/``."""
+    names = set()
+    for directory, subdirectories, files in os.walk(build_dir):
+        relative = os.path.relpath(directory, build_dir)
+        if relative == '.':
+            subdirectories[:] = [name for name in subdirectories if name != 'static']
+            relative = ''
+        names.update(os.path.join(relative, name).replace(os.sep, '/') for name in files)
+    return names
+
+
+def negotiate_encoding(request, asset):
+    """Return the precompressed encoding of ``asset`` the client prefers, if any."""
+    if not asset.variants:
+        return None
+    qualities = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    best, best_quality = None, 0.0
+    for encoding, _ in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if encoding in asset.variants and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def not_modified(request, asset):
+    """Return whether the request's validators match ``asset``, in any encoding."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if header:
+        tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+        return '*' in tags or any(
+            tag == asset.etag or (tag.startswith(asset.etag[:-1] + '-') and tag.endswith('"'))
+            for tag in tags
+        )
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and asset.mtime <= since
+
+
+def byte_range(request, asset):
+    """
+    Return the ``(start, end)`` bytes (inclusive) a Range header asks for.
+
+    Returns None to send the whole file: without a Range header, with a
+    stale If-Range, or with several or malformed ranges. Returns
+    ``(None, None)`` when the range lies outside the file.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != asset.etag and parse_http_date_safe(if_range) != asset.mtime:
+        return None
+    match = RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # "bytes=-500" is the last 500 bytes.
+        start, end = max(asset.size - int(last), 0), asset.size - 1
+    else:
+        start = int(first)
+        end = min(int(last), asset.size - 1) if last else asset.size - 1
+    if start >= asset.size or start > end:
+        return None, None
+    return start, end
+
+
+class FileRange:
+    """The next ``length`` bytes of an open file; keeps ``fileno`` for sendfile."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def serve(request, asset):
+    """Return the response for a GET or HEAD request of ``asset``."""
+    encoding = negotiate_encoding(request, asset)
+    requested = byte_range(request, asset)
+    if requested is not None:
+        # Byte offsets refer to the uncompressed file.
+        encoding = None
+    etag = f'{asset.etag[:-1]}-{encoding}"' if encoding else asset.etag
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(asset.mtime),
+        'Cache-Control': asset.cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+    if asset.variants:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if not_modified(request, asset):
+        return HttpResponse(status=304, headers=headers)
+    if requested == (None, None):
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{asset.size}'})
+
+    path, size = asset.variants[encoding] if encoding else (asset.path, asset.size)
+    start, end = requested or (0, size - 1)
+    length = end - start + 1
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if requested:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    status = 206 if requested else 200
+
+    if request.method == 'HEAD':
+        response = HttpResponse(status=status, content_type=asset.content_type, headers=headers)
+    else:
+        file = open(path, 'rb')
+        if start:
+            file.seek(start)
+        body = FileRange(file, length) if end < size - 1 else file
+        response = FileResponse(body, status=status, content_type=asset.content_type, headers=headers)
+    response['Content-Length'] = str(length)
+    return response
+
+
+def frontend(request, path=''):
+    """Serve the React app's ``index.html`` for the client-side routes."""
+    asset = find(settings.FRONTEND_BUILD_DIR, 'index.html', cache_control=REVALIDATE, cache=not settings.DEBUG)
+    if asset is None:
+        raise Http404('The frontend has not been built')
+    return serve(request, asset)
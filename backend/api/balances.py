@@ -0,0 +1,157 @@
+"""
+Balance calculations for the TrackEase API application.
+
+Balances are derived from the outstanding (unsettled) expense shares of a
+group and computed in the database with two grouped aggregates, so the cost
+does not depend on how many shares a group has accumulated.
+
+A positive balance means the member is owed money, a negative balance means
+the member owes money to the rest of the group. Shares are converted to the
+requested currency inside the same aggregate queries (see ``api.fx``).
+
+Archived expenses (see ``api.archive``) are fully settled, so they only
+count towards the amount a user has paid.
+
+Group balances are computed on the shard holding the group (see
+``api.sharding``); dashboard totals add up the totals of every shard.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import Exists, F, OuterRef, Sum
+from django.utils import timezone
+
+from . import counters, ledger, sharding
+from .fx import converted_amount
+from .models import ArchivedExpense, Expense, ExpenseShare, LedgerEntry
+from .splits import CENT, split_evenly
+
+
+def outstanding_shares(group_id):
+    """Return the unsettled shares of a group that move money between members."""
+    return ExpenseShare.objects.using(sharding.shard_for_group(group_id)).filter(
+        expense__group_id=group_id,
+        is_settled=False,
+    ).exclude(user=F('expense__paid_by'))
+
+
+def group_balances(group_id, currency=None):
+    """
+    Return the net balance of every member with outstanding shares.
+
+    Balances are reported in ``currency`` (the base currency by default).
+    Returns a list of ``{'user': <id>, 'balance': <Decimal>}`` dicts ordered
+    by user ID.
+    """
+    shares = outstanding_shares(group_id)
+    total = Sum(converted_amount('expense__', currency))
+    balances = defaultdict(Decimal)
+
+    for row in shares.values('user').annotate(total=total).order_by():
+        balances[row['user']] -= row['total']
+    for row in shares.values('expense__paid_by').annotate(total=total).order_by():
+        balances[row['expense__paid_by']] += row['total']
+
+    return [
+        {'user': user_id, 'balance': balance.quantize(CENT)}
+        for user_id, balance in sorted(balances.items())
+    ]
+
+
+def settle_shares(shares, at=None):
+    """
+    Settle the open shares among ``shares`` in a single UPDATE.
+
+    The shares are locked and read first so their settlement can be
+    recorded in the balance ledger; call it inside a transaction on the
+    shard of the shares. Returns the ledger rows of the settled shares.
+    """
+    at = at or timezone.now()
+    rows = list(ledger.share_rows(shares.filter(is_settled=False).select_for_update()))
+    if not rows:
+        return rows
+    ExpenseShare.objects.using(shares.db).filter(id__in=[row['id'] for row in rows]).update(
+        is_settled=True, settled_at=at
+    )
+    ledger.record(rows, LedgerEntry.SETTLEMENT, sign=-1, at=at)
+    for group_id in {row['group_id'] for row in rows}:
+        counters.activity(group_id)
+    return rows
+
+
+def resplit_evenly(expenses):
+    """
+    Split every expense in ``expenses`` evenly between its current shares again.
+
+    Expenses with a settled share are left alone, since part of them has
+    already been paid back. The changed amounts are written with one
+    ``bulk_update`` and recorded in the balance ledger; call it inside a
+    transaction on the shard of the expenses. Returns the number of
+    changed shares.
+    """
+    settled = ExpenseShare.objects.filter(expense=OuterRef('pk'), is_settled=True)
+    shares = ExpenseShare.objects.using(expenses.db).filter(
+        expense__in=expenses.exclude(Exists(settled)).values('pk')
+    ).select_for_update().order_by('expense_id', 'pk')
+
+    old_rows, new_rows = [], []
+    for _, rows in groupby(ledger.share_rows(shares, 'expense__amount'), key=lambda row: row['expense_id']):
+        rows = list(rows)
+        amounts = split_evenly(rows[0]['expense__amount'], range(len(rows)))
+        for row, (_, amount) in zip(rows, amounts):
+            if row['amount'] != amount:
+                old_rows.append(row)
+                new_rows.append({**row, 'amount': amount})
+    if not new_rows:
+        return 0
+
+    ExpenseShare.objects.using(expenses.db).bulk_update(
+        [ExpenseShare(id=row['id'], amount=row['amount']) for row in new_rows], ['amount'], batch_size=1000
+    )
+    now = timezone.now()
+    ledger.record(old_rows, LedgerEntry.EDIT, sign=-1, at=now)
+    ledger.record(new_rows, LedgerEntry.EDIT, at=now)
+    for group_id in {row['group_id'] for row in new_rows}:
+        counters.activity(group_id)
+    return len(new_rows)
+
+
+def user_totals(user_id, currency=None):
+    """
+    Return dashboard totals for a user across all of their groups.
+
+    ``paid`` is everything the user has paid, archived expenses included;
+    ``owed_to_user`` and ``owed_by_user`` are outstanding shares in either
+    direction. All totals are reported in ``currency`` (the base currency
+    by default). Every shard is queried, in parallel.
+    """
+    totals = defaultdict(Decimal)
+    for shard_totals in sharding.fan_out(lambda alias: _user_totals(user_id, currency), sharding.all_shards()):
+        for key, value in shard_totals.items():
+            totals[key] += value
+    return {
+        key: totals[key].quantize(CENT)
+        for key in ('paid', 'owed_to_user', 'owed_by_user')
+    }
+
+
+def _user_totals(user_id, currency):
+    shares = ExpenseShare.objects.filter(is_settled=False).exclude(user=F('expense__paid_by'))
+    total = Sum(converted_amount('expense__', currency))
+    paid = Sum(converted_amount('', currency))
+    totals = {
+        'paid': sum(
+            (model.objects.filter(paid_by_id=user_id).aggregate(total=paid)['total'] or Decimal(0)
+             for model in (Expense, ArchivedExpense)),
+            Decimal(0)
+        ),
+        'owed_to_user': shares.filter(expense__paid_by_id=user_id).aggregate(total=total)['total'],
+        'owed_by_user': shares.filter(user_id=user_id).aggregate(total=total)['total'],
+    }
+    return {key: value or Decimal(0) for key, value in totals.items()}
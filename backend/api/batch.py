@@ -0,0 +1,233 @@
+"""
+Batch requests for the TrackEase API application.
+
+``POST /api/batch/`` runs several API requests in one round trip, e.g. the
+calls a page makes when it loads::
+
+    {
+        "requests": [
+            {"method": "GET", "path": "/api/profile/"},
+            {"method": "GET", "path": "/api/groups/?fields=id,name"},
+            {"method": "POST", "path": "/api/expenses/", "body": {...},
+             "headers": {"Idempotency-Key": "..."}}
+        ],
+        "parallel": true
+    }
+
+The answer holds one ``{"status", "headers", "body"}`` object per
+sub-request, in the same order: ``{"responses": [...]}``. A failing
+sub-request does not stop the others.
+
+Sub-requests are dispatched in-process to the views of ``api/urls.py``. The
+batch is authenticated once and the sub-requests skip the middleware and
+token authentication; each still checks its own permissions and throttles,
+so a batch of ten requests costs ten requests of throttle budget, and
+takes its own slot of the concurrency limit (``api.concurrency``). Bodies are
+JSON and responses are always JSON: sub-requests are sent with ``Accept:
+application/json`` whatever headers they give, so one that asks for another
+format with ``?format=`` gets a 406 entry.
+
+Sub-requests run in order. With ``parallel``, every run of consecutive
+read-only (GET and HEAD) sub-requests is spread over up to
+``BATCH_MAX_WORKERS`` threads with their own database connections; writes
+are never reordered around reads. A batch holds at most
+``BATCH_MAX_REQUESTS`` sub-requests.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from . import concurrency
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+READ_METHODS = ('GET', 'HEAD')
+# Headers of the batch request that describe the client rather than the
+# batch itself, and are passed on to every sub-request.
+INHERITED_HEADERS = ('HTTP_HOST', 'HTTP_USER_AGENT', 'HTTP_X_FORWARDED_FOR', 'HTTP_X_FORWARDED_PROTO')
+
+
+def _invalid(index, message):
+    return serializers.ValidationError({'error': f'requests[{index}]: {message}'})
+
+
+def parse(data):
+    """
+    Return the sub-requests of a batch body as ``{method, path, body, headers}`` dicts.
+
+    Raises ValidationError for a malformed batch.
+    """
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise serializers.ValidationError({'error': 'requests must be a non-empty list'})
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise serializers.ValidationError(
+            {'error': f'A batch holds at most {settings.BATCH_MAX_REQUESTS} requests'}
+        )
+
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise _invalid(index, 'path is required')
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise _invalid(index, f'unsupported method {method}')
+        url = urlsplit(item['path'])
+        if url.scheme or url.netloc or not url.path.startswith('/api/'):
+            raise _invalid(index, 'path must be an API path starting with /api/')
+        headers = item.get('headers', {})
+        if not isinstance(headers, dict) or not all(
+            isinstance(name, str) and isinstance(value, str) for name, value in headers.items()
+        ):
+            raise _invalid(index, 'headers must map names to strings')
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            match = None
+        if match is not None and match.url_name == 'batch':
+            raise _invalid(index, 'batches cannot be nested')
+        parsed.append({
+            'method': method,
+            'path': url.path,
+            'query': url.query,
+            'body': item.get('body'),
+            'headers': headers,
+            'match': match,
+        })
+    return parsed
+
+
+def build_request(request, item):
+    """Return the WSGIRequest of sub-request ``item``, authenticated as ``request``."""
+    body = b'' if item['body'] is None else json.dumps(item['body']).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if not key.startswith(('HTTP_', 'CONTENT_')) or key in INHERITED_HEADERS
+    }
+    environ.update({
+        'REQUEST_METHOD': item['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': item['path'],
+        'QUERY_STRING': item['query'],
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    })
+    for name, value in item['headers'].items():
+        key = name.upper().replace('-', '_')
+        environ[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{key}'] = value
+    # Sub-responses are embedded in the JSON batch response.
+    environ['HTTP_ACCEPT'] = 'application/json'
+
+    sub_request = WSGIRequest(environ)
+    sub_request.resolver_match = item['match']
+    # DRF authenticates requests carrying these with the given user and
+    # token instead of running the authentication classes again.
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    sub_request.user = request.user
+    if hasattr(request._request, 'session'):
+        sub_request.session = request._request.session
+    return sub_request
+
+
+def encode(response, method):
+    """Return the ``{status, headers, body}`` of a sub-request's response."""
+    headers = dict(response.items())
+    if isinstance(response, Response):
+        # Unrendered, so its Content-Type header is still Django's default.
+        headers['Content-Type'] = 'application/json'
+    if method == 'HEAD':
+        body = None
+    elif isinstance(response, Response):
+        body = response.data
+    else:
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        if not content:
+            body = None
+        elif headers.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(content)
+        else:
+            body = content.decode(response.charset, 'replace')
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def dispatch(request, item):
+    """
+    Run sub-request ``item`` and return its encoded response.
+
+    Like a request of its own, the sub-request takes a slot of the
+    concurrency limit (see ``api.concurrency``) and is shed with a 503
+    entry when there is none.
+    """
+    sub_request = build_request(request, item)
+    match = item['match']
+    if match is None:
+        return {'status': 404, 'headers': {}, 'body': {'error': 'Not found'}}
+    limiter = concurrency.limiter()
+    name = concurrency.classify(match.func, sub_request) if limiter else None
+    if name is not None and not limiter.acquire(name):
+        headers = {'Retry-After': str(settings.CONCURRENCY_RETRY_AFTER)}
+        return {'status': 503, 'headers': headers, 'body': concurrency.OVERLOADED}
+    start = time.monotonic()
+    result = None
+    try:
+        try:
+            response = match.func(sub_request, *match.args, **match.kwargs)
+        except Exception as exc:
+            # The same 404, 403 or logged 500 response the handler would send.
+            response = response_for_exception(sub_request, exc)
+        # Streamed bodies are produced here, so they count towards the slot.
+        result = encode(response, item['method'])
+        return result
+    finally:
+        if name is not None:
+            failed = result is None or result['status'] >= 500
+            limiter.release(name, time.monotonic() - start, failed)
+
+
+def _dispatch_concurrently(request, items, indexes, results):
+    workers = min(settings.BATCH_MAX_WORKERS, len(indexes))
+
+    def work(share):
+        try:
+            for index in share:
+                results[index] = dispatch(request, items[index])
+        finally:
+            # Each thread opened its own connections.
+            connections.close_all()
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(work, [indexes[offset::workers] for offset in range(workers)]))
+
+
+def run(request, items, parallel=False):
+    """Run the sub-requests ``items`` (see ``parse``) and return their responses in order."""
+    results = [None] * len(items)
+    index = 0
+    while index < len(items):
+        end = index + 1
+        if parallel and settings.BATCH_MAX_WORKERS > 1:
+            while end < len(items) and items[index]['method'] in READ_METHODS \
+                    and items[end]['method'] in READ_METHODS:
+                end += 1
+        if end - index > 1:
+            _dispatch_concurrently(request, items, list(range(index, end)), results)
+        else:
+            results[index] = dispatch(request, items[index])
+        index = end
+    return results
@@ -0,0 +1,67 @@
+"""
+Expense breakdowns for the TrackEase API application.
+
+A breakdown totals the expenses of a group by category, by month of their
+date or by the member who paid them. Each is one ``GROUP BY`` query per
+expense table (current and archived), served by the ``(group, category)``
+and ``(group, date)`` indexes, so the response has one row per category,
+month or member however many expenses the group has. Amounts are converted
+to the requested currency inside the aggregate (see ``api.fx``).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .fx import converted_amount
+from .models import ArchivedExpense, Expense
+from .splits import CENT
+
+# Breakdown name -> expression of the value expenses are grouped by.
+DIMENSIONS = {
+    'category': F('category'),
+    'month': TruncMonth('date'),
+    'member': F('paid_by'),
+}
+
+
+def breakdown(group_id, by, currency=None, start=None, end=None):
+    """
+    Return the expenses of a group totalled ``by`` category, month or member.
+
+    ``start`` and ``end`` limit the expenses to those dated within them,
+    both inclusive. Returns a list of ``{by: <value>, 'count': <int>,
+    'total': <Decimal>}`` dicts ordered by value; months are ``YYYY-MM``
+    strings and members user IDs.
+    """
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for model in (Expense, ArchivedExpense):
+        expenses = model.objects.filter(group_id=group_id)
+        if start is not None:
+            expenses = expenses.filter(date__gte=start)
+        if end is not None:
+            expenses = expenses.filter(date__lte=end)
+        rows = (
+            expenses.annotate(key=DIMENSIONS[by]).values('key')
+            .annotate(count=Count('pk'), total=Sum(converted_amount('', currency)))
+            .order_by()
+        )
+        for row in rows:
+            entry = totals[row['key']]
+            entry[0] += row['count']
+            entry[1] += row['total']
+
+    return [
+        {
+            by: key.strftime('%Y-%m') if by == 'month' else key,
+            'count': count,
+            'total': total.quantize(CENT),
+        }
+        for key, (count, total) in sorted(totals.items())
+    ]
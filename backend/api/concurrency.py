@@ -0,0 +1,160 @@
+"""
+Adaptive concurrency limiting for the TrackEase API application.
+
+A worker that takes on more requests than the database and the CPU can
+serve only makes every request slower, until clients time out and the work
+done for them is wasted. ``api.middleware.ConcurrencyLimitMiddleware``
+bounds the requests a worker process serves at once and answers the excess
+with ``503 Service Unavailable`` and ``Retry-After`` before any view code
+runs.
+
+The limit adapts with AIMD (additive increase, multiplicative decrease):
+
+- Latency is measured per route class, because a password hash and a
+  profile read have nothing in common. Each class keeps a smoothed latency
+  and, as its no-load baseline, the lowest smoothed latency seen in the
+  current or previous window of ``CONCURRENCY_WINDOW`` requests.
+- When a class runs slower than ``CONCURRENCY_LATENCY_TOLERANCE`` times its
+  baseline, or a request fails with a 5xx, the limit is multiplied by
+  ``CONCURRENCY_BACKOFF``, at most once per observed latency.
+- Otherwise, while the worker is at least half busy, the limit grows by
+  about one request per limit's worth of completed requests.
+
+Route classes are admitted by priority: a request is served while the
+requests in flight are below the limit times the share of its class
+(``CONCURRENCY_SHARES``). Under overload expensive requests (password
+hashing, exports, bulk writes) are shed first and cheap reads last.
+
+The limit is per process and counts threads, so it matters for threaded
+workers (``gunicorn --threads``, ``runserver``); a single-threaded worker
+never has more than one request in flight. A streamed response holds its
+slot until its body is sent, and every sub-request of ``/api/batch/``
+takes a slot of its own (the batch itself takes none).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+
+READ = 'read'
+WRITE = 'write'
+EXPENSIVE = 'expensive'
+# Throttle cost (see api.throttling) from which an endpoint counts as expensive.
+EXPENSIVE_COST = 5
+OVERLOADED = {'error': 'The server is overloaded, please retry later'}
+
+
+def route_class(name):
+    """
+    Set the route class of a function-based view; None exempts it from the limit.
+
+    Apply it above ``@api_view`` like ``api.throttling.throttle``.
+    """
+    def decorator(view):
+        view.cls.concurrency_class = name
+        return view
+    return decorator
+
+
+def classify(view_func, request):
+    """
+    Return the route class of a request to ``view_func``, or None if it is exempt.
+
+    Views may set ``concurrency_class``; otherwise endpoints with a throttle
+    cost of ``EXPENSIVE_COST`` or more are ``expensive``, other reads
+    ``read`` and other writes ``write``.
+    """
+    cls = getattr(view_func, 'cls', None)
+    initkwargs = getattr(view_func, 'initkwargs', None) or {}
+    if 'concurrency_class' in initkwargs:
+        return initkwargs['concurrency_class']
+    if cls is not None and hasattr(cls, 'concurrency_class'):
+        return cls.concurrency_class
+    cost = initkwargs.get('throttle_cost', getattr(cls, 'throttle_cost', 1))
+    if cost >= EXPENSIVE_COST:
+        return EXPENSIVE
+    return READ if request.method in ('GET', 'HEAD', 'OPTIONS') else WRITE
+
+
+class LatencyStats:
+    """Smoothed latency of a route class and its windowed no-load baseline."""
+
+    __slots__ = ('smoothed', 'baseline', 'window_min', 'samples')
+
+    def __init__(self):
+        self.smoothed = None
+        self.baseline = math.inf
+        self.window_min = math.inf
+        self.samples = 0
+
+    def add(self, latency, window):
+        self.smoothed = latency if self.smoothed is None else self.smoothed * 0.8 + latency * 0.2
+        self.window_min = min(self.window_min, self.smoothed)
+        self.samples += 1
+        if self.samples >= window:
+            # The previous window's minimum, so the baseline follows
+            # lasting changes such as a bigger database.
+            self.baseline, self.window_min, self.samples = self.window_min, math.inf, 0
+        return min(self.baseline, self.window_min)
+
+
+class AdaptiveLimiter:
+    """The AIMD concurrency limit of a process, see the module docstring."""
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, initial=None, minimum=None, maximum=None, tolerance=None,
+                 backoff=None, shares=None, window=None):
+        self.minimum = minimum or settings.CONCURRENCY_MIN_LIMIT
+        self.maximum = maximum or settings.CONCURRENCY_MAX_LIMIT
+        self.limit = float(initial or settings.CONCURRENCY_INITIAL_LIMIT)
+        self.tolerance = tolerance or settings.CONCURRENCY_LATENCY_TOLERANCE
+        self.backoff = backoff or settings.CONCURRENCY_BACKOFF
+        self.shares = shares or settings.CONCURRENCY_SHARES
+        self.window = window or settings.CONCURRENCY_WINDOW
+        self.inflight = 0
+        self.stats = {name: LatencyStats() for name in self.shares}
+        self._last_decrease = -math.inf
+        self._lock = threading.Lock()
+
+    def acquire(self, name):
+        """Take a slot for a request of route class ``name``; False if it must be shed."""
+        with self._lock:
+            if self.inflight >= max(self.limit * self.shares[name], 1):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, name, latency, failed=False):
+        """Return the slot of a request that took ``latency`` seconds and adjust the limit."""
+        with self._lock:
+            busy = self.inflight
+            self.inflight -= 1
+            baseline = self.stats[name].add(latency, self.window)
+            if failed or self.stats[name].smoothed > baseline * self.tolerance:
+                now = self.clock()
+                if now - self._last_decrease >= latency:
+                    self._last_decrease = now
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+            elif busy * 2 >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+_process_limiter = {'limiter': None}
+_process_lock = threading.Lock()
+
+
+def limiter():
+    """Return the limiter of this process, or None when ``CONCURRENCY_LIMIT_ENABLED`` is off."""
+    if not settings.CONCURRENCY_LIMIT_ENABLED:
+        return None
+    with _process_lock:
+        if _process_limiter['limiter'] is None:
+            _process_limiter['limiter'] = AdaptiveLimiter()
+        return _process_limiter['limiter']
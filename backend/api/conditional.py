@@ -0,0 +1,182 @@
+"""
+Conditional GET support for the TrackEase API application.
+
+Collection ETags are derived from one aggregate query, ``COUNT(*)`` and
+``MAX(updated_at)`` over the collection, instead of hashing the rendered
+response. An unchanged collection can therefore be answered with
+``304 Not Modified`` before anything is serialized. Lists that expand
+relations (``?expand=``, or nested ``?fields=``) carry no ETag: their rows
+come from other tables, whose changes (a settled share, a renamed payer)
+leave the collection's count and latest update alone.
+
+Single objects that extend ``VersionedModel`` get an ETag that starts with
+their version and hashes everything else the representation depends on
+(see ``detail_etag``); updates honour ``If-Match``, which compares only the
+version (see ``VersionedUpdateMixin``).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import hashlib
+import re
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .fieldsets import requested
+from .middleware import COMPRESSORS
+from .models import VersionConflict
+
+
+def collection_etag(request, *querysets):
+    """
+    Return a strong ETag for ``querysets`` as rendered for ``request``, or None.
+
+    The tag covers the user, the negotiated media type and the query string,
+    so every representation of the collection gets its own tag. A collection
+    served from several tables (e.g. current and archived expenses) passes
+    one queryset per table. Requests that expand relations get None.
+    """
+    if requested(request)[1]:
+        return None
+    parts = [request.user.pk, request.accepted_media_type, request.META.get('QUERY_STRING', '')]
+    for queryset in querysets:
+        state = queryset.order_by().aggregate(count=Count('pk'), latest=Max('updated_at'))
+        parts += [state['count'], state['latest'].isoformat() if state['latest'] else '']
+    key = '|'.join(str(part) for part in parts)
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def header_matches(header, etag):
+    """Return whether an If-Match or If-None-Match header value matches ``etag``."""
+    if header.strip() == '*':
+        return True
+    # Compressed responses carry the encoding in the tag, see CompressionMiddleware.
+    variants = {etag} | {f'{etag[:-1]}-{compressor.encoding}"' for compressor in COMPRESSORS}
+    return any(tag.strip() in variants for tag in header.split(','))
+
+
+def etag_matches(request, etag):
+    """Return whether the request's If-None-Match header matches ``etag``, if any."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    return bool(header) and etag is not None and header_matches(header, etag)
+
+
+# A detail ETag, optionally suffixed with a content encoding by CompressionMiddleware.
+VERSION_TAG = re.compile(r'^"v(\d+)(?:-[^"]*)?"$')
+
+
+def relation_state(instance, name):
+    """Return the state of the related rows ``name`` of ``instance`` expands to."""
+    field = instance._meta.get_field(name)
+    if field.many_to_one or field.one_to_one:
+        # Fetched through the descriptor, so the serializer reuses the object.
+        related = getattr(instance, name)
+        if related is None:
+            return None
+        return [getattr(related, column.attname) for column in related._meta.concrete_fields]
+    columns = [column.attname for column in field.related_model._meta.concrete_fields]
+    return list(getattr(instance, name).order_by('pk').values_list(*columns))
+
+
+def detail_etag(request, instance, expandable=()):
+    """
+    Return a strong ETag for ``instance`` as rendered for ``request``.
+
+    The tag is ``"v<version>-<hash>"``. The hash covers the user, the
+    negotiated media type, ``updated_at`` (which ``api.counters`` bumps
+    without a new version), the normalized ``fields`` and ``expand``
+    parameters, the other query parameters, and the rows of the relations
+    in ``expandable`` that the request expands.
+    """
+    fields, expand = requested(request)
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists()
+        if key not in ('fields', 'expand') for value in values
+    )
+    parts = [
+        request.user.pk, request.accepted_media_type, instance.updated_at.isoformat(),
+        sorted(fields) if fields is not None else None, sorted(expand), params,
+    ]
+    parts += [relation_state(instance, name) for name in sorted(set(expand) & set(expandable))]
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return f'"v{instance.version}-{digest}"'
+
+
+def version_matches(header, version):
+    """Return whether an If-Match header value names a tag of ``version`` (see ``detail_etag``)."""
+    if header.strip() == '*':
+        return True
+    for tag in header.split(','):
+        match = VERSION_TAG.match(tag.strip())
+        if match and int(match.group(1)) == version:
+            return True
+    return False
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = {'error': 'The object was modified since it was read'}
+    default_code = 'precondition_failed'
+
+
+class VersionedUpdateMixin:
+    """
+    ViewSet mixin for optimistic concurrency on ``VersionedModel`` objects.
+
+    Detail responses carry a strong ETag (see ``detail_etag``). Updates and
+    deletes may send any tag of the object back in ``If-Match``; if the
+    object's version has changed since, they fail with 412 Precondition
+    Failed. Updates without the header are still written conditionally on
+    the version the request read, so a concurrent edit is never silently
+    overwritten.
+    """
+
+    def check_if_match(self, instance):
+        header = self.request.META.get('HTTP_IF_MATCH')
+        if header and not version_matches(header, instance.version):
+            raise PreconditionFailed()
+
+    def detail_etag(self, instance):
+        expandable = getattr(self.get_serializer_class().Meta, 'expandable_fields', {})
+        return detail_etag(self.request, instance, expandable)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.detail_etag(instance)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = self.detail_etag(self.updated_instance)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def perform_update(self, serializer):
+        self.check_if_match(serializer.instance)
+        try:
+            serializer.save()
+        except VersionConflict:
+            raise PreconditionFailed()
+        self.updated_instance = serializer.instance
+
+    def perform_destroy(self, instance):
+        self.check_if_match(instance)
+        deleted, _ = type(instance).objects.using(instance._state.db).filter(pk=instance.pk, version=instance.version).delete()
+        if not deleted:
+            raise PreconditionFailed()
+
+
+def not_modified(etag):
+    """Return an empty 304 response carrying ``etag``."""
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Vary': 'Accept'})
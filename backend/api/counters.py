@@ -0,0 +1,280 @@
+"""
+Denormalized group counters for the TrackEase API application.
+
+Group rows carry ``member_count``, ``expense_count``, ``total_amount`` (in
+the base currency, archived expenses included) and ``last_activity_at`` (the
+latest expense write or settlement), so the group list needs no per-group
+aggregates. Every change is applied with a single UPDATE using ``F()``
+expressions, which keeps concurrent writers from overwriting each other.
+
+Model writes are tracked by the signal receivers below. Writes that bypass
+signals (``bulk_create``, ``QuerySet.update``) call the helpers directly.
+``check`` and ``repair`` recompute the counters from the source tables, see
+the ``check_group_counters`` management command.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import contextvars
+import itertools
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Round
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fx, sharding
+from .models import ArchivedExpense, ArchivedExpenseShare, Expense, ExpenseShare, Group, User
+from .splits import CENT
+
+_paused = contextvars.ContextVar('counters_paused', default=False)
+
+
+@contextmanager
+def paused():
+    """Ignore expense signals inside the block, e.g. while expenses are archived."""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def base_amount(amount, currency, day):
+    """
+    Return an expense amount in the base currency at the rate of ``day``, rounded to cents.
+
+    Amounts in a currency without rates count as 0, like in ``expected``.
+    """
+    converted = fx.to_base(amount, currency, day)
+    if converted is None:
+        return Decimal(0)
+    return Decimal(converted).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _update(group_id, **changes):
+    now = timezone.now()
+    Group.objects.using(sharding.shard_for_group(group_id)).filter(pk=group_id).update(updated_at=now, **changes)
+
+
+def expenses_added(expenses):
+    """Count new expenses, e.g. after ``bulk_create``."""
+    by_group = defaultdict(lambda: [0, Decimal(0)])
+    for expense in expenses:
+        totals = by_group[expense.group_id]
+        totals[0] += 1
+        totals[1] += base_amount(expense.amount, expense.currency, expense.date)
+    now = timezone.now()
+    for group_id, (count, total) in by_group.items():
+        _update(
+            group_id,
+            expense_count=F('expense_count') + count,
+            total_amount=F('total_amount') + total,
+            last_activity_at=now,
+        )
+
+
+def activity(group_id):
+    """Record activity that changes no counter, e.g. a settlement."""
+    _update(group_id, last_activity_at=timezone.now())
+
+
+def _member_group_ids(user):
+    return list(Group.members.through.objects.filter(user=user).values_list('group_id', flat=True))
+
+
+def recount_members(group_ids):
+    """
+    Recount the members of ``group_ids``.
+
+    The memberships are counted with one grouped query; every group is
+    then updated in the database holding it.
+    """
+    counts = dict(
+        Group.members.through.objects.filter(group_id__in=group_ids).order_by()
+        .values('group_id').annotate(count=Count('pk')).values_list('group_id', 'count')
+    )
+    for group_id in group_ids:
+        _update(group_id, member_count=counts.get(group_id, 0))
+
+
+@receiver(pre_save, sender=Expense)
+def remember_expense(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or _paused.get():
+        return
+    instance._counted = Expense.objects.using(instance._state.db).filter(pk=instance.pk).values(
+        'group_id', 'amount', 'currency', 'date'
+    ).first()
+
+
+@receiver(post_save, sender=Expense)
+def count_saved_expense(sender, instance, created, raw=False, **kwargs):
+    if raw or _paused.get():
+        return
+    if created:
+        expenses_added([instance])
+        return
+
+    old = getattr(instance, '_counted', None)
+    new = base_amount(instance.amount, instance.currency, instance.date)
+    now = timezone.now()
+    if old is None:
+        _update(instance.group_id, last_activity_at=now)
+        return
+    old_amount = base_amount(old['amount'], old['currency'], old['date'])
+    if old['group_id'] == instance.group_id:
+        _update(instance.group_id, total_amount=F('total_amount') + (new - old_amount), last_activity_at=now)
+    else:
+        _update(
+            old['group_id'],
+            expense_count=F('expense_count') - 1,
+            total_amount=F('total_amount') - old_amount,
+            last_activity_at=now,
+        )
+        _update(
+            instance.group_id,
+            expense_count=F('expense_count') + 1,
+            total_amount=F('total_amount') + new,
+            last_activity_at=now,
+        )
+
+
+@receiver(post_delete, sender=Expense)
+def count_deleted_expense(sender, instance, **kwargs):
+    if _paused.get():
+        return
+    _update(
+        instance.group_id,
+        expense_count=F('expense_count') - 1,
+        total_amount=F('total_amount') - base_amount(instance.amount, instance.currency, instance.date),
+        last_activity_at=timezone.now(),
+    )
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def count_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._counted_groups = _member_group_ids(instance)
+    elif action == 'post_add' and pk_set:
+        # pk_set only holds the rows that were actually inserted.
+        if reverse:
+            for group_id in pk_set:
+                _update(group_id, member_count=F('member_count') + 1)
+        else:
+            _update(instance.pk, member_count=F('member_count') + len(pk_set))
+    elif action == 'post_remove' and pk_set:
+        # pk_set holds the requested rows, not only the deleted ones.
+        recount_members(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        if reverse:
+            recount_members(getattr(instance, '_counted_groups', []))
+        else:
+            _update(instance.pk, member_count=0)
+
+
+@receiver(pre_delete, sender=User)
+def remember_memberships(sender, instance, **kwargs):
+    # Deleting a user removes its memberships without m2m_changed signals.
+    instance._counted_groups = _member_group_ids(instance)
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_memberships(sender, instance, **kwargs):
+    recount_members(getattr(instance, '_counted_groups', []))
+
+
+def expected(group_ids=None):
+    """
+    Return ``{group_id: counters}`` computed from the source tables.
+
+    Uses one grouped aggregate per table and shard, whatever the number of
+    groups.
+    """
+    def grouped(queryset, key='group_id'):
+        if group_ids is not None:
+            queryset = queryset.filter(**{f'{key}__in': group_ids})
+        return queryset.order_by().values(key)
+
+    counters = defaultdict(lambda: {
+        'member_count': 0, 'expense_count': 0, 'total_amount': Decimal(0), 'last_activity_at': None,
+    })
+
+    def latest(group_id, moment):
+        current = counters[group_id]['last_activity_at']
+        if moment and (current is None or moment > current):
+            counters[group_id]['last_activity_at'] = moment
+
+    for row in grouped(Group.members.through.objects.all()).annotate(count=Count('pk')):
+        counters[row['group_id']]['member_count'] = row['count']
+    for alias in sharding.all_shards():
+        for model in (Expense, ArchivedExpense):
+            for row in grouped(model.objects.using(alias)).annotate(
+                count=Count('pk'),
+                total=Sum(Round(fx.converted_amount(), 2)),
+                latest=Max('updated_at'),
+            ):
+                counters[row['group_id']]['expense_count'] += row['count']
+                counters[row['group_id']]['total_amount'] += Decimal(row['total'] or 0)
+                latest(row['group_id'], row['latest'])
+        for model in (ExpenseShare, ArchivedExpenseShare):
+            for row in grouped(model.objects.using(alias), 'expense__group_id').annotate(
+                latest=Max('settled_at')
+            ):
+                latest(row['expense__group_id'], row['latest'])
+
+    for values in counters.values():
+        values['total_amount'] = values['total_amount'].quantize(CENT, rounding=ROUND_HALF_UP)
+    return counters
+
+
+def check(group_ids=None):
+    """
+    Return the groups whose counters differ from the source tables.
+
+    Returns a list of ``(group, {field: (stored, expected)})`` tuples. The
+    stored last activity may be later than the source tables show, since
+    deleted expenses leave no trace.
+    """
+    counters = expected(group_ids)
+    groups = Group.objects.only('member_count', 'expense_count', 'total_amount', 'last_activity_at')
+    if group_ids is not None:
+        groups = groups.filter(pk__in=group_ids)
+
+    drift = []
+    for group in itertools.chain.from_iterable(
+        groups.using(alias).order_by('pk').iterator() for alias in sharding.all_shards()
+    ):
+        values = counters[group.pk]
+        differences = {
+            field: (getattr(group, field), values[field])
+            for field in ('member_count', 'expense_count', 'total_amount')
+            if getattr(group, field) != values[field]
+        }
+        activity_at = values['last_activity_at']
+        if activity_at and (group.last_activity_at is None or group.last_activity_at < activity_at):
+            differences['last_activity_at'] = (group.last_activity_at, activity_at)
+        if differences:
+            drift.append((group, differences))
+    return drift
+
+
+def repair(group_ids=None):
+    """Rewrite drifted counters from the source tables; return the repaired groups."""
+    drift = check(group_ids)
+    for group, differences in drift:
+        for field, (stored, value) in differences.items():
+            setattr(group, field, value)
+        group.updated_at = timezone.now()
+    for alias in sharding.all_shards():
+        Group.objects.using(alias).bulk_update(
+            [group for group, differences in drift if group._state.db == alias],
+            ['member_count', 'expense_count', 'total_amount', 'last_activity_at', 'updated_at'],
+            batch_size=500,
+        )
+    return drift
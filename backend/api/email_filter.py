@@ -0,0 +1,231 @@
+"""
+Email-existence filter for the TrackEase API application.
+
+Signup forms check whether an email is taken on (debounced) keystrokes, and
+almost every check is for an address that does not exist. A Bloom filter of
+the normalized (stripped, lower-case) emails of all users answers those in
+memory: the database is only queried when the filter says "maybe present".
+A Bloom filter has no false negatives for the emails it was given.
+
+The filter is built from a streamed ``values_list`` on first use, updated
+when users of this process are created, and rebuilt every
+``EMAIL_FILTER_REBUILD_SECONDS`` so deleted users and changed emails drop
+out. Users created by other worker processes are not in it until then:
+
+- with a cache shared by the workers (Redis, Memcached, the database or
+  files), new users are marked in the cache for one rebuild period;
+- with a per-process cache (the default ``LocMemCache``), lookups add the
+  emails of users created since the filter was built or last polled, at
+  most every ``EMAIL_FILTER_POLL_SECONDS``; a primary key range query over
+  the few newest rows.
+
+So without a shared cache, a user created by another worker may be
+reported absent for up to ``EMAIL_FILTER_POLL_SECONDS``, and an email
+changed in another process (only the admin changes them) until the next
+rebuild; ``manage.py check --deploy`` warns about per-process caches.
+Registration does not depend on the filter: the unique constraint on the
+email decides.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches, DEFAULT_CACHE_ALIAS
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User
+
+MIN_CAPACITY = 10000
+
+
+def normalize(email):
+    return email.strip().lower()
+
+
+class BloomFilter:
+    """
+    A Bloom filter of strings sized for ``capacity`` items at ``error_rate``.
+
+    Bit positions come from double hashing of one 128-bit BLAKE2b digest.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        array = self.array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+    def expected_error_rate(self):
+        """Return the false positive rate expected for the items added so far."""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+_lock = threading.Lock()
+_state = {'filter': None, 'built_at': 0.0, 'last_pk': 0, 'next_poll': 0.0}
+_stats = {'lookups': 0, 'filtered': 0, 'maybe': 0, 'false_positives': 0, 'polls': 0}
+
+
+def shared_cache():
+    """Return whether the default cache is shared between worker processes."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if shared_cache():
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process.',
+        hint='Email checks see users created by other workers only after EMAIL_FILTER_POLL_SECONDS '
+             'and emails changed by them after EMAIL_FILTER_REBUILD_SECONDS; configure a shared '
+             'cache backend in CACHES.',
+        id='api.W001',
+    )]
+
+
+def build():
+    """Build a new filter from all user emails and install it."""
+    # Read first, so users created during the build are polled again.
+    last_pk = User.objects.aggregate(last=Max('pk'))['last'] or 0
+    count = User.objects.count()
+    bloom = BloomFilter(max(MIN_CAPACITY, 2 * count), settings.EMAIL_FILTER_ERROR_RATE)
+    for email in User.objects.values_list('email', flat=True).iterator(chunk_size=5000):
+        if email:
+            bloom.add(normalize(email))
+    with _lock:
+        _state.update(filter=bloom, built_at=time.monotonic(), last_pk=last_pk)
+    return bloom
+
+
+def get_filter():
+    """Return the current filter, building or rebuilding it when it is due."""
+    bloom = _state['filter']
+    age = time.monotonic() - _state['built_at']
+    if bloom is None or age > settings.EMAIL_FILTER_REBUILD_SECONDS or bloom.count > bloom.capacity:
+        with _lock:
+            # Another thread may have rebuilt it while we waited.
+            if _state['filter'] is bloom:
+                _state['built_at'] = time.monotonic()
+                bloom = None
+        if bloom is None:
+            bloom = build()
+        else:
+            bloom = _state['filter']
+    return bloom
+
+
+def _cache_key(email):
+    return 'email-filter:' + hashlib.blake2b(email.encode(), digest_size=16).hexdigest()
+
+
+def poll_new_users(bloom):
+    """Add the users created since the last build or poll, at most every ``EMAIL_FILTER_POLL_SECONDS``."""
+    now = time.monotonic()
+    with _lock:
+        if now < _state['next_poll']:
+            return
+        _state['next_poll'] = now + settings.EMAIL_FILTER_POLL_SECONDS
+        last_pk = _state['last_pk']
+    _stats['polls'] += 1
+    rows = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'email'))
+    if rows:
+        with _lock:
+            for pk, email in rows:
+                if email:
+                    bloom.add(normalize(email))
+            _state['last_pk'] = max(_state['last_pk'], rows[-1][0])
+
+
+def might_exist(email):
+    """Return False if no user has ``email``; True means the database must be asked."""
+    email = normalize(email)
+    _stats['lookups'] += 1
+    bloom = get_filter()
+    shared = shared_cache()
+    if not shared:
+        poll_new_users(bloom)
+    if email in bloom or (shared and cache.get(_cache_key(email))):
+        _stats['maybe'] += 1
+        return True
+    _stats['filtered'] += 1
+    return False
+
+
+def email_exists(email):
+    """Return whether a user with exactly ``email`` exists, querying only on a filter hit."""
+    if not might_exist(email):
+        return False
+    exists = User.objects.filter(email=email).exists()
+    if not exists:
+        _stats['false_positives'] += 1
+    return exists
+
+
+def stats():
+    """
+    Return lookup counters and false positive rates.
+
+    ``observed_error_rate`` is the share of absent emails the filter passed
+    through to the database; ``expected_error_rate`` is the theoretical rate
+    for the current fill of the filter. ``polls`` counts the queries for
+    new users made without a shared cache.
+    """
+    bloom = _state['filter']
+    negatives = _stats['filtered'] + _stats['false_positives']
+    return {
+        **_stats,
+        'items': bloom.count if bloom else 0,
+        'capacity': bloom.capacity if bloom else 0,
+        'size_bytes': len(bloom.array) if bloom else 0,
+        'expected_error_rate': bloom.expected_error_rate() if bloom else 0.0,
+        'observed_error_rate': _stats['false_positives'] / negatives if negatives else 0.0,
+    }
+
+
+def reset_stats():
+    for key in _stats:
+        _stats[key] = 0
+
+
+@receiver(post_save, sender=User)
+def add_user_email(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.email:
+        return
+    email = normalize(instance.email)
+    bloom = _state['filter']
+    if not created and bloom is not None and email in bloom:
+        # Most saves (logins, profile edits) leave the email unchanged.
+        return
+    if bloom is not None:
+        with _lock:
+            bloom.add(email)
+    if shared_cache():
+        cache.set(_cache_key(email), True, 2 * settings.EMAIL_FILTER_REBUILD_SECONDS)
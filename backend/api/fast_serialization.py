@@ -0,0 +1,352 @@
+"""
+Read-only fast path for serializing list responses.
+
+``ModelSerializer(many=True)`` builds a model instance per row and walks
+every field of every instance through ``to_representation``. For list
+endpoints that only expose plain model columns this module instead:
+1. Compiles a serializer class once into a list of (key, column, encoder)
+   triples, reusing the serializer's own field objects as encoders, with
+   specialized encoders for datetimes and decimals
+2. Fetches just those columns with ``QuerySet.values()``
+3. Encodes each row with the precompiled encoders
+
+The encoders are the serializer's field ``to_representation`` methods or
+exact equivalents of them, so the output is identical to the regular
+serializer.
+
+For binary clients ``serialize_columns`` builds a column-oriented result
+from ``values_list()`` with fixed-point amounts and integer timestamps.
+
+A ``?fields=`` fieldset (see ``api.fieldsets``) limits the fetched
+columns; lists with ``?expand=`` go through the regular serializer.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import datetime
+import decimal
+import itertools
+
+from django.http import StreamingHttpResponse
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .conditional import collection_etag, etag_matches, not_modified
+from .fieldsets import requested
+from .renderers import BINARY_RENDERERS, Columns
+
+_compiled = {}
+
+
+def _identity(value):
+    return value
+
+
+def _datetime_encoder(field):
+    """
+    Return an encoder equivalent to ``DateTimeField.to_representation``.
+
+    The timezone is resolved once per response instead of once per value;
+    anything other than aware datetimes in ISO 8601 goes through the field.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def encode(value):
+        if isinstance(value, str) or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return encode
+
+
+def _decimal_encoder(field):
+    """Return an encoder equivalent to ``DecimalField.to_representation``."""
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def encode(value):
+        if not isinstance(value, decimal.Decimal):
+            return field.to_representation(value)
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return encode
+
+
+def compile_serializer(serializer_class):
+    """
+    Return the precompiled ``(key, column, encoder, field)`` entries of a serializer.
+
+    Returns None if the serializer has fields the fast path cannot produce
+    from plain column values (nested serializers, method fields, ...).
+    """
+    if serializer_class not in _compiled:
+        plan = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+                encoder = _identity
+            elif isinstance(field, serializers.DateTimeField):
+                encoder = _datetime_encoder(field)
+            elif isinstance(field, serializers.DecimalField):
+                encoder = _decimal_encoder(field)
+            elif isinstance(field, (serializers.ModelField, serializers.SerializerMethodField,
+                                    serializers.BaseSerializer, serializers.RelatedField,
+                                    serializers.ManyRelatedField, serializers.HiddenField)):
+                plan = None
+                break
+            else:
+                encoder = field.to_representation
+            if '.' in field.source or field.source == '*':
+                plan = None
+                break
+            plan.append((name, field.source, encoder, field))
+        _compiled[serializer_class] = plan
+    return _compiled[serializer_class]
+
+
+def select_fields(plan, fields):
+    """Return the entries of a compiled ``plan`` for the ``fields`` names; all for None."""
+    if fields is None:
+        return plan
+    unknown = sorted(set(fields) - {key for key, column, encoder, field in plan})
+    if unknown:
+        raise serializers.ValidationError({'error': f"Unknown fields {', '.join(unknown)}"})
+    return [entry for entry in plan if entry[0] in fields]
+
+
+def serialize_rows(queryset, serializer_class, fields=None):
+    """
+    Serialize ``queryset`` like ``serializer_class(queryset, many=True).data``.
+
+    Only the ``fields`` names are serialized when given. Returns None if the
+    serializer cannot use the fast path.
+    """
+    plan = compile_serializer(serializer_class)
+    if plan is None:
+        return None
+    plan = select_fields(plan, fields)
+    columns = [column for key, column, encoder, field in plan]
+    return [
+        {
+            key: None if row[column] is None else encoder(row[column])
+            for key, column, encoder, field in plan
+        }
+        for row in queryset.values(*columns)
+    ]
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+EPOCH_DATE = EPOCH.date()
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _column_encoder(field):
+    """Return the ``(type, encoder)`` of a column in columnar output."""
+    if isinstance(field, serializers.DecimalField) and field.decimal_places is not None:
+        scale = field.decimal_places
+        return ('decimal', scale), lambda value: int(value.scaleb(scale))
+    if isinstance(field, serializers.DateTimeField):
+        return 'timestamp', lambda value: (value - EPOCH) // MICROSECOND
+    if isinstance(field, serializers.DateField):
+        return 'date', lambda value: (value - EPOCH_DATE).days
+    if isinstance(field, (serializers.IntegerField, PrimaryKeyRelatedField)):
+        return 'int', _identity
+    if isinstance(field, serializers.BooleanField):
+        return 'bool', _identity
+    return 'string', field.to_representation
+
+
+def serialize_columns(queryset, serializer_class, fields=None):
+    """
+    Serialize ``queryset`` into ``Columns`` straight from ``values_list()``.
+
+    Decimals become fixed-point integers and datetimes int64 microseconds,
+    so no model instances or strings are created for them. Only the
+    ``fields`` names are serialized when given. Returns None if the
+    serializer cannot use the fast path.
+    """
+    plan = compile_serializer(serializer_class)
+    if plan is None:
+        return None
+    plan = select_fields(plan, fields)
+    rows = list(queryset.values_list(*[column for key, column, encoder, field in plan]))
+    names, types, values = [], [], []
+    for index, (key, column, encoder, field) in enumerate(plan):
+        column_type, column_encoder = _column_encoder(field)
+        names.append(key)
+        types.append(column_type)
+        values.append([
+            None if row[index] is None else column_encoder(row[index])
+            for row in rows
+        ])
+    return Columns(names, types, values)
+
+
+def serialized_chunks(queryset, serializer_class, columnar=False, chunk_size=5000, fields=None):
+    """
+    Yield ``queryset`` serialized in primary key order, ``chunk_size`` rows at a time.
+
+    Chunks are fetched by keyset (``pk > last``) so every chunk costs one
+    indexed query. The first chunk is always yielded, even when empty, so
+    renderers can write their headers. The serializer must expose ``id``,
+    which is fetched for the keyset even when ``fields`` leaves it out.
+    """
+    serialize = serialize_columns if columnar else serialize_rows
+    strip_id = fields is not None and 'id' not in fields
+    if strip_id:
+        fields = [*fields, 'id']
+    queryset = queryset.order_by('pk')
+    page = queryset
+    while True:
+        data = serialize(page[:chunk_size], serializer_class, fields)
+        last = None
+        if len(data):
+            last = data.values[data.names.index('id')][-1] if columnar else data[-1]['id']
+        if strip_id:
+            if columnar:
+                index = data.names.index('id')
+                for attribute in (data.names, data.types, data.values):
+                    del attribute[index]
+            else:
+                for row in data:
+                    del row['id']
+        if data or page is queryset:
+            yield data
+        if len(data) < chunk_size:
+            return
+        page = queryset.filter(pk__gt=last)
+
+
+class FastListMixin:
+    """
+    ViewSet mixin that serves unpaginated ``list`` requests from ``serialize_rows``.
+
+    Requests negotiated to a columnar renderer (``columnar = True``) get
+    ``serialize_columns`` instead. Falls back to the regular ``list`` when
+    the serializer or the request cannot use the fast path.
+
+    Lists carry a strong ETag computed from the collection's row count and
+    latest ``updated_at``; a matching ``If-None-Match`` is answered with 304
+    before anything is serialized. Lists that expand relations carry none
+    (see ``api.conditional``).
+
+    A ``?fields=`` fieldset is served from the fast path too; lists with
+    ``?expand=`` use the serializer on the prepared queryset (see
+    ``api.fieldsets``).
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + BINARY_RENDERERS
+
+    def fast_list_response(self, queryset, serializer_class=None):
+        """Return a Response for ``queryset``, or None if the fast path does not apply."""
+        data = self.fast_rows(queryset, serializer_class)
+        return None if data is None else Response(data)
+
+    def fast_rows(self, queryset, serializer_class=None):
+        """Return ``queryset`` serialized on the fast path in the negotiated layout, or None."""
+        serializer_class = serializer_class or self.get_serializer_class()
+        fields, expand = requested(self.request)
+        if expand:
+            return None
+        if getattr(self.request.accepted_renderer, 'columnar', False):
+            return serialize_columns(queryset, serializer_class, fields)
+        return serialize_rows(queryset, serializer_class, fields)
+
+    def serialized_rows(self, queryset, serializer_class=None):
+        """Return ``queryset`` serialized, on the fast path when it applies."""
+        data = self.fast_rows(queryset, serializer_class)
+        if data is not None:
+            return data
+        serializer_class = serializer_class or self.get_serializer_class()
+        queryset = self.prepare_queryset(queryset, serializer_class)
+        return serializer_class(queryset, many=True, context=self.get_serializer_context()).data
+
+    def prepare_queryset(self, queryset, serializer_class=None):
+        """Return ``queryset`` narrowed to the requested fieldset, see ``api.fieldsets``."""
+        if requested(self.request) == (None, []):
+            return queryset
+        serializer_class = serializer_class or self.get_serializer_class()
+        prepare = getattr(serializer_class(context=self.get_serializer_context()), 'prepare', None)
+        return queryset if prepare is None else prepare(queryset)
+
+    def streaming_list_response(self, *sources):
+        """
+        Return a streaming response for ``(queryset, serializer_class)`` sources.
+
+        The sources are streamed one after the other as a single list in the
+        negotiated format. Returns None if the renderer cannot stream or a
+        serializer cannot use the fast path.
+        """
+        renderer = self.request.accepted_renderer
+        fields, expand = requested(self.request)
+        if not hasattr(renderer, 'render_stream') or expand or any(
+            compile_serializer(serializer_class) is None for queryset, serializer_class in sources
+        ):
+            return None
+        for queryset, serializer_class in sources:
+            select_fields(compile_serializer(serializer_class), fields)
+        columnar = getattr(renderer, 'columnar', False)
+        chunks = itertools.chain.from_iterable(
+            serialized_chunks(queryset, serializer_class, columnar, fields=fields)
+            for queryset, serializer_class in sources
+        )
+        count = sum(queryset.count() for queryset, serializer_class in sources)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        return StreamingHttpResponse(renderer.render_stream(chunks, count), content_type=content_type)
+
+    def streaming_list(self, request, *sources):
+        """
+        Return the combined list of ``(queryset, serializer_class)`` sources.
+
+        The list carries one collection ETag over all sources and is streamed
+        when the renderer supports it, otherwise serialized in one go.
+        """
+        etag = collection_etag(request, *(queryset for queryset, serializer_class in sources))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        response = self.streaming_list_response(*sources)
+        if response is None:
+            response = Response([
+                row
+                for queryset, serializer_class in sources
+                for row in self.serialized_rows(queryset.order_by('pk'), serializer_class)
+            ])
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = collection_etag(request, queryset)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        response = self.fast_list_response(queryset) if self.paginator is None else None
+        if response is None:
+            queryset = self.prepare_queryset(queryset)
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+            else:
+                response = Response(self.get_serializer(queryset, many=True).data)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
@@ -0,0 +1,205 @@
+"""
+Sparse fieldsets and relation expansion for the TrackEase API application.
+
+Read requests choose the representation with two query parameters:
+
+- ``?fields=id,amount,created_at`` returns only the listed fields;
+- ``?expand=paid_by,group,shares`` replaces the listed relations' primary
+  keys with the related objects. Nested names are dotted:
+  ``?expand=shares.user`` also expands the user of every share, and
+  ``?fields=id,paid_by.email`` returns the payer's email only (naming a
+  nested field expands its relation).
+
+The requested fieldset drives the SQL: ``FieldsetSerializerMixin.prepare``
+narrows a queryset with ``only()`` to the columns the output needs, joins
+expanded foreign keys with ``select_related``, and fetches reverse and
+many-to-many relations, and foreign keys that may point into another
+database, with one ``prefetch_related`` query each, narrowed the same way.
+List endpoints on the fast path (``api.fast_serialization``) fetch just
+the requested columns with ``values()``.
+
+Write requests always get the full representation.
+
+Every fieldset is a representation of its own for caching: collection
+ETags hash the query string, and detail ETags the normalized ``fields``
+and ``expand`` plus the rows of the expanded relations (see
+``api.conditional.detail_etag``). Lists with expanded relations carry no
+ETag.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def split(names):
+    """
+    Split dotted names into top-level names and nested names per relation.
+
+    ``['id', 'paid_by.email']`` becomes ``({'id', 'paid_by'}, {'paid_by': ['email']})``.
+    """
+    top, nested = set(), defaultdict(list)
+    for name in names:
+        head, _, rest = name.partition('.')
+        top.add(head)
+        if rest:
+            nested[head].append(rest)
+    return top, dict(nested)
+
+
+def requested(request):
+    """
+    Return the ``(fields, expand)`` a request asks for.
+
+    ``fields`` is a list of names, or None for every field. ``expand`` lists
+    the relations to expand, including those implied by nested field
+    names. Write requests and requests without the parameters get
+    ``(None, [])``.
+    """
+    if request is None or request.method not in READ_METHODS:
+        return None, []
+    params = request.query_params if hasattr(request, 'query_params') else request.GET
+    fields = _names(params['fields']) if 'fields' in params else None
+    expand = _names(params.get('expand', ''))
+    for name in fields or ():
+        head, _, rest = name.partition('.')
+        if rest and head not in expand:
+            expand.append(head)
+    return fields, expand
+
+
+class FieldsetSerializerMixin:
+    """
+    Serializer mixin for sparse fieldsets and relation expansion.
+
+    ``Meta.expandable_fields`` maps relation names to ``(serializer class,
+    options)``; the options (e.g. ``many=True``) are passed to the nested
+    serializer. The fieldset is given with the ``fields`` and ``expand``
+    arguments, or read from the request in the context when both are
+    omitted. Unknown names are a validation error.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self._fieldset = None if fields is None and expand is None else (fields, expand or [])
+        super().__init__(*args, **kwargs)
+
+    def fieldset(self):
+        """Return the ``(fields, expand)`` of this serializer, see ``requested``."""
+        return self._fieldset or requested(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names, expand = self.fieldset()
+        if names is None and not expand:
+            return fields
+
+        nested_fields = {}
+        if names is not None:
+            names, nested_fields = split(names)
+        expand, nested_expand = split(expand)
+        expand |= set(nested_fields)
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        unknown = sorted(expand - set(expandable))
+        if unknown:
+            raise serializers.ValidationError({'error': f"Cannot expand {', '.join(unknown)}"})
+        for name in sorted(expand):
+            serializer_class, options = expandable[name]
+            fields[name] = serializer_class(
+                fields=nested_fields.get(name), expand=nested_expand.get(name, []), read_only=True, **options
+            )
+
+        if names is None:
+            return fields
+        unknown = sorted(names - set(fields))
+        if unknown:
+            raise serializers.ValidationError({'error': f"Unknown fields {', '.join(unknown)}"})
+        return {name: field for name, field in fields.items() if name in names or name in expand}
+
+    def prepare(self, queryset):
+        """Return ``queryset`` narrowed to the columns and relations of the output."""
+        names, expand = self.fieldset()
+        if names is None and not expand:
+            return queryset
+        return self._narrow(queryset)
+
+    def _narrow(self, queryset, *extra_columns):
+        plan = self._plan(queryset.model)
+        if plan is None:
+            return queryset
+        columns, related, prefetches = plan
+        queryset = queryset.only(*columns, *extra_columns)
+        if related:
+            queryset = queryset.select_related(*related)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+    def _plan(self, model, prefix=''):
+        """
+        Return the ``(only, select_related, prefetch_related)`` lookups of the output.
+
+        Lookups start with ``prefix``, the path from the queried model to
+        ``model``. Returns None when a field is not a model field and may
+        read any column.
+        """
+        opts = model._meta
+        columns, related, prefetches = [prefix + opts.pk.name], [], []
+        for field in self.fields.values():
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            try:
+                model_field = opts.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            lookup = prefix + model_field.name
+            forward = model_field.concrete and not model_field.many_to_many
+            if forward:
+                columns.append(lookup)
+            if not isinstance(nested, FieldsetSerializerMixin):
+                if not forward and model_field.is_relation:
+                    prefetches.append(lookup)
+                continue
+
+            # Foreign keys without a database constraint may point into
+            # another database (see api.sharding), so they are not joined.
+            if forward and model_field.db_constraint:
+                plan = nested._plan(model_field.related_model, lookup + '__')
+                if plan is None:
+                    return None
+                columns += plan[0]
+                related += [lookup, *plan[1]]
+                prefetches += plan[2]
+                continue
+            # The rows of a reverse relation are attached by their foreign key.
+            extra_columns = [model_field.field.name] if model_field.one_to_many else []
+            prefetches.append(Prefetch(
+                lookup, queryset=nested._narrow(model_field.related_model._default_manager.all(), *extra_columns)
+            ))
+        return columns, related, prefetches
+
+
+class FieldsetViewMixin:
+    """
+    ViewSet mixin that prepares the ``retrieve`` queryset for the requested fieldset.
+
+    Lists are prepared where they are serialized (see
+    ``api.fast_serialization.FastListMixin``); other actions may use other
+    serializers, so their querysets are left alone.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, 'action', None) != 'retrieve' or requested(self.request) == (None, []):
+            return queryset
+        return self.get_serializer().prepare(queryset)
@@ -0,0 +1,153 @@
+"""
+Currency conversion for the TrackEase API application.
+
+Exchange rates are loaded from a local rates file into the ExchangeRate
+table (see the ``load_fx_rates`` management command). Every rate is the
+value of one unit of a currency in ``settings.BASE_CURRENCY``; the base
+currency itself always has a rate of 1.
+
+Two conversion paths are provided:
+1. ``converted_amount`` - a query expression that converts amounts inside the
+   database, so aggregates over many rows are converted in the same query
+2. ``convert`` - converts a single value in Python using an in-memory rate
+   cache keyed by (currency, date)
+
+Both use the rate of the expense date. Amounts are never taken at a rate
+of 1 for lack of a better one: ``convert`` raises UnknownCurrency for a
+currency without rates, ``converted_amount`` yields NULL so aggregates leave
+the amount out, and ``to_base`` does the same for totals kept in Python and
+logs a warning for each amount it leaves out.
+
+The in-memory cache is rebuilt lazily after ``invalidate`` is called, which
+the loader does whenever new rates are stored.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import logging
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import ExchangeRate
+
+VERSION_KEY = 'fx:version'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_state = {'version': None, 'dates': {}, 'rates': {}}
+
+
+class UnknownCurrency(ValueError):
+    """Raised when no exchange rate is known for a currency."""
+
+
+def invalidate():
+    """Drop the cached rates in every process sharing the cache backend."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    with _lock:
+        _state['version'] = None
+
+
+def _load():
+    """Return the in-memory rate table, reloading it if it was invalidated."""
+    version = cache.get(VERSION_KEY, 0)
+    if _state['version'] == version:
+        return _state
+    with _lock:
+        if _state['version'] != version:
+            dates = defaultdict(list)
+            rates = {}
+            for currency, day, rate in ExchangeRate.objects.order_by('currency', 'date').values_list(
+                'currency', 'date', 'rate'
+            ):
+                dates[currency].append(day)
+                rates[currency, day] = rate
+            _state.update(version=version, dates=dict(dates), rates=rates)
+    return _state
+
+
+def currencies():
+    """Return the set of currencies amounts can be converted from."""
+    return set(_load()['dates']) | {settings.BASE_CURRENCY}
+
+
+def rate(currency, on):
+    """
+    Return the rate of ``currency`` that applies on ``on``.
+
+    The rate of the latest day on or before ``on`` is used, falling back to
+    the earliest known rate for dates before the rates file starts.
+    """
+    if currency == settings.BASE_CURRENCY:
+        return Decimal(1)
+    state = _load()
+    dates = state['dates'].get(currency)
+    if not dates:
+        raise UnknownCurrency(currency)
+    index = bisect_right(dates, on)
+    return state['rates'][currency, dates[max(index - 1, 0)]]
+
+
+def convert(amount, currency, on, to=None):
+    """Convert ``amount`` from ``currency`` to ``to`` (the base currency by default)."""
+    to = to or settings.BASE_CURRENCY
+    if currency == to:
+        return amount
+    return amount * rate(currency, on) / rate(to, on)
+
+
+def to_base(amount, currency, on):
+    """
+    Convert ``amount`` to the base currency like ``converted_amount`` does.
+
+    Returns None, and logs a warning, when ``currency`` has no rates; the
+    caller leaves the amount out of its totals, as database aggregates do.
+    """
+    try:
+        return convert(amount, currency, on)
+    except UnknownCurrency:
+        logger.warning('No exchange rate for %s, amount %s left out of base currency totals', currency, amount)
+        return None
+
+
+def _rate_expression(currency, moment, *fallback):
+    """Return a query expression for the rate of ``currency`` on ``moment``, NULL if it has none."""
+    rates = ExchangeRate.objects.filter(currency=currency)
+    return Coalesce(
+        Subquery(rates.filter(date__lte=moment).order_by('-date').values('rate')[:1]),
+        Subquery(rates.order_by('date').values('rate')[:1]),
+        *fallback,
+        output_field=DecimalField(max_digits=18, decimal_places=8),
+    )
+
+
+def converted_amount(prefix='', to=None):
+    """
+    Return a query expression converting an expense amount to ``to``.
+
+    ``prefix`` is the lookup path from the queried model to the expense,
+    e.g. ``'expense__'`` when querying shares. The share or expense amount
+    is taken from the queried model itself. Rates are those of the expense
+    date, as in ``convert``. An amount in a currency without rates converts
+    to NULL, so aggregates leave it out rather than count it at a rate of 1.
+    """
+    to = to or settings.BASE_CURRENCY
+    moment = OuterRef(f'{prefix}date')
+    is_base = Case(When(**{f'{prefix}currency': settings.BASE_CURRENCY}, then=Value(Decimal(1))))
+    amount = F('amount') * _rate_expression(OuterRef(f'{prefix}currency'), moment, is_base)
+    if to != settings.BASE_CURRENCY:
+        amount = amount / _rate_expression(to, moment)
+    return ExpressionWrapper(amount, output_field=DecimalField(max_digits=18, decimal_places=8))
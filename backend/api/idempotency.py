@@ -0,0 +1,123 @@
+"""
+Idempotency keys for the TrackEase API application.
+
+Clients may send an ``Idempotency-Key`` header with a write. The first
+request with a key commits a pending row for it, runs the write and then
+stores its response in that row; a retry with the same key and the same
+request is answered with the stored response after a single indexed
+lookup, and carries an ``Idempotent-Replayed: true`` header.
+
+The key row lives in the default database while the write may go to a
+shard, so the two cannot share a transaction. Committing the pending row
+first is what makes a retry that arrives while the first request is still
+running see it and get 409. If the write fails the row is deleted again;
+a row left pending by a crashed worker is taken over after
+``IDEMPOTENCY_PENDING_TIMEOUT`` seconds.
+
+Keys are scoped per user and expire after ``IDEMPOTENCY_KEY_TTL`` seconds.
+Reusing a key for a different request is rejected with 422.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    """Return a hash of the method, path and body of ``request``."""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def replay(record, request_fingerprint):
+    """Return the response to a retry of the request stored in ``record``."""
+    if record.fingerprint != request_fingerprint:
+        return Response(
+            {'error': 'Idempotency-Key was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.status_code is None:
+        return Response(
+            {'error': 'A request with this Idempotency-Key is still in progress'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def abandoned(record, now):
+    """Return whether ``record`` has expired, or was left pending by a request that died."""
+    if record.expires_at <= now:
+        return True
+    pending_timeout = timedelta(seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT)
+    return record.status_code is None and record.created_at <= now - pending_timeout
+
+
+def idempotent(view_method):
+    """
+    Make a viewset write method honour the ``Idempotency-Key`` header.
+
+    Requests without the header, or from anonymous users, run as usual.
+    Nothing is stored when the write raises (e.g. a validation error) or
+    returns a 5xx status; the pending row is deleted and the client can
+    retry with the same key.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER, '').strip()
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        request_fingerprint = fingerprint(request)
+        now = timezone.now()
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None:
+            if not abandoned(record, now):
+                return replay(record, request_fingerprint)
+            record.delete()
+
+        try:
+            with transaction.atomic(using=router.db_for_write(IdempotencyKey)):
+                record = IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    fingerprint=request_fingerprint,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+        except IntegrityError:
+            # A concurrent request with the same key got there first.
+            return replay(IdempotencyKey.objects.get(user=request.user, key=key), request_fingerprint)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        record.status_code = response.status_code
+        record.response = response.data
+        record.save(update_fields=['status_code', 'response'])
+        return response
+    return wrapper
@@ -0,0 +1,334 @@
+"""
+Balance ledger for the TrackEase API application.
+
+Expenses and shares are edited in place, so ``api.balances`` only knows the
+present. The ledger keeps the history: whenever a share starts or stops
+moving money between members (it is created, settled, edited or deleted,
+or its expense changes payer, currency, date or group), LedgerEntry rows are
+appended for the member who owes and for the payer, in the base currency.
+Entries are never updated or deleted, and the entries of a group always
+sum to its current balances.
+
+The ``snapshot_balances`` management command periodically folds the new
+entries of every changed group into a BalanceSnapshot. The balances at any
+moment are then the nearest earlier snapshot plus the entries written
+between it and the next snapshot, however old the group is.
+
+Single-row writes are recorded by the signal receivers below. Writes that
+bypass signals (``bulk_create``, ``QuerySet.update``) call ``record``
+themselves. ``rebuild`` recreates the ledger of groups from the expense and
+share tables, e.g. for data written before the ledger existed.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fx, sharding
+from .models import (
+    ArchivedExpenseShare, BalanceSnapshot, Expense, ExpenseShare, Group, LedgerEntry, User
+)
+from .splits import CENT
+
+PRECISION = Decimal('0.00000001')
+
+_paused = contextvars.ContextVar('ledger_paused', default=False)
+_deleting = contextvars.ContextVar('ledger_deleting', default=frozenset())
+
+
+@contextmanager
+def paused():
+    """Ignore share signals inside the block, e.g. while settled expenses are archived."""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def share_rows(shares, *fields):
+    """Return the values of ``shares`` the ledger needs, plus ``fields``, one dict per share."""
+    return shares.values(
+        'id', 'expense_id', 'user_id', 'amount', 'is_settled', *fields,
+        group_id=F('expense__group_id'),
+        paid_by_id=F('expense__paid_by_id'),
+        currency=F('expense__currency'),
+        expense_date=F('expense__date'),
+        expense_created_at=F('expense__created_at'),
+    )
+
+
+def share_row(share, expense=None):
+    """Return the ledger values of a share instance, see ``share_rows``."""
+    expense = expense or share.expense
+    return {
+        'id': share.pk,
+        'expense_id': expense.pk,
+        'user_id': share.user_id,
+        'amount': share.amount,
+        'is_settled': share.is_settled,
+        'group_id': expense.group_id,
+        'paid_by_id': expense.paid_by_id,
+        'currency': expense.currency,
+        'expense_date': expense.date,
+        'expense_created_at': expense.created_at,
+    }
+
+
+def entries(rows, kind, sign=1, at=None):
+    """
+    Yield the ledger entries of the shares in ``rows`` that are outstanding.
+
+    ``sign`` is 1 when the shares start moving money and -1 when they stop.
+    Groups and users that are being deleted get no entries, and neither do
+    shares in a currency without exchange rates.
+    """
+    at = at or timezone.now()
+    deleting = _deleting.get()
+    for row in rows:
+        if row['is_settled'] or row['user_id'] == row['paid_by_id']:
+            continue
+        if (Group, row['group_id']) in deleting:
+            continue
+        converted = fx.to_base(row['amount'], row['currency'], row['expense_date'])
+        if converted is None:
+            # Left out of the balances too, see api.fx.converted_amount.
+            continue
+        amount = sign * Decimal(converted).quantize(PRECISION)
+        common = {
+            'group_id': row['group_id'],
+            'kind': kind,
+            'expense_id': row['expense_id'],
+            'share_id': row['id'],
+            'created_at': at,
+        }
+        if (User, row['user_id']) not in deleting:
+            yield LedgerEntry(user_id=row['user_id'], amount=-amount, **common)
+        if (User, row['paid_by_id']) not in deleting:
+            yield LedgerEntry(user_id=row['paid_by_id'], amount=amount, **common)
+
+
+def save_entries(new_entries):
+    """Insert ``new_entries`` into the shards of their groups; return the number written."""
+    by_shard = defaultdict(list)
+    for entry in new_entries:
+        by_shard[sharding.shard_for_group(entry.group_id)].append(entry)
+    for alias, shard_entries in by_shard.items():
+        LedgerEntry.objects.using(alias).bulk_create(shard_entries, batch_size=1000)
+    return sum(len(shard_entries) for shard_entries in by_shard.values())
+
+
+def record(rows, kind, sign=1, at=None):
+    """Append the entries for ``rows``, see ``entries``; return the number written."""
+    return save_entries(entries(rows, kind, sign, at))
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(pre_delete, sender=User)
+def remember_deletion(sender, instance, **kwargs):
+    # Cascades delete the entries of a group or user before its shares.
+    _deleting.set(_deleting.get() | {(sender, instance.pk)})
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def forget_deletion(sender, instance, **kwargs):
+    _deleting.set(_deleting.get() - {(sender, instance.pk)})
+
+
+@receiver(pre_save, sender=ExpenseShare)
+def remember_share(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or _paused.get():
+        return
+    instance._ledger_row = share_rows(ExpenseShare.objects.using(instance._state.db).filter(pk=instance.pk)).first()
+
+
+@receiver(post_save, sender=ExpenseShare)
+def record_saved_share(sender, instance, created, raw=False, **kwargs):
+    if raw or _paused.get():
+        return
+    new = share_row(instance)
+    if created:
+        record([new], LedgerEntry.SHARE)
+        return
+    old = getattr(instance, '_ledger_row', None)
+    if old == new:
+        return
+    kind = LedgerEntry.SETTLEMENT if old and new['is_settled'] and not old['is_settled'] else LedgerEntry.EDIT
+    record([old] if old else [], kind, sign=-1)
+    record([new], kind)
+
+
+@receiver(post_delete, sender=ExpenseShare)
+def record_deleted_share(sender, instance, **kwargs):
+    # Settled shares move no money, so most deletions need no expense lookup.
+    if instance.is_settled or _paused.get():
+        return
+    record([share_row(instance)], LedgerEntry.DELETION, sign=-1)
+
+
+@receiver(pre_save, sender=Expense)
+def remember_payer(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or _paused.get():
+        return
+    instance._ledger_expense = Expense.objects.using(instance._state.db).filter(pk=instance.pk).values(
+        'group_id', 'paid_by_id', 'currency', expense_date=F('date')
+    ).first()
+
+
+@receiver(post_save, sender=Expense)
+def record_saved_expense(sender, instance, created, raw=False, **kwargs):
+    old = getattr(instance, '_ledger_expense', None)
+    if raw or created or old is None or _paused.get():
+        return
+    if old == {
+        'group_id': instance.group_id, 'paid_by_id': instance.paid_by_id,
+        'currency': instance.currency, 'expense_date': instance.date,
+    }:
+        return
+    new_rows = [share_row(share, instance) for share in instance.shares.filter(is_settled=False)]
+    old_rows = [{**row, **old} for row in new_rows]
+    record(old_rows, LedgerEntry.EDIT, sign=-1)
+    record(new_rows, LedgerEntry.EDIT)
+
+
+def balances_from(entries_queryset, balances=None):
+    """Add the summed ``entries_queryset`` to ``balances`` (a user ID to Decimal mapping)."""
+    balances = defaultdict(Decimal, balances or {})
+    for row in entries_queryset.values('user_id').annotate(total=Sum('amount')).order_by():
+        balances[row['user_id']] += row['total']
+    return balances
+
+
+def _snapshot_balances(snapshot):
+    return {int(user_id): Decimal(balance) for user_id, balance in snapshot.balances.items()}
+
+
+def take_snapshots():
+    """
+    Snapshot the balances of every group with entries since its last snapshot.
+
+    Entries younger than ``LEDGER_SNAPSHOT_DELAY`` seconds are left for the
+    next run, so entries of transactions that have not committed yet are
+    never skipped. Every shard is snapshotted on its own, since entry IDs
+    only increase within a shard. Returns the number of snapshots written.
+    """
+    taken_at = timezone.now() - timedelta(seconds=settings.LEDGER_SNAPSHOT_DELAY)
+    return sum(_take_snapshots(alias, taken_at) for alias in sharding.all_shards())
+
+
+def _take_snapshots(alias, taken_at):
+    ledger = LedgerEntry.objects.using(alias)
+    last_entry_id = ledger.filter(created_at__lte=taken_at).order_by('-id').values_list(
+        'id', flat=True
+    ).first()
+    if last_entry_id is None:
+        return 0
+    # Every run stamps its snapshots with its last entry, so the newest
+    # snapshot marks where the previous run stopped.
+    snapshots = BalanceSnapshot.objects.using(alias)
+    watermark = snapshots.order_by('-id').values_list('last_entry_id', flat=True).first() or 0
+    group_ids = ledger.filter(
+        id__gt=watermark, id__lte=last_entry_id
+    ).order_by().values_list('group_id', flat=True).distinct()
+
+    new_snapshots = []
+    for group_id in group_ids:
+        previous = snapshots.filter(group_id=group_id).order_by('-taken_at').first()
+        new_entries = ledger.filter(group_id=group_id, id__lte=last_entry_id)
+        balances = {}
+        if previous is not None:
+            new_entries = new_entries.filter(id__gt=previous.last_entry_id)
+            balances = _snapshot_balances(previous)
+        balances = balances_from(new_entries, balances)
+        new_snapshots.append(BalanceSnapshot(
+            group_id=group_id,
+            taken_at=taken_at,
+            last_entry_id=last_entry_id,
+            balances={str(user_id): balance for user_id, balance in balances.items() if balance},
+        ))
+    snapshots.bulk_create(new_snapshots, batch_size=500)
+    return len(new_snapshots)
+
+
+def balance_at(group_id, moment):
+    """
+    Return the balances of a group at ``moment`` in the base currency.
+
+    Reads the nearest snapshot taken at or before ``moment`` and replays the
+    entries written after it, up to the next snapshot. Returns a list of
+    ``{'user': <id>, 'balance': <Decimal>}`` dicts ordered by user ID, like
+    ``api.balances.group_balances``; settled-up members are left out.
+    """
+    alias = sharding.shard_for_group(group_id)
+    snapshots = BalanceSnapshot.objects.using(alias).filter(group_id=group_id)
+    previous = snapshots.filter(taken_at__lte=moment).order_by('-taken_at').first()
+    following = snapshots.filter(taken_at__gt=moment).order_by('taken_at').values_list(
+        'last_entry_id', flat=True
+    ).first()
+
+    replay = LedgerEntry.objects.using(alias).filter(group_id=group_id, created_at__lte=moment)
+    balances = {}
+    if previous is not None:
+        replay = replay.filter(id__gt=previous.last_entry_id)
+        balances = _snapshot_balances(previous)
+    if following is not None:
+        replay = replay.filter(id__lte=following)
+    balances = balances_from(replay, balances)
+
+    return [
+        {'user': user_id, 'balance': balance.quantize(CENT)}
+        for user_id, balance in sorted(balances.items())
+        if balance.quantize(CENT)
+    ]
+
+
+def rebuild(group_ids):
+    """
+    Recreate the ledger of ``group_ids`` from the expense and share tables.
+
+    Every share is opened when its expense was created and, if settled,
+    closed when it was settled; archived shares are included. Edits and
+    deletions made before the rebuild leave no trace. The snapshots of the
+    groups are dropped, since the rebuilt entries are back-dated. Returns
+    the number of entries written.
+    """
+    return sum(
+        _rebuild(alias, shard_group_ids)
+        for alias, shard_group_ids in sharding.shards_for_groups(list(group_ids)).items()
+    )
+
+
+def _rebuild(alias, group_ids):
+    rebuilt = []
+    for model in (ExpenseShare, ArchivedExpenseShare):
+        shares = model.objects.using(alias).filter(
+            expense__group_id__in=group_ids
+        ).exclude(user=F('expense__paid_by'))
+        for row in share_rows(shares, 'settled_at').iterator(chunk_size=5000):
+            opened = {**row, 'is_settled': False}
+            rebuilt += entries([opened], LedgerEntry.SHARE, at=row['expense_created_at'])
+            if row['is_settled']:
+                settled_at = max(row['settled_at'] or row['expense_created_at'], row['expense_created_at'])
+                rebuilt += entries([opened], LedgerEntry.SETTLEMENT, sign=-1, at=settled_at)
+    # Keep IDs in time order, so the ledger reads as a history.
+    rebuilt.sort(key=lambda entry: entry.created_at)
+
+    with transaction.atomic(using=alias):
+        LedgerEntry.objects.using(alias).filter(group_id__in=group_ids).delete()
+        BalanceSnapshot.objects.using(alias).filter(group_id__in=group_ids).delete()
+        LedgerEntry.objects.using(alias).bulk_create(rebuilt, batch_size=5000)
+    return len(rebuilt)
@@ -0,0 +1,31 @@
+"""
+Management command that moves old, fully settled expenses to the archive.
+
+Run it from cron; it is safe to run repeatedly.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archive_settled
+
+
+class Command(BaseCommand):
+    help = 'Archive fully settled expenses older than ARCHIVE_AFTER_DAYS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive settled expenses created more than this many days ago.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        archived = archive_settled(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} expenses'))
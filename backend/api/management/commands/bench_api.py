@@ -0,0 +1,335 @@
+"""
+End-to-end benchmark of every route in ``api/urls.py``.
+
+Each route is driven through the Django test client (in-process, which also
+gives queries per request and peak memory) and through a real HTTP server
+started on a local port. The command reports p50/p95/p99 latency per route,
+compares it with a stored baseline and fails when a route regresses.
+
+Run it against a scratch database filled by ``generate_data``; it adds a
+benchmark user to the busiest group and writes to the database::
+
+    python manage.py generate_data
+    python manage.py bench_api --save-baseline
+    python manage.py bench_api
+"""
+
+import http.client
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from knox.models import AuthToken
+from rest_framework.test import APIClient
+
+from api import sharding
+from api.models import Expense, ExpenseShare, Group, RecurringExpense, User
+
+BENCH_EMAIL = 'bench@trackease.local'
+# Routes that are not benchmarked: the profiler blocks for whole seconds.
+UNBENCHMARKED = {'profile-workers'}
+BENCH_PASSWORD = 'bench-password'
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Fixture:
+    """Objects the benchmark requests refer to."""
+
+    def __init__(self):
+        self.user, created = User.objects.get_or_create(
+            email=BENCH_EMAIL,
+            defaults={'username': BENCH_EMAIL, 'first_name': 'Bench', 'last_name': 'User'},
+        )
+        self.user.set_password(BENCH_PASSWORD)
+        self.user.save()
+        self.token = AuthToken.objects.create(self.user)[1]
+
+        busiest = [
+            Group.objects.using(alias).annotate(expense_total=Count('expenses'))
+            .order_by('-expense_total').first()
+            for alias in sharding.all_shards()
+        ]
+        self.group = max(
+            (group for group in busiest if group), key=lambda group: group.expense_total, default=None
+        ) or Group.objects.create(name='Benchmark', created_by=self.user)
+        self.group.members.add(self.user)
+        shard = self.group._state.db
+        self.expense = Expense.objects.using(shard).filter(group=self.group).first() or Expense.objects.using(shard).create(
+            group=self.group, description='Benchmark', amount='10.00', paid_by=self.user
+        )
+        self.recurring = RecurringExpense.objects.using(shard).filter(group=self.group).first() or \
+            RecurringExpense.objects.using(shard).create(
+                group=self.group, description='Benchmark rent', amount='100.00',
+                paid_by=self.user, start_date=self.expense.created_at.date(),
+                next_due=self.expense.created_at.date(),
+            )
+        self.other_ids = list(
+            self.group.members.exclude(id=self.user.id).values_list('id', flat=True)[:20]
+        )
+        self.share_ids = list(
+            ExpenseShare.objects.using(shard).filter(expense__group=self.group).values_list('id', flat=True)[:100]
+        )
+
+    def new_expense(self):
+        return Expense.objects.using(self.group._state.db).create(
+            group=self.group, description='Benchmark', amount='10.00', paid_by=self.user
+        ).id
+
+    def new_group(self):
+        return Group.objects.create(name='Benchmark', created_by=self.user).id
+
+    def new_token(self):
+        return AuthToken.objects.create(self.user)[1]
+
+
+def unique_email():
+    return f'bench-{uuid.uuid4().hex}@trackease.local'
+
+
+def build_routes(fixture):
+    """
+    Return the benchmarked requests as ``(route name, method, setup)`` tuples.
+
+    ``setup`` runs outside the timed section and returns ``(path, body,
+    token)``; a token of None means an anonymous request.
+    """
+    f = fixture
+    group, expense = f.group.id, f.expense.id
+    token = f.token
+    return [
+        ('api-root', 'GET', lambda: ('/api/', None, token)),
+        ('expense-list', 'GET', lambda: ('/api/expenses/', None, token)),
+        ('expense-list', 'POST', lambda: ('/api/expenses/', {
+            'group': group, 'description': 'Benchmark', 'amount': '12.50', 'paid_by': f.user.id,
+        }, token)),
+        ('expense-detail', 'GET', lambda: (f'/api/expenses/{expense}/', None, token)),
+        ('expense-detail', 'PATCH', lambda: (f'/api/expenses/{expense}/', {'description': 'Benchmark'}, token)),
+        ('expense-detail', 'DELETE', lambda: (f'/api/expenses/{f.new_expense()}/', None, token)),
+        ('group-list', 'GET', lambda: ('/api/groups/', None, token)),
+        ('group-list', 'POST', lambda: ('/api/groups/', {'name': 'Benchmark'}, token)),
+        ('group-detail', 'GET', lambda: (f'/api/groups/{group}/', None, token)),
+        ('group-detail', 'PATCH', lambda: (f'/api/groups/{group}/', {'description': 'Benchmark'}, token)),
+        ('group-detail', 'DELETE', lambda: (f'/api/groups/{f.new_group()}/', None, token)),
+        ('group-users', 'GET', lambda: (f'/api/groups/{group}/users/', None, token)),
+        ('group-members', 'POST', lambda: (f'/api/groups/{group}/members/', {'user_ids': f.other_ids}, token)),
+        ('group-members', 'DELETE', lambda: (f'/api/groups/{f.new_group()}/members/', {'user_ids': f.other_ids}, token)),
+        ('group-add-user', 'POST', lambda: (f'/api/groups/{group}/add_user/', {'user_id': f.user.id}, token)),
+        ('group-remove-user', 'DELETE', lambda: (f'/api/groups/{f.new_group()}/remove_user/', {'user_id': f.user.id}, token)),
+        ('group-settle', 'POST', lambda: (f'/api/groups/{group}/settle/', {'share_ids': f.share_ids}, token)),
+        ('group-balances', 'GET', lambda: (f'/api/groups/{group}/balances/', None, token)),
+        ('group-breakdown', 'GET', lambda: (f'/api/groups/{group}/breakdown/?by=category', None, token)),
+        ('group-ledger', 'GET', lambda: (f'/api/groups/{group}/ledger/', None, token)),
+        ('group-export', 'GET', lambda: (f'/api/groups/{group}/export/', None, token)),
+        ('recurringexpense-list', 'GET', lambda: ('/api/recurring-expenses/', None, token)),
+        ('recurringexpense-list', 'POST', lambda: ('/api/recurring-expenses/', {
+            'group': group, 'description': 'Benchmark', 'amount': '5.00', 'start_date': '2030-01-01',
+        }, token)),
+        ('recurringexpense-detail', 'GET', lambda: (f'/api/recurring-expenses/{f.recurring.id}/', None, token)),
+        ('register', 'POST', lambda: ('/api/auth/signup/', {
+            'email': unique_email(), 'password': BENCH_PASSWORD, 'first_name': 'Bench', 'last_name': 'User',
+        }, None)),
+        ('login', 'POST', lambda: ('/api/auth/login/', {'username': BENCH_EMAIL, 'password': BENCH_PASSWORD}, None)),
+        ('logout', 'POST', lambda: ('/api/auth/logout/', None, f.new_token())),
+        ('check-email', 'POST', lambda: ('/api/auth/check-email/', {'email': BENCH_EMAIL}, None)),
+        ('profile', 'GET', lambda: ('/api/profile/', None, token)),
+        ('update-profile', 'PUT', lambda: ('/api/profile/update/', {'first_name': 'Bench'}, token)),
+        ('dashboard', 'GET', lambda: ('/api/dashboard/', None, token)),
+        ('batch', 'POST', lambda: ('/api/batch/', {'requests': page_load_requests(group)}, token)),
+    ]
+
+
+def page_load_requests(*group_ids):
+    """Return the requests the frontend makes when the dashboard loads, as batch sub-requests."""
+    return [
+        {'method': 'GET', 'path': '/api/profile/'},
+        {'method': 'GET', 'path': '/api/dashboard/'},
+        {'method': 'GET', 'path': '/api/groups/'},
+        {'method': 'GET', 'path': '/api/expenses/'},
+        *({'method': 'GET', 'path': f'/api/groups/{group_id}/balances/'} for group_id in group_ids),
+    ]
+
+
+def api_route_names(resolver=None):
+    """Return the names of all routes declared in api/urls.py."""
+    names = set()
+    for pattern in (resolver or get_resolver('api.urls')).url_patterns:
+        if isinstance(pattern, URLResolver):
+            names |= api_route_names(pattern)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def percentiles(samples):
+    """Return p50, p95 and p99 of ``samples`` in milliseconds."""
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API route through the test client and a real HTTP server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative p95 slowdown before a route counts as regressed')
+        parser.add_argument('--slack-ms', type=float, default=2.0,
+                            help='Absolute p95 slowdown always tolerated, for very fast routes')
+        parser.add_argument('--no-http', action='store_true', help='Skip the real HTTP server run')
+
+    def handle(self, *args, **options):
+        fixture = Fixture()
+        routes = build_routes(fixture)
+        missing = api_route_names() - UNBENCHMARKED - {name for name, method, setup in routes}
+        if missing:
+            self.stderr.write(self.style.WARNING(f"Routes without a benchmark: {', '.join(sorted(missing))}"))
+
+        # Throttles still run, but with no rates configured they never block.
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        with override_settings(REST_FRAMEWORK=rest_framework, ALLOWED_HOSTS=['*']):
+            results = {'client': self.run_client(routes, options)}
+            if not options['no_http']:
+                results['http'] = self.run_http(routes, options)
+
+        self.report(results)
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}'))
+        elif baseline_path.exists():
+            self.compare(results, json.loads(baseline_path.read_text()), options)
+        else:
+            self.stdout.write(f'No baseline at {baseline_path}; run with --save-baseline to create one')
+
+    def run_client(self, routes, options):
+        results = {}
+        for name, method, setup in routes:
+            samples, queries = [], []
+            for i in range(options['warmup'] + options['requests']):
+                client, path, body = self.client_request(setup)
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = getattr(client, method.lower())(path, body, format='json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    elapsed = time.perf_counter() - start
+                self.check_status(name, method, response.status_code)
+                if i >= options['warmup']:
+                    samples.append(elapsed)
+                    queries.append(len(captured))
+
+            client, path, body = self.client_request(setup)
+            tracemalloc.start()
+            response = getattr(client, method.lower())(path, body, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            p50, p95, p99 = percentiles(samples)
+            results[f'{method} {name}'] = {
+                'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+                'queries': max(queries), 'peak_kib': round(peak / 1024, 1),
+            }
+        return results
+
+    def run_http(self, routes, options):
+        server = make_server('127.0.0.1', 0, get_wsgi_application(), WSGIServer, QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        port = server.server_address[1]
+        results = {}
+        try:
+            for name, method, setup in routes:
+                samples = []
+                for i in range(options['warmup'] + options['requests']):
+                    path, body, token = setup()
+                    headers = {'Content-Type': 'application/json', 'Host': 'localhost'}
+                    if token:
+                        headers['Authorization'] = f'Token {token}'
+                    payload = json.dumps(body).encode() if body is not None else None
+                    conn = http.client.HTTPConnection('127.0.0.1', port)
+                    start = time.perf_counter()
+                    conn.request(method, path, payload, headers)
+                    response = conn.getresponse()
+                    response.read()
+                    elapsed = time.perf_counter() - start
+                    conn.close()
+                    self.check_status(name, method, response.status)
+                    if i >= options['warmup']:
+                        samples.append(elapsed)
+                p50, p95, p99 = percentiles(samples)
+                results[f'{method} {name}'] = {
+                    'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+                }
+        finally:
+            server.shutdown()
+            server.server_close()
+        return results
+
+    def client_request(self, setup):
+        path, body, token = setup()
+        client = APIClient(HTTP_HOST='localhost')
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        return client, path, body
+
+    def check_status(self, name, method, status_code):
+        if status_code >= 400:
+            raise CommandError(f'{method} {name} returned HTTP {status_code}')
+
+    def report(self, results):
+        for transport, routes in results.items():
+            self.stdout.write(f'\n[{transport}]')
+            self.stdout.write(
+                f"{'route':<36} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>9}"
+            )
+            for route, stats in routes.items():
+                self.stdout.write(
+                    f"{route:<36} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+                    f" {stats.get('queries', ''):>8} {stats.get('peak_kib', ''):>9}"
+                )
+
+    def compare(self, results, baseline, options):
+        regressions = []
+        for transport, routes in results.items():
+            for route, stats in routes.items():
+                previous = baseline.get(transport, {}).get(route)
+                if previous is None:
+                    continue
+                limit = previous['p95_ms'] * (1 + options['tolerance']) + options['slack_ms']
+                if stats['p95_ms'] > limit:
+                    regressions.append(
+                        f"{transport} {route}: p95 {stats['p95_ms']:.2f} ms > {limit:.2f} ms"
+                    )
+                if 'queries' in previous and stats['queries'] > previous['queries']:
+                    regressions.append(
+                        f"{transport} {route}: {stats['queries']} queries > {previous['queries']}"
+                    )
+        if regressions:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,114 @@
+"""
+Benchmark of dashboard page-load latency with and without ``/api/batch/``.
+
+Loads the requests the frontend makes for the dashboard (profile,
+dashboard totals, groups, expenses and the balances of each group) through
+a real, threaded HTTP server in four ways:
+
+- ``separate``: one request after the other, as separate HTTP requests;
+- ``separate-concurrent``: separate requests over up to six connections at
+  once, as browsers do;
+- ``batch``: a single ``/api/batch/`` request;
+- ``batch-parallel``: a single batch with ``parallel`` set.
+
+Run it against a scratch database filled by ``generate_data``::
+
+    python manage.py generate_data
+    python manage.py bench_batch --groups 5
+"""
+
+import http.client
+import json
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+
+from api import sharding
+from api.management.commands.bench_api import Fixture, QuietHandler, page_load_requests, percentiles
+
+# Connections per origin browsers open at once over HTTP/1.1.
+BROWSER_CONNECTIONS = 6
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = 'Compare dashboard page-load latency of separate requests and /api/batch/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help='Timed page loads per mode')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--groups', type=int, default=3, help='Groups whose balances the page loads')
+
+    def handle(self, *args, **options):
+        fixture = Fixture()
+        group_ids = sharding.user_group_ids(fixture.user)[:options['groups']]
+        page = page_load_requests(*group_ids)
+
+        # Throttles still run, but with no rates configured they never block.
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        with override_settings(REST_FRAMEWORK=rest_framework, ALLOWED_HOSTS=['*']):
+            server = make_server('127.0.0.1', 0, get_wsgi_application(), ThreadingWSGIServer, QuietHandler)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.port = server.server_address[1]
+            self.token = fixture.token
+            try:
+                modes = {
+                    'separate': lambda: [self.request(item['method'], item['path']) for item in page],
+                    'separate-concurrent': lambda: self.concurrently(page),
+                    'batch': lambda: self.batch(page, parallel=False),
+                    'batch-parallel': lambda: self.batch(page, parallel=True),
+                }
+                results = {name: self.measure(load, options) for name, load in modes.items()}
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        self.stdout.write(f'{len(page)} requests per page load')
+        self.stdout.write(f"{'mode':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, (p50, p95, p99) in results.items():
+            self.stdout.write(f'{name:<22} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f}')
+
+    def measure(self, load, options):
+        samples = []
+        for i in range(options['warmup'] + options['requests']):
+            start = time.perf_counter()
+            load()
+            elapsed = time.perf_counter() - start
+            if i >= options['warmup']:
+                samples.append(elapsed)
+        return percentiles(samples)
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json', 'Host': 'localhost', 'Authorization': f'Token {self.token}'}
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            conn.request(method, path, json.dumps(body).encode() if body is not None else None, headers)
+            response = conn.getresponse()
+            content = response.read()
+        finally:
+            conn.close()
+        if response.status >= 400:
+            raise CommandError(f'{method} {path} returned HTTP {response.status}')
+        return content
+
+    def concurrently(self, page):
+        with ThreadPoolExecutor(BROWSER_CONNECTIONS) as executor:
+            return list(executor.map(lambda item: self.request(item['method'], item['path']), page))
+
+    def batch(self, page, parallel):
+        responses = json.loads(self.request('POST', '/api/batch/', {'requests': page, 'parallel': parallel}))
+        for item, response in zip(page, responses['responses']):
+            if response['status'] >= 400:
+                raise CommandError(f"{item['method']} {item['path']} returned HTTP {response['status']} in a batch")
+        return responses
@@ -0,0 +1,89 @@
+"""
+Benchmark of the email-existence check under signup-form traffic.
+
+Simulates users typing an email into the signup form: once the address
+contains an ``@`` the form checks it every few keystrokes. Most sessions
+type a new address and a few type one that is already registered. The
+same checks are run straight against the database and through the email
+filter; answers must be identical.
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import email_filter
+from api.models import User
+
+DOMAINS = ['example.com', 'mail.test', 'inbox.example.org']
+
+
+class Command(BaseCommand):
+    help = 'Compare email-existence checks with and without the email filter.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=2000, help='Signup forms filled in')
+        parser.add_argument('--existing-share', type=float, default=0.05,
+                            help='Share of sessions that type an already registered email')
+        parser.add_argument('--debounce', type=int, default=3,
+                            help='Keystrokes between two checks')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        existing = list(User.objects.values_list('email', flat=True)[:10000])
+        checks = []
+        for session in range(options['sessions']):
+            if existing and rng.random() < options['existing_share']:
+                email = rng.choice(existing)
+            else:
+                email = f'user{rng.randrange(10 ** 9)}@{rng.choice(DOMAINS)}'
+            start = email.index('@') + 1
+            checks += [email[:end] for end in range(start, len(email), options['debounce'])]
+            checks.append(email)
+
+        start = time.perf_counter()
+        bloom = email_filter.build()
+        build_time = time.perf_counter() - start
+
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            expected = [User.objects.filter(email=email).exists() for email in checks]
+            direct_time = time.perf_counter() - start
+            direct_queries, queries[0] = queries[0], 0
+
+            email_filter.reset_stats()
+            start = time.perf_counter()
+            answers = [email_filter.email_exists(email) for email in checks]
+            filter_time = time.perf_counter() - start
+            filter_queries = queries[0]
+
+        if answers != expected:
+            raise CommandError('The email filter gave a different answer than the database')
+
+        stats = email_filter.stats()
+        self.stdout.write(
+            f'Filter: {stats["items"]} emails, {stats["size_bytes"] / 1024:.1f} KiB, '
+            f'{bloom.hashes} hashes, built in {build_time * 1000:.1f} ms'
+        )
+        self.stdout.write(f'{len(checks)} checks from {options["sessions"]} signup sessions')
+        self.stdout.write(
+            f'database only: {direct_time / len(checks) * 1e6:8.1f} us/check, '
+            f'{direct_queries} queries'
+        )
+        self.stdout.write(
+            f'email filter:  {filter_time / len(checks) * 1e6:8.1f} us/check, '
+            f'{filter_queries} queries'
+        )
+        self.stdout.write(
+            f'False positive rate: observed {stats["observed_error_rate"]:.4f}, '
+            f'expected {stats["expected_error_rate"]:.4f}'
+        )
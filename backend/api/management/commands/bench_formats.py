@@ -0,0 +1,66 @@
+"""
+Benchmark of the binary response formats against JSON.
+
+Renders the same synthetic expense ledger as JSON, MessagePack and Arrow
+IPC, the way the export endpoint does, and reports payload size plus
+encode and decode times. The data is rolled back at the end.
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.fast_serialization import serialize_columns, serialize_rows
+from api.renderers import BINARY_RENDERERS, ArrowRenderer, FastJSONRenderer, MessagePackRenderer
+from api.serializers import ExpenseSerializer
+
+from .bench_serialization import create_expenses
+
+
+def _decode_msgpack(payload):
+    import msgpack
+    return msgpack.unpackb(payload)
+
+
+def _decode_arrow(payload):
+    import pyarrow as pa
+    return pa.ipc.open_stream(payload).read_all()
+
+
+class Command(BaseCommand):
+    help = 'Compare payload size and encode/decode time of JSON, MessagePack and Arrow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        formats = [('json', FastJSONRenderer, serialize_rows, json.loads)]
+        if MessagePackRenderer in BINARY_RENDERERS:
+            formats.append(('msgpack', MessagePackRenderer, serialize_rows, _decode_msgpack))
+        if ArrowRenderer in BINARY_RENDERERS:
+            formats.append(('arrow', ArrowRenderer, serialize_columns, _decode_arrow))
+        if len(formats) == 1:
+            raise CommandError('Neither msgpack nor pyarrow is installed')
+
+        results = []
+        with transaction.atomic():
+            queryset = create_expenses(options['rows'])
+            for name, renderer_class, serialize, decode in formats:
+                start = time.perf_counter()
+                payload = renderer_class().render(serialize(queryset, ExpenseSerializer))
+                encode_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                decode(payload)
+                decode_time = time.perf_counter() - start
+                results.append((name, len(payload), encode_time, decode_time))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['rows']} rows")
+        self.stdout.write(f"{'format':<8} {'bytes':>12} {'encode ms':>10} {'decode ms':>10}")
+        for name, size, encode_time, decode_time in results:
+            self.stdout.write(
+                f'{name:<8} {size:>12} {encode_time * 1000:>10.1f} {decode_time * 1000:>10.1f}'
+            )
@@ -0,0 +1,89 @@
+"""
+Management command measuring the per-request cost of the middleware chain.
+
+Every profile runs in a fresh interpreter, because ``API_ONLY`` is read when
+the settings are imported. Each child logs in once, as the frontend does,
+and then sends the token and the session cookie it received with every
+request, through the test client (the full WSGI handler without HTTP):
+
+- ``GET /api/profile/``: a cheap authenticated endpoint;
+- ``GET /api/missing/``: a 404, which runs the middleware and the URL
+  resolver but no view, so it is mostly middleware.
+
+Run it against a scratch database::
+
+    python manage.py bench_middleware --requests 2000
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.bench_startup import PROFILES
+
+CHILD = """
+import json, time
+import django
+django.setup()
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from api.management.commands.bench_api import BENCH_EMAIL, BENCH_PASSWORD, Fixture, percentiles
+
+rest_framework = {{**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {{}}}}
+with override_settings(
+    REST_FRAMEWORK=rest_framework, ALLOWED_HOSTS=['*'], DEBUG=False, CONCURRENCY_LIMIT_ENABLED=False,
+):
+    Fixture()
+    client = Client()
+    login = client.post('/api/auth/login/', {{'username': BENCH_EMAIL, 'password': BENCH_PASSWORD}},
+                        content_type='application/json')
+    assert login.status_code == 200, login.content
+    headers = {{'HTTP_AUTHORIZATION': 'Token ' + login.json()['token']}}
+    results = {{'middleware': len(settings.MIDDLEWARE)}}
+    for path, expected in (('/api/profile/', 200), ('/api/missing/', 404)):
+        samples = []
+        for i in range({warmup} + {requests}):
+            start = time.perf_counter()
+            response = client.get(path, **headers)
+            elapsed = time.perf_counter() - start
+            assert response.status_code == expected, (path, response.status_code)
+            if i >= {warmup}:
+                samples.append(elapsed)
+        with CaptureQueriesContext(connection) as queries:
+            client.get(path, **headers)
+        results[path] = {{'p50': percentiles(samples)[0], 'queries': len(queries)}}
+print(json.dumps(results))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request latency and queries of the full and API-only middleware chains.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Timed requests per route and profile')
+        parser.add_argument('--warmup', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'profile':<10} {'route':<16} {'middleware':>10} {'p50 us':>9} {'queries':>8}")
+        for profile, extra_env in PROFILES.items():
+            results = self.run_child(extra_env, options)
+            for path in ('/api/profile/', '/api/missing/'):
+                self.stdout.write(
+                    f"{profile:<10} {path:<16} {results['middleware']:>10}"
+                    f" {results[path]['p50'] * 1000:>9.0f} {results[path]['queries']:>8}"
+                )
+
+    def run_child(self, extra_env, options):
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD.format(requests=options['requests'], warmup=options['warmup'])],
+            cwd=settings.BASE_DIR, env={**os.environ, **extra_env}, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Benchmark failed:\n{result.stderr}')
+        return json.loads(result.stdout.splitlines()[-1])
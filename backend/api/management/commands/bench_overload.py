@@ -0,0 +1,194 @@
+"""
+Load test of the adaptive concurrency limit (api.concurrency) under overload.
+
+Serves the API from a threaded HTTP server and measures its capacity with a
+few closed-loop clients sending a mix of profile reads, group lists,
+expense creations and logins. It then offers ``--overload`` times that rate
+as open-loop arrivals, once with the limiter and once without, and reports
+the goodput: requests answered successfully within the client timeout, per
+second. Without the limiter, requests queue in the worker until most of
+them outlive their clients; with it, the excess is shed with 503, expensive
+requests first, and the admitted requests finish in time.
+
+Run it against a scratch database filled by ``generate_data``::
+
+    python manage.py generate_data
+    python manage.py bench_overload --overload 3
+"""
+
+import http.client
+import json
+import logging
+import random
+import socketserver
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+
+from api.management.commands.bench_api import BENCH_EMAIL, BENCH_PASSWORD, Fixture, QuietHandler
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    # server_close() waits for the requests still being served.
+    daemon_threads = False
+
+
+def build_mix(fixture):
+    """Return the request mix as ``(weight, route class, method, path, body, token)`` tuples."""
+    group, token = fixture.group.id, fixture.token
+    return [
+        (50, 'read', 'GET', '/api/profile/', None, token),
+        (20, 'read', 'GET', '/api/groups/', None, token),
+        (20, 'write', 'POST', '/api/expenses/', {
+            'group': group, 'description': 'Load test', 'amount': '9.99', 'paid_by': fixture.user.id,
+        }, token),
+        (10, 'expensive', 'POST', '/api/auth/login/', {'username': BENCH_EMAIL, 'password': BENCH_PASSWORD}, None),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare goodput with and without the adaptive concurrency limit under overload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--overload', type=float, default=3.0, help='Offered load as a multiple of capacity')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Length of each overload run')
+        parser.add_argument('--timeout', type=float, default=2.0, help='Client timeout in seconds')
+        parser.add_argument('--clients', type=int, default=4, help='Closed-loop clients measuring capacity')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        fixture = Fixture()
+        self.mix = build_mix(fixture)
+        self.timeout = options['timeout']
+        rng = random.Random(options['seed'])
+
+        capacity = self.run('unlimited', lambda: self.closed_loop(options['clients'], options['seconds'] / 2, rng))
+        rate = capacity['goodput'] * options['overload']
+        self.stdout.write(
+            f"Capacity {capacity['goodput']:.1f} requests/s; offering {rate:.1f} requests/s"
+            f" ({options['overload']:g}x) for {options['seconds']:g} s, client timeout {self.timeout:g} s\n"
+        )
+        self.stdout.write(
+            f"{'mode':<10} {'offered':>8} {'goodput':>8} {'shed':>6} {'timeout':>8} {'error':>6}"
+            f" {'p50 ms':>8} {'p95 ms':>8}  goodput by class"
+        )
+        for mode in ('unlimited', 'adaptive'):
+            stats = self.run(mode, lambda: self.open_loop(rate, options['seconds'], rng))
+            classes = ' '.join(f'{name}={value:.1f}' for name, value in sorted(stats['by_class'].items()))
+            self.stdout.write(
+                f"{mode:<10} {stats['offered']:>8.1f} {stats['goodput']:>8.1f} {stats['shed']:>6}"
+                f" {stats['timeouts']:>8} {stats['errors']:>6} {stats['p50']:>8.1f} {stats['p95']:>8.1f}  {classes}"
+            )
+
+    def run(self, mode, load):
+        """Run ``load`` against a fresh server, with the limiter unless ``mode`` is ``unlimited``."""
+        # Throttles still run, but with no rates configured they never block.
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        with override_settings(
+            REST_FRAMEWORK=rest_framework, ALLOWED_HOSTS=['*'], CONCURRENCY_LIMIT_ENABLED=mode != 'unlimited'
+        ):
+            application = get_wsgi_application()
+            # Shed, failed and timed out requests are the point here; do not log each one.
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+            server = make_server('127.0.0.1', 0, application, ThreadingWSGIServer, QuietHandler)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.port = server.server_address[1]
+            try:
+                return load()
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    def request(self, item):
+        """Send one request; return ``(route class, outcome, latency)``."""
+        weight, name, method, path, body, token = item
+        headers = {'Content-Type': 'application/json', 'Host': 'localhost'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, json.dumps(body).encode() if body is not None else None, headers)
+            response = conn.getresponse()
+            response.read()
+        except TimeoutError:
+            return name, 'timeout', None
+        except OSError:
+            return name, 'error', None
+        finally:
+            conn.close()
+        latency = time.perf_counter() - start
+        if response.status == 503:
+            return name, 'shed', latency
+        if response.status >= 400:
+            return name, 'error', latency
+        if latency > self.timeout:
+            return name, 'timeout', None
+        return name, 'ok', latency
+
+    def pick(self, rng):
+        return rng.choices(self.mix, weights=[item[0] for item in self.mix])[0]
+
+    def closed_loop(self, clients, seconds, rng):
+        items = [self.pick(rng) for _ in range(100000)]
+        results, lock = [], threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def client(offset):
+            index = offset
+            while time.perf_counter() < deadline:
+                result = self.request(items[index % len(items)])
+                with lock:
+                    results.append(result)
+                index += clients
+
+        threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summarize(results, seconds)
+
+    def open_loop(self, rate, seconds, rng):
+        count = int(rate * seconds)
+        items = [self.pick(rng) for _ in range(count)]
+        workers = min(1024, int(rate * self.timeout * 2) + 16)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            futures = []
+            for index, item in enumerate(items):
+                delay = start + index / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(self.request, item))
+            results = [future.result() for future in futures]
+        return {**self.summarize(results, seconds), 'offered': count / seconds}
+
+    def summarize(self, results, seconds):
+        outcomes = Counter(outcome for name, outcome, latency in results)
+        latencies = sorted(latency * 1000 for name, outcome, latency in results if outcome == 'ok')
+        if len(latencies) >= 2:
+            cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+            p50, p95 = cuts[49], cuts[94]
+        else:
+            p50 = p95 = latencies[0] if latencies else 0.0
+        by_class = Counter(name for name, outcome, latency in results if outcome == 'ok')
+        return {
+            'offered': len(results) / seconds,
+            'goodput': outcomes['ok'] / seconds,
+            'shed': outcomes['shed'],
+            'timeouts': outcomes['timeout'],
+            'errors': outcomes['error'],
+            'p50': p50,
+            'p95': p95,
+            'by_class': {name: count / seconds for name, count in by_class.items()},
+        }
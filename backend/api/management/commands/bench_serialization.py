@@ -0,0 +1,70 @@
+"""
+Benchmark of the expense list fast path against the regular serializer.
+
+Creates synthetic expenses inside a transaction that is rolled back at the
+end, renders them through both paths, checks that the outputs match and
+reports the timings.
+"""
+
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fast_serialization import serialize_rows
+from api.models import Expense, Group, User
+from api.renderers import FastJSONRenderer
+from api.serializers import ExpenseSerializer
+
+
+def create_expenses(count):
+    """Create ``count`` expenses in a new group and return them as a queryset."""
+    user = User.objects.create_user(
+        username='bench-serialization', email='bench-serialization@example.com',
+        password=None, first_name='Bench', last_name='User'
+    )
+    group = Group.objects.create(name='Benchmark', created_by=user)
+    Expense.objects.bulk_create(
+        [
+            Expense(
+                group=group,
+                description=f'Expense {i} – café',
+                amount=Decimal(i % 10000) / 100,
+                paid_by=user,
+            )
+            for i in range(count)
+        ],
+        batch_size=5000,
+    )
+    return Expense.objects.filter(group=group)
+
+
+class Command(BaseCommand):
+    help = 'Compare the fast list serialization path with ExpenseSerializer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            queryset = create_expenses(options['rows'])
+
+            start = time.perf_counter()
+            regular = JSONRenderer().render(ExpenseSerializer(queryset, many=True).data)
+            regular_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            fast = FastJSONRenderer().render(serialize_rows(queryset, ExpenseSerializer))
+            fast_time = time.perf_counter() - start
+
+            transaction.set_rollback(True)
+
+        if regular != fast:
+            raise CommandError('Fast path output differs from ExpenseSerializer output')
+
+        self.stdout.write(f"{options['rows']} rows, {len(regular)} bytes")
+        self.stdout.write(f'ExpenseSerializer + JSONRenderer: {regular_time * 1000:8.1f} ms')
+        self.stdout.write(f'serialize_rows + FastJSONRenderer: {fast_time * 1000:8.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {regular_time / fast_time:.1f}x'))
@@ -0,0 +1,101 @@
+"""
+Management command measuring worker cold-start time.
+
+Every run starts a fresh interpreter that imports ``core.wsgi`` or
+``core.asgi`` (which sets Django up) and then loads the URLconf, which is
+when the API views are imported. Both the full and the API-only profile
+(``API_ONLY=1``) are measured.
+
+With ``--importtime`` a ``python -X importtime`` report of the WSGI start-up
+is written, sorted by cumulative import time::
+
+    python manage.py bench_startup --importtime benchmarks/importtime.txt
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CHILD = """
+import importlib, time
+start = time.perf_counter()
+importlib.import_module({module!r}).application
+imported = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(imported - start, time.perf_counter() - start)
+"""
+
+ENTRYPOINTS = {'wsgi': 'core.wsgi', 'asgi': 'core.asgi'}
+PROFILES = {'full': {}, 'api-only': {'API_ONLY': '1'}}
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start time of the WSGI and ASGI applications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument('--importtime', metavar='PATH',
+                            help='Write a -X importtime report of the WSGI start-up to PATH')
+        parser.add_argument('--top', type=int, default=60,
+                            help='Number of modules listed in the import-time report')
+
+    def run_child(self, module, extra_env, *flags):
+        env = {**os.environ, **extra_env}
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *flags, '-c', CHILD.format(module=module)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - start
+        if result.returncode:
+            raise CommandError(f'{module} failed to start:\n{result.stderr}')
+        return result, wall
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'entrypoint':<20} {'import ms':>10} {'ready ms':>10} {'process ms':>11}"
+        )
+        for profile, extra_env in PROFILES.items():
+            for name, module in ENTRYPOINTS.items():
+                imports, ready, walls = [], [], []
+                for _ in range(options['runs']):
+                    result, wall = self.run_child(module, extra_env)
+                    imported, loaded = map(float, result.stdout.split())
+                    imports.append(imported)
+                    ready.append(loaded)
+                    walls.append(wall)
+                self.stdout.write(
+                    f'{name + " " + profile:<20} {statistics.median(imports) * 1000:>10.1f}'
+                    f' {statistics.median(ready) * 1000:>10.1f} {statistics.median(walls) * 1000:>11.1f}'
+                )
+
+        if options['importtime']:
+            self.write_importtime(Path(options['importtime']), options['top'])
+
+    def write_importtime(self, path, top):
+        result, wall = self.run_child(ENTRYPOINTS['wsgi'], {}, '-X', 'importtime')
+        rows = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            rows.append((int(cumulative_us), int(self_us), module.strip()))
+        rows.sort(reverse=True)
+
+        lines = [
+            f'# python -X importtime of core.wsgi plus URLconf load ({len(rows)} modules, '
+            f'{wall * 1000:.0f} ms process time)',
+            '# regenerate with: python manage.py bench_startup --importtime benchmarks/importtime.txt',
+            f"{'cumulative us':>14} {'self us':>9}  module",
+        ]
+        lines += [f'{cumulative:>14} {self_us:>9}  {module}' for cumulative, self_us, module in rows[:top]]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('\n'.join(lines) + '\n')
+        self.stdout.write(self.style.SUCCESS(f'Import-time report written to {path}'))
@@ -0,0 +1,76 @@
+"""
+Benchmark of the per-request overhead of the API throttles.
+
+Runs every configured throttle class against a synthetic request, the way
+DRF does in ``APIView.check_throttles``, and fails if the mean overhead per
+request exceeds the budget.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from rest_framework.views import APIView
+
+from api import throttling
+
+
+class BenchView(APIView):
+    throttle_scope = 'auth'
+    throttle_cost = 1
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the API throttles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--clients', type=int, default=1000,
+                            help='Number of distinct client IPs to spread requests over')
+        parser.add_argument('--budget-us', type=float, default=50.0,
+                            help='Maximum allowed mean overhead per request in microseconds')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        clients = options['clients']
+        requests = [
+            Request(factory.get('/api/bench/', REMOTE_ADDR=f'10.0.{i // 256}.{i % 256}'))
+            for i in range(clients)
+        ]
+        for request in requests:
+            request.user = None
+        view = BenchView()
+        # Rates high enough that every request is allowed, so the full
+        # refill-and-consume path is measured.
+        rates = {'ip': '1000000/s', 'user': '1000000/s', 'auth': '1000000/s'}
+
+        failed = False
+        for store in ('local', 'cache'):
+            with override_settings(THROTTLE_BUCKET_STORE=store):
+                throttling._stores.clear()
+                elapsed = self.run(requests, view, rates, options['requests'])
+            per_request = elapsed / options['requests'] * 1e6
+            within = per_request <= options['budget_us']
+            failed |= not within
+            style = self.style.SUCCESS if within else self.style.ERROR
+            self.stdout.write(style(f'{store:>5} store: {per_request:.2f} us/request'))
+
+        if failed:
+            raise CommandError(f"Throttle overhead exceeds {options['budget_us']} us/request")
+
+    def run(self, requests, view, rates, count):
+        throttles = [throttle() for throttle in api_settings.DEFAULT_THROTTLE_CLASSES]
+        original = api_settings.DEFAULT_THROTTLE_RATES
+        api_settings.DEFAULT_THROTTLE_RATES = rates
+        try:
+            start = time.perf_counter()
+            for i in range(count):
+                request = requests[i % len(requests)]
+                for throttle in throttles:
+                    throttle.allow_request(request, view)
+            return time.perf_counter() - start
+        finally:
+            api_settings.DEFAULT_THROTTLE_RATES = original
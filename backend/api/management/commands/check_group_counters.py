@@ -0,0 +1,35 @@
+"""
+Management command that checks the denormalized group counters.
+
+Recomputes every group's counters from the source tables and reports the
+groups that drifted; with ``--repair`` they are rewritten. Run it from cron
+or after bulk imports.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.counters import check, repair
+
+
+class Command(BaseCommand):
+    help = 'Check (and with --repair, fix) the denormalized group counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite drifted counters.')
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help='Only check this group ID (repeatable).')
+
+    def handle(self, *args, **options):
+        drift = (repair if options['repair'] else check)(options['groups'])
+        for group, differences in drift:
+            details = ', '.join(
+                f'{field} {stored} != {value}' for field, (stored, value) in differences.items()
+            )
+            self.stdout.write(f'Group {group.pk}: {details}')
+
+        if options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drift)} groups'))
+        elif drift:
+            raise CommandError(f'{len(drift)} groups have inconsistent counters; run with --repair')
+        else:
+            self.stdout.write(self.style.SUCCESS('All group counters are consistent'))
@@ -0,0 +1,170 @@
+"""
+Management command that fills the database with realistic synthetic data.
+
+Generates users, groups whose sizes follow a power law (many small groups,
+a few very large ones) and expenses with evenly split shares spread over a
+number of years. Older shares are more likely to be settled. Everything is
+written with ``bulk_create`` in batches, on the shard of each group.
+
+Run it against a scratch database, e.g. for ``bench_api``::
+
+    python manage.py generate_data --users 5000 --groups 1000 --years 3
+"""
+
+import random
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import ledger, sharding
+from api.counters import repair
+from api.models import Expense, ExpenseShare, Group, GroupShard, User, UserProfile
+from api.splits import split_evenly
+
+CATEGORIES = ['Rent', 'Groceries', 'Dinner', 'Utilities', 'Travel', 'Fuel', 'Tickets', 'Internet']
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, groups, expenses and shares.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--years', type=float, default=2)
+        parser.add_argument('--expenses-per-member-month', type=float, default=2,
+                            help='Average number of expenses each member adds per month')
+        parser.add_argument('--max-group-size', type=int, default=500)
+        parser.add_argument('--max-split', type=int, default=8,
+                            help='Maximum number of members an expense is split between')
+        parser.add_argument('--alpha', type=float, default=1.5,
+                            help='Pareto shape of group sizes; lower means heavier tail')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.max_split = options['max_split']
+        batch_size = options['batch_size']
+        now = timezone.now()
+        span = timedelta(days=365 * options['years'])
+        prefix = f"synthetic-{options['seed']}-{now:%Y%m%d%H%M%S}"
+
+        with ExitStack() as stack:
+            for alias in sharding.all_shards():
+                stack.enter_context(transaction.atomic(using=alias))
+            password = make_password('synthetic')
+            users = User.objects.bulk_create(
+                [
+                    User(
+                        username=f'{prefix}-{i}',
+                        email=f'{prefix}-{i}@example.com',
+                        first_name=f'User{i}',
+                        last_name='Synthetic',
+                        password=password,
+                    )
+                    for i in range(options['users'])
+                ],
+                batch_size=batch_size,
+            )
+            UserProfile.objects.bulk_create(
+                [UserProfile(user=user) for user in users], batch_size=batch_size
+            )
+            user_ids = [user.id for user in users]
+            self.stdout.write(f'Created {len(users)} users')
+
+            sizes = [
+                min(options['max_group_size'], len(user_ids), 1 + int(rng.paretovariate(options['alpha'])))
+                for _ in range(options['groups'])
+            ]
+            members = [rng.sample(user_ids, size) for size in sizes]
+            groups = [
+                Group(name=f'Group {i}', description='Synthetic group', created_by_id=group_members[0])
+                for i, group_members in enumerate(members)
+            ]
+            for alias, shard_groups in GroupShard.place(groups).items():
+                Group.objects.using(alias).bulk_create(shard_groups, batch_size=batch_size)
+            Group.members.through.objects.bulk_create(
+                [
+                    Group.members.through(group_id=group.id, user_id=user_id)
+                    for group, group_members in zip(groups, members)
+                    for user_id in group_members
+                ],
+                batch_size=batch_size,
+            )
+            self.stdout.write(f'Created {len(groups)} groups with {sum(sizes)} memberships')
+
+            months = options['years'] * 12
+            expense_count = share_count = 0
+            pending = []
+            for group, group_members in zip(groups, members):
+                count = int(len(group_members) * months * options['expenses_per_member_month'])
+                for _ in range(count):
+                    pending.append((group, group_members, now - span * rng.random()))
+                    if len(pending) >= batch_size:
+                        created = self.create_expenses(rng, pending, now, span, batch_size)
+                        expense_count += len(pending)
+                        share_count += created
+                        pending = []
+            if pending:
+                share_count += self.create_expenses(rng, pending, now, span, batch_size)
+                expense_count += len(pending)
+            self.stdout.write(f'Created {expense_count} expenses with {share_count} shares')
+
+            # Bulk inserts bypass the signals that maintain the group counters
+            # and the balance ledger.
+            repair([group.id for group in groups])
+            ledger.rebuild([group.id for group in groups])
+
+        self.stdout.write(self.style.SUCCESS('Synthetic data generated'))
+
+    def create_expenses(self, rng, pending, now, span, batch_size):
+        """Create one batch of expenses and their shares; return the number of shares."""
+        by_shard = {}
+        for item in pending:
+            by_shard.setdefault(item[0]._state.db, []).append(item)
+        return sum(
+            self.create_shard_expenses(rng, alias, shard_pending, now, span, batch_size)
+            for alias, shard_pending in by_shard.items()
+        )
+
+    def create_shard_expenses(self, rng, alias, pending, now, span, batch_size):
+        expenses = []
+        for group, group_members, created_at in pending:
+            category = rng.choice(CATEGORIES)
+            expenses.append(Expense(
+                group=group,
+                description=category,
+                category=category,
+                date=created_at.date(),
+                amount=Decimal(rng.randint(100, 50000)) / 100,
+                paid_by_id=rng.choice(group_members),
+            ))
+        expenses = Expense.objects.using(alias).bulk_create(expenses, batch_size=batch_size)
+        # bulk_create stamps auto_now fields with the current time, so the
+        # historical timestamps are written afterwards.
+        for expense, (group, group_members, created_at) in zip(expenses, pending):
+            expense.created_at = expense.updated_at = created_at
+        Expense.objects.using(alias).bulk_update(expenses, ['created_at', 'updated_at'], batch_size=batch_size)
+
+        shares = []
+        for expense, (group, group_members, created_at) in zip(expenses, pending):
+            participants = rng.sample(
+                group_members, rng.randint(1, min(len(group_members), self.max_split))
+            )
+            # The older an expense, the more likely its shares are settled.
+            settled = (now - created_at) / span > rng.random() * 0.9 + 0.05
+            for user_id, amount in split_evenly(expense.amount, participants):
+                shares.append(ExpenseShare(
+                    expense=expense,
+                    user_id=user_id,
+                    amount=amount,
+                    is_settled=settled,
+                    settled_at=created_at + timedelta(days=rng.randint(1, 30)) if settled else None,
+                ))
+        ExpenseShare.objects.using(alias).bulk_create(shares, batch_size=batch_size)
+        return len(shares)
@@ -0,0 +1,53 @@
+"""
+Management command that loads exchange rates from a local CSV file.
+
+The file needs ``date``, ``currency`` and ``rate`` columns, where ``rate`` is
+the value of one unit of the currency in settings.BASE_CURRENCY::
+
+    date,currency,rate
+    2024-01-02,EUR,1.0956
+
+The rates are written to every shard as well, because balance queries
+convert amounts in SQL on the shard holding the group.
+"""
+
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import fx, sharding
+from api.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from a CSV file and refresh the rate cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with date, currency and rate columns')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='') as rates_file:
+                rates = [
+                    ExchangeRate(
+                        currency=row['currency'].strip().upper(),
+                        date=date.fromisoformat(row['date'].strip()),
+                        rate=Decimal(row['rate'].strip()),
+                    )
+                    for row in csv.DictReader(rates_file)
+                ]
+        except (OSError, KeyError, ValueError, InvalidOperation) as e:
+            raise CommandError(f'Could not read rates: {e}')
+
+        for alias in sharding.all_shards():
+            ExchangeRate.objects.using(alias).bulk_create(
+                rates,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['currency', 'date'],
+                update_fields=['rate'],
+            )
+        fx.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(rates)} exchange rates'))
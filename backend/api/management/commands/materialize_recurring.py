@@ -0,0 +1,26 @@
+"""
+Management command that materializes due recurring expenses.
+
+Run it from cron or a worker loop; it is safe to run repeatedly.
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from api.recurring import materialize_due
+
+
+class Command(BaseCommand):
+    help = 'Create the expenses of every recurring template that is due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            help='Materialize occurrences due up to this date (YYYY-MM-DD). Defaults to today.',
+        )
+
+    def handle(self, *args, **options):
+        created = materialize_due(options['date'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} recurring expenses'))
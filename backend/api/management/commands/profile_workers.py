@@ -0,0 +1,45 @@
+"""
+Management command that profiles the running API workers.
+
+Starts a profiling session (see api.profiling), waits for it to end and
+writes the merged samples of all workers that served requests meanwhile,
+as collapsed stacks or as a speedscope file. The workers must share the
+cache backend with this command::
+
+    python manage.py profile_workers --seconds 30 --output speedscope --file profile.json
+"""
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import profiling
+from api.email_filter import shared_cache
+
+
+class Command(BaseCommand):
+    help = 'Sample the request threads of the running workers and write a flame graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--interval', type=float, default=settings.PROFILING_INTERVAL,
+                            help='Sampling interval in seconds')
+        parser.add_argument('--output', choices=['collapsed', 'speedscope'], default='collapsed')
+        parser.add_argument('--file', help='Write the profile to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if not shared_cache():
+            raise CommandError('Profiling needs a cache backend shared with the workers, configure one in CACHES')
+        if not 0 < options['seconds'] <= settings.PROFILING_MAX_SECONDS:
+            raise CommandError(f'--seconds must be between 0 and {settings.PROFILING_MAX_SECONDS}')
+        if options['interval'] <= 0:
+            raise CommandError('--interval must be positive')
+
+        counts, workers = profiling.profile(options['seconds'], options['interval'], local=False)
+        body, content_type = profiling.render(counts, options['output'], options['interval'])
+        if options['file']:
+            Path(options['file']).write_text(body)
+        else:
+            self.stdout.write(body, ending='')
+        self.stderr.write(f'{sum(counts.values())} samples from {workers} workers')
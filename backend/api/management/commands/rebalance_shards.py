@@ -0,0 +1,108 @@
+"""
+Management command that moves groups between shard databases.
+
+Without options it evens out ``settings.SHARDS``: the weight of a group is
+its number of expenses plus its number of members, and groups are moved
+from the heaviest to the lightest shard, the one closest to half the gap
+first, until every shard is within ``--tolerance`` of the average. Groups
+on a database that is no longer in ``SHARDS`` are always moved.
+``--group ID --to ALIAS`` moves a single group. Moves interrupted earlier are cleaned up first.
+
+Writes to a group are refused while it moves, but other processes only see
+the move once their directory cache is invalidated, so use a shared cache
+backend. Try it locally with SQLite files::
+
+    export DB_SHARDS=3
+    for db in default shard0 shard1 shard2; do python manage.py migrate --database $db; done
+    python manage.py rebalance_shards --dry-run
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.models import Group, GroupShard
+
+
+class Command(BaseCommand):
+    help = 'Move groups between shard databases to even out their load.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help='Move only this group ID (requires --to).')
+        parser.add_argument('--to', help='Database alias to move --group to.')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed deviation of a shard from the average load, as a fraction.')
+        parser.add_argument('--wait', type=float, default=1.0,
+                            help='Seconds to wait after marking groups as moving, so running writes finish.')
+        parser.add_argument('--dry-run', action='store_true', help='Only print the planned moves.')
+
+    def handle(self, *args, **options):
+        finished = [] if options['dry_run'] else sharding.finish_moves()
+        if finished:
+            self.stdout.write(f'Cleaned up interrupted moves of groups {finished}')
+
+        if options['group'] is not None:
+            if options['to'] not in settings.SHARDS:
+                raise CommandError(f"--to must be one of {', '.join(settings.SHARDS)}")
+            if not GroupShard.objects.filter(pk=options['group']).exists():
+                raise CommandError(f"Group {options['group']} does not exist")
+            moves = [(options['group'], options['to'])]
+        else:
+            moves = self.plan(options['tolerance'])
+
+        for group_id, target in moves:
+            self.stdout.write(f'Moving group {group_id} to {target}')
+            if not options['dry_run']:
+                sharding.move_group(group_id, target, wait=options['wait'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Planned' if options['dry_run'] else 'Made'} {len(moves)} moves"
+        ))
+
+    def plan(self, tolerance):
+        """Return ``(group ID, target shard)`` moves that even out the load."""
+        weights, placement = {}, {}
+        for alias in sharding.all_shards():
+            for group_id, expense_count, member_count in Group.objects.using(alias).values_list(
+                'pk', 'expense_count', 'member_count'
+            ):
+                weights[group_id] = expense_count + member_count
+        for group_id, shard in GroupShard.objects.values_list('pk', 'shard'):
+            placement[group_id] = shard
+
+        loads = dict.fromkeys(settings.SHARDS, 0)
+        stranded = []
+        for group_id, shard in placement.items():
+            if shard in loads:
+                loads[shard] += weights.get(group_id, 0)
+            else:
+                stranded.append(group_id)
+        moves = []
+        # Heaviest groups first, so the smaller ones fill the gaps.
+        for group_id in sorted(stranded, key=lambda group_id: -weights.get(group_id, 0)):
+            shard = min(loads, key=loads.get)
+            moves.append((group_id, shard))
+            placement[group_id] = shard
+            loads[shard] += weights.get(group_id, 0)
+
+        average = sum(loads.values()) / len(loads)
+        for _ in range(len(placement)):
+            heaviest = max(loads, key=loads.get)
+            lightest = min(loads, key=loads.get)
+            gap = loads[heaviest] - loads[lightest]
+            if loads[heaviest] - average <= tolerance * average:
+                break
+            candidates = [
+                group_id for group_id, shard in placement.items()
+                if shard == heaviest and 0 < weights.get(group_id, 0) < gap
+            ]
+            if not candidates:
+                break
+            group_id = max(candidates, key=lambda group_id: min(weights[group_id], gap - weights[group_id]))
+            placement[group_id] = lightest
+            loads[heaviest] -= weights[group_id]
+            loads[lightest] += weights[group_id]
+            moves = [move for move in moves if move[0] != group_id] + [(group_id, lightest)]
+
+        for alias, load in sorted(loads.items()):
+            self.stdout.write(f'{alias}: load {load} after the moves')
+        return moves
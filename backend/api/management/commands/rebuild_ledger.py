@@ -0,0 +1,30 @@
+"""
+Management command that rebuilds the balance ledger from the share tables.
+
+Run it once after the ledger is introduced, and after bulk imports that
+bypass the model signals. The snapshots of rebuilt groups are dropped; run
+``snapshot_balances`` afterwards.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.ledger import rebuild
+from api.models import GroupShard
+
+
+class Command(BaseCommand):
+    help = 'Recreate the balance ledger of groups from their expenses and shares.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help='Only rebuild this group ID (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of groups rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        group_ids = options['groups'] or list(GroupShard.objects.order_by('pk').values_list('pk', flat=True))
+        size = options['batch_size']
+        written = 0
+        for start in range(0, len(group_ids), size):
+            written += rebuild(group_ids[start:start + size])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} ledger entries for {len(group_ids)} groups'))
@@ -0,0 +1,19 @@
+"""
+Management command that snapshots group balances from the balance ledger.
+
+Run it from cron, e.g. hourly: only groups with ledger entries since the
+previous run get a new snapshot, and historical balances replay at most
+the entries written between two runs.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the balances of groups whose ledger changed since the last run.'
+
+    def handle(self, *args, **options):
+        taken = take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'Took {taken} balance snapshots'))
@@ -0,0 +1,412 @@
+"""
+Middleware for the TrackEase API application.
+
+This module defines:
+1. AssetMiddleware - Serves static files, media and the frontend build (api.assets)
+2. CompressionMiddleware - Negotiated zstd/brotli/gzip response compression
+3. BrowserMiddleware - Runs the session, CSRF and auth middleware for pages outside /api/ only
+4. ConcurrencyLimitMiddleware - Sheds load beyond an adaptive concurrency limit (api.concurrency)
+5. ProfilingMiddleware - Tags request threads with their view for api.profiling
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import os
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+from . import concurrency, profiling
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCompressor:
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        # wbits=31 writes a gzip header and trailer around the deflate stream.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    encoding = 'br'
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    encoding = 'zstd'
+
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+# Available compressors in order of preference when the client accepts
+# several encodings with the same quality.
+COMPRESSORS = [
+    compressor for compressor, available in (
+        (ZstdCompressor, zstandard is not None),
+        (BrotliCompressor, brotli is not None),
+        (GzipCompressor, True),
+    )
+    if available
+]
+
+
+def parse_accept_encoding(header):
+    """Return a ``{coding: quality}`` dict for an Accept-Encoding header."""
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities
+
+
+def negotiate_compressor(header):
+    """Return the compressor class preferred by an Accept-Encoding header, if any."""
+    qualities = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for compressor in COMPRESSORS:
+        quality = qualities.get(compressor.encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = compressor, quality
+    return best
+
+
+class AssetMiddleware:
+    """
+    Serve STATIC_ROOT, MEDIA_ROOT and the files of the React build (see api.assets).
+
+    Placed right after SecurityMiddleware, so asset requests skip sessions,
+    authentication and compression; the static files are precompressed.
+    Requests for files that do not exist pass through, e.g. to the
+    staticfiles finders of ``runserver``.
+    """
+
+    def __init__(self, get_response):
+        # api.assets imports this module.
+        from . import assets
+
+        self.get_response = get_response
+        self.assets = assets
+        self.roots = [
+            (urlsplit(url).path, root, cached)
+            for url, root, cached in (
+                (settings.STATIC_URL, settings.STATIC_ROOT, not settings.DEBUG),
+                (settings.MEDIA_URL, settings.MEDIA_ROOT, False),
+            )
+            # Assets on another host are not ours to serve.
+            if url and root and not urlsplit(url).netloc
+        ]
+        build_dir = settings.FRONTEND_BUILD_DIR
+        self.frontend_files = assets.frontend_files(build_dir) if os.path.isdir(build_dir) else set()
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            asset = self.find(request.path)
+            if asset is not None:
+                return self.assets.serve(request, asset)
+        return self.get_response(request)
+
+    def find(self, path):
+        for prefix, root, cached in self.roots:
+            if path.startswith(prefix):
+                return self.assets.find(root, path[len(prefix):], cache=cached)
+        name = path.lstrip('/')
+        if name in self.frontend_files:
+            return self.assets.find(settings.FRONTEND_BUILD_DIR, name, cache=not settings.DEBUG)
+        return None
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best encoding the client accepts.
+
+    zstd and brotli are used when their libraries are installed, gzip is
+    always available. Regular responses smaller than COMPRESSION_MIN_SIZE
+    bytes are sent as-is. Streaming responses are compressed chunk by chunk
+    and flushed after every chunk, so exports are never buffered in memory.
+
+    Strong ETags stay strong: the encoding is appended to the tag (``"abc"``
+    becomes ``"abc-br"``) because each encoding is a different representation.
+    304 responses get the same suffix, for the encoding the client accepts,
+    so that a revalidated cache entry keeps the tag it was stored under.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.levels = {
+            'gzip': 6,
+            'br': 4,
+            'zstd': 3,
+            **getattr(settings, 'COMPRESSION_LEVELS', {}),
+        }
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.status_code == 304:
+            self.tag_not_modified(request, response)
+            return response
+        if response.has_header('Content-Encoding') or response.status_code < 200:
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressor_class = negotiate_compressor(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if compressor_class is None:
+            return response
+        compressor = compressor_class(self.levels[compressor_class.encoding])
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.compress_async_stream(
+                    compressor, response.streaming_content
+                )
+            else:
+                response.streaming_content = self.compress_stream(
+                    compressor, response.streaming_content
+                )
+            del response['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'{etag[:-1]}-{compressor.encoding}"'
+        response['Content-Encoding'] = compressor.encoding
+        return response
+
+    @staticmethod
+    def tag_not_modified(request, response):
+        """Give a 304 the encoded ETag the 200 for this request would have had."""
+        etag = response.get('ETag')
+        if not etag or not etag.startswith('"'):
+            return
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressor_class = negotiate_compressor(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if compressor_class is None:
+            return
+        encoded = f'{etag[:-1]}-{compressor_class.encoding}"'
+        # Bodies below COMPRESSION_MIN_SIZE are sent as-is under the plain
+        # tag; keep it when that is the representation the client holds.
+        held = {tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')}
+        if etag in held and encoded not in held:
+            return
+        response['ETag'] = encoded
+
+    @staticmethod
+    def compress_stream(compressor, chunks):
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def compress_async_stream(compressor, chunks):
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class BrowserMiddleware:
+    """
+    Run the middleware of browser pages (``BROWSER_MIDDLEWARE``) for every path but the API's.
+
+    API requests authenticate with knox tokens, so sessions, CSRF checks,
+    the session user and frame options only cost them time. The wrapped
+    middleware runs as if it were listed in MIDDLEWARE in place of this
+    one, hooks included, for requests outside ``API_PREFIX``; API requests
+    pass straight through.
+    """
+
+    API_PREFIX = '/api/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.view_hooks, self.template_response_hooks, self.exception_hooks = [], [], []
+        handler = convert_exception_to_response(get_response)
+        # Built like BaseHandler.load_middleware builds the main chain.
+        for path in reversed(settings.BROWSER_MIDDLEWARE):
+            try:
+                middleware = import_string(path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_hooks.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_hooks.append(middleware.process_template_response)
+            if hasattr(middleware, 'process_exception'):
+                self.exception_hooks.append(middleware.process_exception)
+            handler = convert_exception_to_response(middleware)
+        self.browser_handler = handler
+
+    def is_api(self, request):
+        return request.path_info.startswith(self.API_PREFIX)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return self.browser_handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self.is_api(request):
+            for hook in self.template_response_hooks:
+                response = hook(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for hook in self.exception_hooks:
+            response = hook(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Shed requests beyond the adaptive concurrency limit (see api.concurrency).
+
+    The route class is known once the URL is resolved, so the slot is taken
+    in ``process_view``: after the other middleware, but before
+    authentication and the view. It is returned when the response is
+    complete: streamed responses (exports, streamed lists) do their work
+    while the body is sent, so theirs is returned when the response is
+    closed. Shed requests get a 503 with Retry-After. Disabled with
+    ``CONCURRENCY_LIMIT_ENABLED = False``.
+    """
+
+    def __init__(self, get_response):
+        self.limiter = concurrency.limiter()
+        if self.limiter is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            slot = getattr(request, '_concurrency_slot', None)
+            if slot is not None:
+                failed = response is None or response.status_code >= 500
+                if response is not None and response.streaming:
+                    response._resource_closers.append(lambda: self.release(slot, failed))
+                else:
+                    self.release(slot, failed)
+        return response
+
+    def release(self, slot, failed):
+        name, start = slot
+        self.limiter.release(name, time.monotonic() - start, failed)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = concurrency.classify(view_func, request)
+        if name is None:
+            return None
+        if not self.limiter.acquire(name):
+            response = JsonResponse(concurrency.OVERLOADED, status=503)
+            response['Retry-After'] = str(settings.CONCURRENCY_RETRY_AFTER)
+            return response
+        request._concurrency_slot = (name, time.monotonic())
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Register request threads with a running profiling session (see api.profiling).
+
+    Outside a session it only compares a timestamp per request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.poll():
+            return self.get_response(request)
+        thread_id = threading.get_ident()
+        profiling.track(thread_id, 'middleware')
+        try:
+            return self.get_response(request)
+        finally:
+            profiling.untrack(thread_id)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profiling.retag(threading.get_ident(), profiling.view_name(view_func, request))
@@ -9,10 +9,7 @@ class Migration(migrations.Migration):
         ("api", "0002_userprofile"),
     ]
 
-    operations = [
-        migrations.AddField(
-            model_name="userprofile",
-            name="profile_image",
-            field=models.ImageField(blank=True, null=True, upload_to="profile_images/"),
-        ),
-    ]
+    # 0001_initial already creates UserProfile with all of its fields. The
+    # migration is kept, without operations, so that new databases can be
+    # migrated and existing ones keep a consistent history.
+    operations = []
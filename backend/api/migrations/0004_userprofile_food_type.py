@@ -9,17 +9,7 @@ class Migration(migrations.Migration):
         ("api", "0003_userprofile_profile_image"),
     ]
 
-    operations = [
-        migrations.AddField(
-            model_name="userprofile",
-            name="food_type",
-            field=models.CharField(
-                choices=[
-                    ("vegetarian", "Vegetarian"),
-                    ("non-vegetarian", "Non-Vegetarian"),
-                ],
-                default="vegetarian",
-                max_length=20,
-            ),
-        ),
-    ]
+    # 0001_initial already creates UserProfile with all of its fields. The
+    # migration is kept, without operations, so that new databases can be
+    # migrated and existing ones keep a consistent history.
+    operations = []
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.1 on 2026-10-19 11:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_userprofile_food_type"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expenseshare",
+            index=models.Index(
+                fields=["user", "is_settled"], name="api_expense_user_id_15915f_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-19 11:13
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_recurringexpense"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("currency", models.CharField(max_length=3)),
+                ("date", models.DateField()),
+                ("rate", models.DecimalField(decimal_places=8, max_digits=18)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="currency",
+            field=models.CharField(default=api.models.default_currency, max_length=3),
+        ),
+        migrations.AddField(
+            model_name="recurringexpense",
+            name="currency",
+            field=models.CharField(default=api.models.default_currency, max_length=3),
+        ),
+        migrations.AddConstraint(
+            model_name="exchangerate",
+            constraint=models.UniqueConstraint(
+                fields=("currency", "date"), name="unique_currency_date"
+            ),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.0.1 on 2026-10-19 11:32
+
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def populate_counters(apps, schema_editor):
+    """Compute the counters of existing groups (see api.counters.expected)."""
+    Group = apps.get_model("api", "Group")
+    ExchangeRate = apps.get_model("api", "ExchangeRate")
+
+    dates, rates = defaultdict(list), {}
+    for currency, day, rate in ExchangeRate.objects.order_by(
+        "currency", "date"
+    ).values_list("currency", "date", "rate"):
+        dates[currency].append(day)
+        rates[currency, day] = rate
+
+    def to_base(amount, currency, moment):
+        known = dates.get(currency)
+        if currency != settings.BASE_CURRENCY and known:
+            index = bisect_right(known, moment.date())
+            amount = amount * rates[currency, known[max(index - 1, 0)]]
+        return amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+    counters = defaultdict(
+        lambda: {
+            "member_count": 0,
+            "expense_count": 0,
+            "total_amount": Decimal(0),
+            "last_activity_at": None,
+        }
+    )
+
+    def latest(group_id, moment):
+        current = counters[group_id]["last_activity_at"]
+        if moment and (current is None or moment > current):
+            counters[group_id]["last_activity_at"] = moment
+
+    for row in (
+        Group.members.through.objects.values("group_id")
+        .annotate(count=Count("pk"))
+        .order_by()
+    ):
+        counters[row["group_id"]]["member_count"] = row["count"]
+    for name in ("Expense", "ArchivedExpense"):
+        expenses = apps.get_model("api", name).objects.values_list(
+            "group_id", "amount", "currency", "created_at", "updated_at"
+        )
+        for group_id, amount, currency, created_at, updated_at in expenses.iterator():
+            counters[group_id]["expense_count"] += 1
+            counters[group_id]["total_amount"] += to_base(amount, currency, created_at)
+            latest(group_id, updated_at)
+    for name in ("ExpenseShare", "ArchivedExpenseShare"):
+        shares = (
+            apps.get_model("api", name)
+            .objects.values("expense__group_id")
+            .annotate(latest=Max("settled_at"))
+            .order_by()
+        )
+        for row in shares:
+            latest(row["expense__group_id"], row["latest"])
+
+    groups = list(Group.objects.filter(pk__in=list(counters)))
+    for group in groups:
+        for field, value in counters[group.pk].items():
+            setattr(group, field, value)
+    Group.objects.bulk_update(
+        groups,
+        ["member_count", "expense_count", "total_amount", "last_activity_at"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_archivedexpense"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="group",
+            name="expense_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="last_activity_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="member_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="total_amount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
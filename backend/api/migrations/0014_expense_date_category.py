@@ -0,0 +1,80 @@
+# Generated by Django 5.0.1 on 2026-10-19 12:31
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_dates(apps, schema_editor):
+    """Date existing expenses by the day they were created, in one UPDATE per table."""
+    alias = schema_editor.connection.alias
+    for name in ("Expense", "ArchivedExpense"):
+        model = apps.get_model("api", name)
+        model.objects.using(alias).filter(date__isnull=True).update(
+            date=TruncDate("created_at")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_sharding"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expense",
+            name="date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="category",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+        migrations.AddField(
+            model_name="archivedexpense",
+            name="date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedexpense",
+            name="category",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+        migrations.RunPython(backfill_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="expense",
+            name="date",
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AlterField(
+            model_name="archivedexpense",
+            name="date",
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["group", "date"], name="api_expense_group_i_a021a6_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["group", "category"], name="api_expense_group_i_8ac2e0_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedexpense",
+            index=models.Index(
+                fields=["group", "date"], name="api_archive_group_i_64e723_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedexpense",
+            index=models.Index(
+                fields=["group", "category"], name="api_archive_group_i_4c5f0b_idx"
+            ),
+        ),
+    ]
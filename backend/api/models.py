@@ -6,20 +6,78 @@ This module defines the database models used in the application:
 2. Group - Model for expense sharing groups
 3. Expense - Model for tracking shared expenses
 4. ExpenseShare - Model for tracking how expenses are shared among group members
+5. ArchivedExpense, ArchivedExpenseShare - Old settled expenses moved out of the hot tables
+6. RecurringExpense - Template for expenses that repeat on a schedule
+7. ExchangeRate - Daily exchange rates against the base currency
+8. IdempotencyKey - Stored responses of writes made with an Idempotency-Key header
+9. LedgerEntry, BalanceSnapshot - Append-only balance history of a group
+10. GroupShard - Directory of the database shard holding each group
+
+Groups and the models that belong to a group may live in shard databases
+(see ``api.sharding``), while users stay in the default database, so their
+foreign keys to User are not enforced by the database.
 
 @author Nandeesh Kantli
 @date April 4, 2024
 @version 1.0.0
 """
 
-from django.db import models
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from core.models import User
 
-class Group(models.Model):
+def default_currency():
+    """Return the currency used when an expense does not specify one."""
+    return settings.BASE_CURRENCY
+
+class VersionConflict(Exception):
+    """Raised when a versioned row was changed by someone else since it was read."""
+
+class VersionedModel(models.Model):
+    """
+    Abstract model with optimistic concurrency control.
+
+    Every update first runs ``UPDATE ... SET version = version + 1 WHERE
+    id = ? AND version = ?`` with the version the instance was read with.
+    If another writer got there first no row matches and VersionConflict is
+    raised; otherwise the row is written in the same transaction. No lock is
+    held between reading and writing, so concurrent edits never wait on each
+    other, on SQLite and PostgreSQL alike.
+
+    Fields:
+    - version: Incremented on every update
+    """
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get('force_insert'):
+            return super().save(*args, **kwargs)
+
+        expected = self.version
+        using = kwargs.get('using') or self._state.db
+        with transaction.atomic(using=using):
+            claimed = type(self)._base_manager.using(using).filter(pk=self.pk, version=expected).update(
+                version=expected + 1
+            )
+            if not claimed:
+                raise VersionConflict(f'{type(self).__name__} {self.pk} is no longer at version {expected}')
+            self.version = expected + 1
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                self.version = expected
+                raise
+
+class Group(VersionedModel):
     """
     Model for expense sharing groups.
     
@@ -29,13 +87,36 @@ class Group(models.Model):
     - members: Users who are members of the group
     - created_by: User who created the group
     - created_at: Group creation timestamp
+    - member_count, expense_count, total_amount, last_activity_at:
+      Denormalized summary maintained by ``api.counters``; total_amount
+      is in the base currency and includes archived expenses
     """
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
-    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_groups')
-    members = models.ManyToManyField(User, related_name='member_groups')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_groups', db_constraint=False)
+    members = models.ManyToManyField(User, related_name='member_groups', db_constraint=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    member_count = models.PositiveIntegerField(default=0)
+    expense_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+
+    COUNTER_FIELDS = ('member_count', 'expense_count', 'total_amount', 'last_activity_at')
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            # New groups are written to the shard the directory puts them on.
+            kwargs['using'] = next(iter(GroupShard.place([self])))
+            kwargs['force_insert'] = True
+        # The counters are only written with F() updates (see api.counters);
+        # saving a stale copy of them would undo concurrent changes.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -43,13 +124,14 @@ class Group(models.Model):
     class Meta:
         ordering = ['-created_at']
 
-class Expense(models.Model):
+class Expense(VersionedModel):
     """
     Model for tracking shared expenses.
     
     Fields:
     - description: Expense description
     - amount: Expense amount
+    - currency: ISO 4217 code of the amount
     - date: Date of expense
     - category: Expense category
     - group: Group the expense belongs to
@@ -59,10 +141,30 @@ class Expense(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='expenses')
     description = models.CharField(max_length=200)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='paid_expenses')
+    currency = models.CharField(max_length=3, default=default_currency)
+    date = models.DateField(default=timezone.localdate)
+    category = models.CharField(max_length=50, blank=True, default='')
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='paid_expenses', db_constraint=False)
+    recurring = models.ForeignKey(
+        'RecurringExpense', on_delete=models.SET_NULL, null=True, blank=True, related_name='occurrences'
+    )
+    occurrence_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recurring', 'occurrence_date'],
+                name='unique_recurring_occurrence',
+            ),
+        ]
+        # Breakdowns of a group's expenses (see api.breakdowns)
+        indexes = [
+            models.Index(fields=['group', 'date']),
+            models.Index(fields=['group', 'category']),
+        ]
+
     def __str__(self):
         return f"{self.description} - {self.amount}"
 
@@ -78,14 +180,298 @@ class ExpenseShare(models.Model):
     - settled_at: When the share was settled
     """
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='shares')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_shares')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_shares', db_constraint=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     is_settled = models.BooleanField(default=False)
     settled_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_settled']),
+        ]
+
     def __str__(self):
         return f"{self.user.username} owes {self.amount} for {self.expense.description}"
 
+class ArchivedExpense(models.Model):
+    """
+    Model for fully settled expenses moved out of the Expense table.
+
+    Rows keep the primary key and field values they had as an Expense, so
+    they serialize exactly like one. Old settled expenses are moved here by
+    the ``archive_expenses`` management command, which keeps the Expense and
+    ExpenseShare tables and their indexes limited to recent and open data.
+
+    Fields:
+    - same as Expense
+    - archived_at: When the expense was archived
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Declared first like the inherited VersionedModel field, so both
+    # serializers list fields in the same order.
+    version = models.PositiveIntegerField(default=1)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='archived_expenses')
+    description = models.CharField(max_length=200)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    category = models.CharField(max_length=50, blank=True, default='')
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_paid_expenses', db_constraint=False)
+    recurring = models.ForeignKey(
+        'RecurringExpense', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_occurrences'
+    )
+    occurrence_date = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'date']),
+            models.Index(fields=['group', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.description} - {self.amount} (archived)"
+
+class ArchivedExpenseShare(models.Model):
+    """
+    Model for the shares of an archived expense.
+
+    Fields:
+    - same as ExpenseShare, with the share's original primary key
+    """
+    id = models.BigIntegerField(primary_key=True)
+    expense = models.ForeignKey(ArchivedExpense, on_delete=models.CASCADE, related_name='shares')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_expense_shares', db_constraint=False)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    is_settled = models.BooleanField(default=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.username} owed {self.amount} for {self.expense.description}"
+
+class RecurringExpense(models.Model):
+    """
+    Template for expenses that repeat on a schedule (rent, subscriptions, utilities).
+
+    Fields:
+    - group: Group the generated expenses belong to
+    - description: Description copied to every generated expense
+    - amount: Amount of every generated expense
+    - currency: ISO 4217 code of the amount
+    - paid_by: User who pays every generated expense
+    - frequency: How often the expense repeats
+    - start_date: Date of the first occurrence
+    - end_date: Date after which no more occurrences are generated
+    - next_due: Date of the next occurrence that has not been generated yet
+    - is_active: Whether the template still generates expenses
+    - created_at: Template creation timestamp
+    """
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+    FREQUENCY_CHOICES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+        (YEARLY, 'Yearly'),
+    ]
+
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='recurring_expenses')
+    description = models.CharField(max_length=200)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default=default_currency)
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_expenses', db_constraint=False)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default=MONTHLY)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    next_due = models.DateField()
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_due']),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.frequency})"
+
+class ExchangeRate(models.Model):
+    """
+    Model for daily exchange rates loaded from a rates file.
+
+    Fields:
+    - currency: ISO 4217 code
+    - date: Day the rate applies from
+    - rate: Value of one unit of the currency in settings.BASE_CURRENCY
+    """
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='unique_currency_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
+
+class IdempotencyKey(models.Model):
+    """
+    Model for the response of a write made with an ``Idempotency-Key`` header.
+
+    A retry with the same key is answered with the stored response instead
+    of running the write again (see ``api.idempotency``). Rows expire after
+    ``IDEMPOTENCY_KEY_TTL`` seconds and are removed by the
+    ``purge_idempotency_keys`` management command.
+
+    Fields:
+    - user: User who made the request; keys are scoped per user
+    - key: Client-generated key from the request header
+    - fingerprint: Hash of the method, path and body of the request
+    - status_code, response: The stored response, empty while the request is running
+    - created_at: When the request was made
+    - expires_at: When the key may be reused
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
+
+class LedgerEntry(models.Model):
+    """
+    Model for one change to a member's balance in a group.
+
+    Entries are only ever inserted (see ``api.ledger``): every share that
+    starts or stops moving money between members writes one entry for the
+    member who owes and one for the payer, so the entries of a group always
+    sum to its current balances.
+
+    Fields:
+    - group: Group the balance belongs to
+    - user: Member whose balance changes
+    - amount: Change in the base currency; positive means the member is owed more
+    - kind: What caused the change
+    - expense_id, share_id: Expense and share that caused the change; not foreign
+      keys, since expenses are deleted and archived while the history stays
+    - created_at: When the change happened
+    """
+    SHARE = 'share'
+    SETTLEMENT = 'settlement'
+    EDIT = 'edit'
+    DELETION = 'deletion'
+    KIND_CHOICES = [
+        (SHARE, 'Share'),
+        (SETTLEMENT, 'Settlement'),
+        (EDIT, 'Edit'),
+        (DELETION, 'Deletion'),
+    ]
+
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='ledger_entries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries', db_constraint=False)
+    amount = models.DecimalField(max_digits=18, decimal_places=8)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    expense_id = models.BigIntegerField(null=True, blank=True)
+    share_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Ledger entries cannot be changed')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.group_id}/{self.user_id}: {self.amount} ({self.kind})"
+
+class BalanceSnapshot(models.Model):
+    """
+    Model for the balances of a group as of a ledger entry.
+
+    Snapshots are taken periodically by the ``snapshot_balances`` management
+    command; a balance at any moment is the nearest earlier snapshot plus
+    the entries written after it (see ``api.ledger.balance_at``).
+
+    Fields:
+    - group: Group the balances belong to
+    - taken_at: When the snapshot was taken
+    - last_entry_id: ID of the last ledger entry included in the balances
+    - balances: Mapping of user ID to balance in the base currency
+    """
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='balance_snapshots')
+    taken_at = models.DateTimeField()
+    last_entry_id = models.BigIntegerField()
+    balances = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.group_id} @ {self.taken_at}"
+
+class GroupShard(models.Model):
+    """
+    Model for the directory entry of a group, kept in the default database.
+
+    The ID of an entry is the ID of its group, so group IDs are unique
+    across shards (see ``api.sharding``).
+
+    Fields:
+    - shard: Database alias holding the group's data
+    - created_by: Creator of the group, so "my groups" needs no shard query
+    - moving: Set while the group is copied to another shard; writes are refused
+    """
+    shard = models.CharField(max_length=100)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_shards')
+    moving = models.BooleanField(default=False)
+
+    @classmethod
+    def place(cls, groups):
+        """
+        Give new ``groups`` their ID and spread them over ``settings.SHARDS`` by ID.
+
+        Returns ``{shard: [groups]}``.
+        """
+        entries = cls.objects.bulk_create([
+            cls(shard=settings.SHARDS[0], created_by_id=group.created_by_id) for group in groups
+        ])
+        placed = {}
+        for group, entry in zip(groups, entries):
+            group.pk = entry.pk
+            placed.setdefault(settings.SHARDS[entry.pk % len(settings.SHARDS)], []).append(group)
+        for shard, shard_groups in placed.items():
+            if shard != settings.SHARDS[0]:
+                cls.objects.filter(pk__in=[group.pk for group in shard_groups]).update(shard=shard)
+        return placed
+
+    def __str__(self):
+        return f"{self.pk}: {self.shard}"
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
@@ -0,0 +1,31 @@
+"""
+Pagination classes for the TrackEase API application.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class MemberPagination(CursorPagination):
+    """
+    Keyset pagination for group member listings.
+
+    Pages are fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n``, which
+    walks the (group, user) index of the membership table and never needs a
+    ``COUNT(*)`` or an ``OFFSET``, so large groups page in constant time.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class LedgerPagination(CursorPagination):
+    """Keyset pagination for a group's ledger, newest entries first."""
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,258 @@
+"""
+On-demand sampling profiler for the TrackEase API application.
+
+A profiling session samples the stacks of the threads that are serving
+requests in every worker process for a number of seconds, and returns the
+samples as collapsed stacks (``flamegraph.pl``, speedscope and most flame
+graph tools read them) or as a speedscope profile. Every stack starts with
+the view it was sampled in, e.g. ``ExpenseViewSet.list`` or
+``LoginAPI.post``.
+
+Sampling is timer based: a daemon thread wakes every ``interval`` seconds
+and reads ``sys._current_frames()``. Unlike ``SIGPROF`` it also sees the
+request threads of threaded workers, and no code runs inside the sampled
+threads. Outside a session the only cost is
+``api.middleware.ProfilingMiddleware`` comparing a timestamp on every
+request.
+
+Sessions are announced through the cache: ``start_session`` stores the
+session, and every worker that serves a request within
+``PROFILING_POLL_SECONDS`` starts its own sampler and stores its samples
+in the cache when the session ends. Once the session is ``ready``,
+``results`` merges them, in whichever process asks. This needs a cache
+shared by all workers; with a process-local one, sessions are refused.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+SESSION_KEY = 'profiling:session'
+MAX_DEPTH = 128
+
+_lock = threading.Lock()
+# Thread ID -> view name of the requests being served while sampling.
+_views = {}
+_state = {'sampler': None, 'session': None, 'next_poll': 0.0}
+
+
+def view_name(view_func, request):
+    """Return ``Class.action`` for a resolved view, e.g. ``ExpenseViewSet.list``."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    return f'{cls.__name__}.{action}'
+
+
+def track(thread_id, view):
+    """Sample the thread ``thread_id`` as serving ``view`` until ``untrack``."""
+    _views[thread_id] = view
+
+
+def retag(thread_id, view):
+    """Change the view of a sampled thread once the URL is resolved."""
+    if thread_id in _views:
+        _views[thread_id] = view
+
+
+def untrack(thread_id):
+    _views.pop(thread_id, None)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class Sampler(threading.Thread):
+    """Daemon thread that counts the collapsed stacks of request threads."""
+
+    def __init__(self, session):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.session = session
+        self.counts = Counter()
+        self.names = {}
+
+    def sample(self):
+        frames = sys._current_frames()
+        for thread_id, view in list(_views.items()):
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                name = self.names.get(code)
+                if name is None:
+                    name = self.names[code] = frame_name(frame)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                stack.append(view)
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def run(self):
+        interval = self.session['interval']
+        try:
+            while time.time() < self.session['until']:
+                self.sample()
+                time.sleep(interval)
+        finally:
+            with _lock:
+                _views.clear()
+                _state['sampler'] = None
+            store_samples(self.session, self.counts)
+
+
+def store_samples(session, counts):
+    """Store the samples of this process for the collector of ``session``."""
+    key = f"profiling:{session['id']}"
+    cache.add(f'{key}:workers', 0, session['ttl'])
+    try:
+        slot = cache.incr(f'{key}:workers')
+    except ValueError:
+        return
+    cache.set(f'{key}:{slot}', {'pid': os.getpid(), 'counts': dict(counts)}, session['ttl'])
+
+
+def join(session):
+    """Start sampling this process for ``session`` unless a sampler is already running."""
+    with _lock:
+        if _state['sampler'] is not None or time.time() >= session['until']:
+            return
+        if _state['session'] == session['id']:
+            return
+        _state['session'] = session['id']
+        _state['sampler'] = Sampler(session)
+        _state['sampler'].start()
+
+
+def poll():
+    """Join the current session, looking it up at most every ``PROFILING_POLL_SECONDS``."""
+    now = time.monotonic()
+    if now < _state['next_poll']:
+        return _state['sampler'] is not None
+    _state['next_poll'] = now + settings.PROFILING_POLL_SECONDS
+    session = cache.get(SESSION_KEY)
+    if session:
+        join(session)
+    return _state['sampler'] is not None
+
+
+def start_session(seconds, interval):
+    """Announce a profiling session to all workers; return the session."""
+    seconds = min(float(seconds), settings.PROFILING_MAX_SECONDS)
+    session = {
+        'id': uuid.uuid4().hex,
+        'until': time.time() + seconds,
+        'interval': max(float(interval), 0.001),
+        # Workers store their samples up to one poll after the session.
+        'ttl': int(seconds + settings.PROFILING_POLL_SECONDS) + 60,
+    }
+    cache.set(SESSION_KEY, session, int(seconds) + 1)
+    cache.set(f"profiling:{session['id']}:session", session, session['ttl'])
+    return session
+
+
+def get_session(session_id):
+    """Return the session ``session_id`` while its samples are kept, or None."""
+    return cache.get(f'profiling:{session_id}:session')
+
+
+def ready_at(session):
+    """Return when every worker has stored its samples of ``session``."""
+    return session['until'] + settings.PROFILING_POLL_SECONDS + 1
+
+
+def collect(session):
+    """Wait until ``session`` is ready and return its results, see ``results``."""
+    time.sleep(max(0.0, ready_at(session) - time.time()))
+    return results(session)
+
+
+def results(session):
+    """
+    Return the merged samples of all workers for a ready ``session``.
+
+    Returns ``({collapsed stack: count}, number of workers)``.
+    """
+    key = f"profiling:{session['id']}"
+    counts = Counter()
+    workers = cache.get(f'{key}:workers') or 0
+    for result in cache.get_many([f'{key}:{slot}' for slot in range(1, workers + 1)]).values():
+        counts.update(result['counts'])
+    return counts, workers
+
+
+def profile(seconds, interval, local=True):
+    """
+    Run a session and return its samples, see ``collect``.
+
+    With ``local`` the calling process is sampled too; its calling thread
+    is left out.
+    """
+    session = start_session(seconds, interval)
+    if local:
+        untrack(threading.get_ident())
+        join(session)
+    return collect(session)
+
+
+def collapsed(counts):
+    """Return ``counts`` as collapsed stacks, one ``frame;frame;frame count`` line per stack."""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(counts.items()))
+
+
+def speedscope(counts, interval, name='TrackEase'):
+    """Return ``counts`` as a speedscope file with one sampled profile per view."""
+    frames, index = [], {}
+    profiles = {}
+    for stack, count in sorted(counts.items()):
+        view, *names = stack.split(';')
+        samples = []
+        for frame in names:
+            if frame not in index:
+                index[frame] = len(frames)
+                module, _, function = frame.partition(':')
+                frames.append({'name': function, 'file': module})
+            samples.append(index[frame])
+        profile_data = profiles.setdefault(view, {'samples': [], 'weights': []})
+        profile_data['samples'].append(samples)
+        profile_data['weights'].append(round(count * interval * 1000, 3))
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'trackease',
+        'shared': {'frames': frames},
+        'profiles': [
+            {
+                'type': 'sampled',
+                'name': view,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round(sum(profile_data['weights']), 3),
+                'samples': profile_data['samples'],
+                'weights': profile_data['weights'],
+            }
+            for view, profile_data in sorted(profiles.items())
+        ],
+    }
+
+
+def render(counts, output_format, interval):
+    """Return ``(body, content type)`` of ``counts`` in ``collapsed`` or ``speedscope`` format."""
+    if output_format == 'speedscope':
+        return json.dumps(speedscope(counts, interval)), 'application/json'
+    return collapsed(counts), 'text/plain; charset=utf-8'
+
@@ -0,0 +1,139 @@
+"""
+Recurring expense scheduling for the TrackEase API application.
+
+Due templates are found through the ``(is_active, next_due)`` index and all
+of their missed periods are materialized in one batch: one ``bulk_create``
+for the expenses and one for their shares. The unique constraint on
+``(recurring, occurrence_date)`` makes re-runs idempotent.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, ledger, sharding
+from .models import Expense, ExpenseShare, Group, LedgerEntry, RecurringExpense
+from .splits import split_evenly
+
+
+def shift(start, frequency, periods):
+    """Return the date ``periods`` occurrences after ``start``."""
+    if frequency == RecurringExpense.DAILY:
+        return start + timedelta(days=periods)
+    if frequency == RecurringExpense.WEEKLY:
+        return start + timedelta(weeks=periods)
+    months = periods * (12 if frequency == RecurringExpense.YEARLY else 1)
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    # Clamp to the end of shorter months without drifting the anchor day.
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return start.replace(year=year, month=month, day=day)
+
+
+def periods_until(start, frequency, day):
+    """Return the number of whole periods from ``start`` to ``day``, at least 0."""
+    if frequency == RecurringExpense.DAILY:
+        periods = (day - start).days
+    elif frequency == RecurringExpense.WEEKLY:
+        periods = (day - start).days // 7
+    else:
+        months = (day.year - start.year) * 12 + day.month - start.month
+        periods = months // 12 if frequency == RecurringExpense.YEARLY else months
+        if shift(start, frequency, periods) > day:
+            periods -= 1
+    return max(periods, 0)
+
+
+def due_dates(template, today):
+    """Return every occurrence date of ``template`` from ``next_due`` up to ``today``."""
+    last = min(today, template.end_date) if template.end_date else today
+    dates = []
+    # Start at the period of next_due instead of walking every past one;
+    # occurrences are still shifted from start_date so month ends do not drift.
+    periods = periods_until(template.start_date, template.frequency, template.next_due)
+    occurrence = shift(template.start_date, template.frequency, periods)
+    while occurrence <= last:
+        if occurrence >= template.next_due:
+            dates.append(occurrence)
+        periods += 1
+        occurrence = shift(template.start_date, template.frequency, periods)
+    return dates, occurrence
+
+
+def materialize_due(today=None):
+    """
+    Create the expenses and shares of every due recurring template.
+
+    Every shard is processed in its own transaction. Templates whose payer
+    is no longer a member of the group are skipped. Returns the number of
+    expenses created.
+    """
+    today = today or timezone.localdate()
+    created = 0
+    for alias in sharding.all_shards():
+        with sharding.use_shard(alias):
+            created += _materialize_due(alias, today)
+    return created
+
+
+def _materialize_due(alias, today):
+    with transaction.atomic(using=alias):
+        templates = list(
+            RecurringExpense.objects.select_for_update()
+            .filter(is_active=True, next_due__lte=today)
+        )
+        if not templates:
+            return 0
+
+        members = defaultdict(list)
+        for group_id, user_id in Group.members.through.objects.filter(
+            group_id__in={template.group_id for template in templates}
+        ).order_by('user_id').values_list('group_id', 'user_id'):
+            members[group_id].append(user_id)
+
+        existing = set(
+            Expense.objects.filter(recurring__in=templates)
+            .values_list('recurring_id', 'occurrence_date')
+        )
+
+        expenses = []
+        for template in templates:
+            dates, next_due = due_dates(template, today)
+            if template.paid_by_id not in members[template.group_id]:
+                # The payer has left the group: its occurrences are not
+                # created, and the template moves past them.
+                dates = []
+            for occurrence in dates:
+                if (template.id, occurrence) in existing:
+                    continue
+                expenses.append(Expense(
+                    group_id=template.group_id,
+                    description=template.description,
+                    amount=template.amount,
+                    currency=template.currency,
+                    paid_by_id=template.paid_by_id,
+                    date=occurrence,
+                    recurring=template,
+                    occurrence_date=occurrence,
+                ))
+            template.next_due = next_due
+            template.is_active = not template.end_date or next_due <= template.end_date
+
+        Expense.objects.bulk_create(expenses)
+        counters.expenses_added(expenses)
+        shares = ExpenseShare.objects.bulk_create([
+            ExpenseShare(expense=expense, user_id=user_id, amount=share)
+            for expense in expenses
+            for user_id, share in split_evenly(expense.amount, members[expense.group_id])
+        ])
+        ledger.record([ledger.share_row(share) for share in shares], LedgerEntry.SHARE)
+        RecurringExpense.objects.bulk_update(templates, ['next_due', 'is_active'])
+
+    return len(expenses)
@@ -0,0 +1,195 @@
+"""
+Renderers for the TrackEase API application.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import importlib.util
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+
+class Columns:
+    """
+    Column-oriented result set for binary renderers.
+
+    ``types`` holds one of ``'int'``, ``'bool'``, ``'string'``, ``'date'``
+    (days since the epoch), ``'timestamp'`` (microseconds since the epoch,
+    UTC) or ``('decimal', scale)`` (fixed-point integers) per column.
+    """
+
+    def __init__(self, names, types, values):
+        self.names = names
+        self.types = types
+        self.values = values
+
+    def __len__(self):
+        return len(self.values[0]) if self.values else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson.
+
+    Produces the same bytes as DRF's compact JSONRenderer: types orjson does
+    not handle the same way (dates, times, decimals, lazy strings) are passed
+    to DRF's encoder, and U+2028/U+2029 are escaped. Indented output and
+    anything orjson cannot encode fall back to JSONRenderer.
+    """
+    default = JSONEncoder().default
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+    def render_stream(self, chunks, count):
+        """Yield one JSON array built from chunks of rows."""
+        yield b'['
+        separator = b''
+        for rows in chunks:
+            if rows:
+                yield separator + self.render(rows)[1:-1]
+                separator = b','
+        yield b']'
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer which serializes to MessagePack.
+
+    Uses the same representation as the JSON renderers, so clients can
+    switch formats without changing how they read responses.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.default, use_bin_type=True)
+
+    def render_stream(self, chunks, count):
+        """Yield one MessagePack array of ``count`` rows built from chunks of rows."""
+        import msgpack
+
+        packer = msgpack.Packer(default=self.default, use_bin_type=True)
+        yield packer.pack_array_header(count)
+        for rows in chunks:
+            yield b''.join(packer.pack(row) for row in rows)
+
+
+class ArrowRenderer(BaseRenderer):
+    """
+    Renderer which serializes to an Apache Arrow IPC stream.
+
+    Column-oriented ``Columns`` results keep their native types: fixed-point
+    amounts are int64 columns with a ``scale`` metadata entry and datetimes
+    are int64 microsecond timestamps. Other data (e.g. error responses) is
+    rendered as a table of its rows.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import pyarrow as pa
+
+        if data is None:
+            return b''
+        if isinstance(data, Columns):
+            table = self.table(data)
+        else:
+            rows = data if isinstance(data, list) else [data]
+            table = pa.Table.from_pylist(json.loads(JSONRenderer().render(rows)))
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def render_stream(self, chunks, count):
+        """Yield one Arrow IPC stream with a record batch per chunk of ``Columns``."""
+        import pyarrow as pa
+
+        sink = io.BytesIO()
+        writer = None
+        for columns in chunks:
+            table = self.table(columns)
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, table.schema)
+            writer.write_table(table)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        if writer is not None:
+            writer.close()
+            yield sink.getvalue()
+
+    @staticmethod
+    def table(columns):
+        """Return a pyarrow Table for ``Columns`` with their native types."""
+        import pyarrow as pa
+
+        fields, arrays = [], []
+        for name, column_type, values in zip(columns.names, columns.types, columns.values):
+            metadata = None
+            if column_type == 'timestamp':
+                arrow_type = pa.timestamp('us', tz='UTC')
+            elif column_type == 'date':
+                arrow_type = pa.date32()
+            elif column_type == 'bool':
+                arrow_type = pa.bool_()
+            elif column_type == 'string':
+                arrow_type = pa.string()
+            else:
+                arrow_type = pa.int64()
+                if isinstance(column_type, tuple):
+                    metadata = {'scale': str(column_type[1])}
+            fields.append(pa.field(name, arrow_type, metadata=metadata))
+            arrays.append(pa.array(values, type=arrow_type))
+        return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+# Binary renderers are offered only when their libraries are installed;
+# pyarrow is optional and not part of requirements.txt.
+BINARY_RENDERERS = [
+    renderer for renderer, module in ((MessagePackRenderer, 'msgpack'), (ArrowRenderer, 'pyarrow'))
+    if importlib.util.find_spec(module) is not None
+]
@@ -6,6 +6,14 @@ This module defines the serializers used to convert model instances to JSON and
 2. GroupSerializer - For group data serialization
 3. ExpenseSerializer - For expense data serialization
 4. ExpenseShareSerializer - For expense share data serialization
+5. ArchivedExpenseSerializer - For archived expense serialization
+6. ArchivedExpenseShareSerializer - For archived expense share serialization
+7. RecurringExpenseSerializer - For recurring expense template serialization
+8. BalanceSerializer - For member balance serialization
+9. LedgerEntrySerializer - For balance ledger serialization
+
+User, group, expense and share serializers support ``?fields=`` and
+``?expand=`` (see ``api.fieldsets``).
 
 @author Nandeesh Kantli
 @date April 4, 2024
@@ -13,11 +21,22 @@ This module defines the serializers used to convert model instances to JSON and
 """
 
 from rest_framework import serializers
-from .models import Group, Expense, User
+from .models import Group, Expense, ExpenseShare, ArchivedExpense, ArchivedExpenseShare, LedgerEntry, RecurringExpense, User
 from django.contrib.auth.models import User as AuthUser
 from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
+from . import fx
+from .email_filter import email_exists
+from .fieldsets import FieldsetSerializerMixin
+
+def validate_currency_code(value):
+    """Normalize a currency code and check that it can be converted."""
+    value = value.upper()
+    if value not in fx.currencies():
+        raise serializers.ValidationError("No exchange rates are known for this currency")
+    return value
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the User model.
     
@@ -39,9 +58,16 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'password', 'first_name', 'last_name')
         extra_kwargs = {
             'password': {'write_only': True},
-            'username': {'required': False}
+            'username': {'required': False},
+            # Uniqueness is checked in validate_email through the email filter.
+            'email': {'validators': []}
         }
 
+    def validate_email(self, value):
+        if email_exists(value):
+            raise serializers.ValidationError("user with this email address already exists.")
+        return value
+
     def validate(self, data):
         # Use email as username if not provided
         if 'username' not in data:
@@ -49,13 +75,18 @@ class RegisterSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
-            first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', '')
-        )
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=validated_data['username'],
+                    email=validated_data['email'],
+                    password=validated_data['password'],
+                    first_name=validated_data.get('first_name', ''),
+                    last_name=validated_data.get('last_name', '')
+                )
+        except IntegrityError:
+            # The account was created concurrently after validation.
+            raise serializers.ValidationError({'email': ["user with this email address already exists."]})
         return user
 
 class LoginSerializer(serializers.Serializer):
@@ -68,7 +99,7 @@ class LoginSerializer(serializers.Serializer):
             return user
         raise serializers.ValidationError("Invalid email or password")
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Group model.
     
@@ -76,13 +107,37 @@ class GroupSerializer(serializers.ModelSerializer):
     - Group data serialization
     - Member list serialization
     - Creator information
+    - Summary counters (members, expenses, total in the base currency)
     """
     class Meta:
         model = Group
-        fields = ['id', 'name', 'description', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = [
+            'id', 'name', 'description', 'created_at', 'updated_at', 'version',
+            'member_count', 'expense_count', 'total_amount', 'last_activity_at'
+        ]
+        read_only_fields = [
+            'created_at', 'updated_at', 'version',
+            'member_count', 'expense_count', 'total_amount', 'last_activity_at'
+        ]
+        expandable_fields = {
+            'created_by': (UserSerializer, {}),
+            'members': (UserSerializer, {'many': True}),
+        }
+
+class ExpenseShareSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for the ExpenseShare model.
 
-class ExpenseSerializer(serializers.ModelSerializer):
+    Handles:
+    - Share amount and settlement state of a member
+    """
+    class Meta:
+        model = ExpenseShare
+        fields = ['id', 'expense', 'user', 'amount', 'is_settled', 'settled_at']
+        read_only_fields = fields
+        expandable_fields = {'user': (UserSerializer, {})}
+
+class ExpenseSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Expense model.
     
@@ -94,4 +149,92 @@ class ExpenseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Expense
         fields = '__all__'
-        read_only_fields = ['user']
+        read_only_fields = ['user', 'recurring', 'occurrence_date', 'version']
+        expandable_fields = {
+            'paid_by': (UserSerializer, {}),
+            'group': (GroupSerializer, {}),
+            'shares': (ExpenseShareSerializer, {'many': True}),
+        }
+
+    def validate_currency(self, value):
+        return validate_currency_code(value)
+
+class ArchivedExpenseShareSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Read-only serializer for the ArchivedExpenseShare model.
+
+    Produces the same representation as ExpenseShareSerializer.
+    """
+    class Meta:
+        model = ArchivedExpenseShare
+        fields = ExpenseShareSerializer.Meta.fields
+        read_only_fields = fields
+        expandable_fields = ExpenseShareSerializer.Meta.expandable_fields
+
+class ArchivedExpenseSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Read-only serializer for the ArchivedExpense model.
+
+    Produces the same representation as ExpenseSerializer, so archived and
+    current expenses can be listed together.
+    """
+    class Meta:
+        model = ArchivedExpense
+        exclude = ['archived_at']
+        read_only_fields = [field.name for field in ArchivedExpense._meta.fields]
+        expandable_fields = {
+            **ExpenseSerializer.Meta.expandable_fields,
+            'shares': (ArchivedExpenseShareSerializer, {'many': True}),
+        }
+
+class RecurringExpenseSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the RecurringExpense model.
+
+    Handles:
+    - Template and schedule serialization
+    - Scheduling state (next due date, active flag)
+    """
+    class Meta:
+        model = RecurringExpense
+        fields = '__all__'
+        read_only_fields = ['paid_by', 'next_due', 'created_at']
+
+    def validate_currency(self, value):
+        return validate_currency_code(value)
+
+    def validate_group(self, value):
+        # Occurrences are paid by the requesting user and split among the
+        # group's members, so only members may schedule them.
+        request = self.context.get('request')
+        if request is not None and not value.members.filter(pk=request.user.pk).exists():
+            raise serializers.ValidationError("You are not a member of this group")
+        return value
+
+    def validate(self, data):
+        start_date = data.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = data.get('end_date', getattr(self.instance, 'end_date', None))
+        if end_date and start_date and end_date < start_date:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        return data
+
+class BalanceSerializer(serializers.Serializer):
+    """
+    Serializer for member balances computed by ``api.balances``.
+
+    Handles:
+    - Net balance of a member within a group, in the requested currency
+    """
+    user = serializers.IntegerField()
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    """
+    Serializer for ledger entries recorded by ``api.ledger``.
+
+    Handles:
+    - Balance change of a member in the base currency and its cause
+    """
+    class Meta:
+        model = LedgerEntry
+        fields = ['id', 'user', 'amount', 'kind', 'expense_id', 'share_id', 'created_at']
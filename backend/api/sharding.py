@@ -0,0 +1,546 @@
+"""
+Horizontal sharding of group data for the TrackEase API application.
+
+A group and everything that belongs to it (expenses, shares, archived
+expenses, recurring templates, ledger entries and balance snapshots) live
+together on one shard database, listed in ``settings.SHARDS``. Users, auth
+tokens, profiles, exchange rates, idempotency keys, group memberships and
+the GroupShard directory stay in the ``default`` database. Without
+``DB_SHARDS`` the only shard is ``default`` itself.
+
+The directory maps every group ID to its shard and hands out group IDs,
+so they are unique across shards. Rows of the other sharded tables get IDs
+from a range reserved for the shard they are created on (see
+``reserve_id_ranges``), so they are unique too and ``locate_group`` knows where
+to look first. ``move_group`` (run by the ``rebalance_shards`` management
+command) keeps the IDs of a group and of its archived rows, but the other
+rows get new IDs from the range of the new shard.
+
+``ShardRouter`` sends global models to ``default`` and sharded models to
+the database of the instance a query is about, or else to the shard
+activated with ``use_shard``. ``ShardedViewMixin`` activates the shard of
+the group a request is about; listings of a user's groups query the
+shards holding them in parallel (``fan_out``) and merge the results.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import contextvars
+import functools
+import heapq
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models, transaction
+from django.db.models.signals import post_delete, post_migrate, pre_delete
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .conditional import collection_etag, etag_matches, not_modified
+from .fast_serialization import FastListMixin
+from .fieldsets import requested
+from .models import (
+    ArchivedExpense, ArchivedExpenseShare, BalanceSnapshot, Expense, ExpenseShare, Group, GroupShard,
+    LedgerEntry, RecurringExpense, User
+)
+
+GLOBAL = 'default'
+VERSION_KEY = 'shards:version'
+# IDs created on the n-th shard start at (n + 1) << ID_RANGE_BITS.
+ID_RANGE_BITS = 40
+
+SHARDED_MODELS = (
+    Group, RecurringExpense, Expense, ExpenseShare, ArchivedExpense, ArchivedExpenseShare,
+    LedgerEntry, BalanceSnapshot,
+)
+
+_active = contextvars.ContextVar('active_shard', default=None)
+_lock = threading.Lock()
+_directory = {'version': None, 'groups': {}}
+_pool = {'executor': None}
+
+
+class GroupMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = {'error': 'The group is being moved to another database; retry shortly'}
+    default_code = 'group_moving'
+
+
+def is_sharded(model):
+    return model in SHARDED_MODELS
+
+
+def single():
+    """Return whether all group data lives in the default database."""
+    return settings.SHARDS == [GLOBAL]
+
+
+def all_shards():
+    """Return every database that may hold group data, ``default`` included."""
+    return list(dict.fromkeys([*settings.SHARDS, GLOBAL]))
+
+
+@contextmanager
+def use_shard(alias):
+    """Route queries of sharded models without a more specific hint to ``alias``."""
+    token = _active.set(alias)
+    try:
+        yield alias
+    finally:
+        _active.reset(token)
+
+
+def invalidate():
+    """Drop the cached directory in every process sharing the cache backend."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    with _lock:
+        _directory.update(version=None, groups={})
+
+
+def _entries(group_ids):
+    """Return ``{group_id: (shard, moving)}`` for ``group_ids``, cached per process."""
+    version = cache.get(VERSION_KEY, 0)
+    if _directory['version'] != version:
+        with _lock:
+            _directory.update(version=version, groups={})
+    groups = _directory['groups']
+    missing = [group_id for group_id in group_ids if group_id not in groups]
+    if missing:
+        found = {
+            group_id: (shard, moving)
+            for group_id, shard, moving in GroupShard.objects.filter(pk__in=missing).values_list(
+                'pk', 'shard', 'moving'
+            )
+        }
+        # Moving groups are looked up again until the move is over.
+        groups.update((group_id, entry) for group_id, entry in found.items() if not entry[1])
+        return {group_id: groups.get(group_id) or found.get(group_id) for group_id in group_ids}
+    return {group_id: groups[group_id] for group_id in group_ids}
+
+
+def _group_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def shard_for_group(group_id):
+    """Return the database holding a group, or None for unknown groups."""
+    if single():
+        return GLOBAL
+    group_id = _group_id(group_id)
+    if group_id is None:
+        return None
+    entry = _entries([group_id])[group_id]
+    return entry[0] if entry else None
+
+
+def check_not_moving(group_id):
+    """Raise GroupMoving if the group is being copied to another shard."""
+    group_id = _group_id(group_id)
+    if single() or group_id is None:
+        return
+    entry = _entries([group_id])[group_id]
+    if entry and entry[1]:
+        raise GroupMoving()
+
+
+def shards_for_groups(group_ids):
+    """Return ``{shard: [group_id, ...]}`` for ``group_ids``."""
+    if single():
+        return {GLOBAL: list(group_ids)} if group_ids else {}
+    by_shard = defaultdict(list)
+    for group_id, entry in _entries(list(group_ids)).items():
+        if entry:
+            by_shard[entry[0]].append(group_id)
+    return dict(by_shard)
+
+
+def user_group_ids(user):
+    """Return the IDs of the groups ``user`` is a member or the creator of, in one query."""
+    memberships = Group.members.through.objects.filter(user=user).values('group_id')
+    return list(
+        GroupShard.objects.filter(models.Q(created_by=user) | models.Q(pk__in=memberships))
+        .order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def locate_group(model, pk):
+    """Return the ID of the group the ``model`` row ``pk`` belongs to, or None."""
+    pk = _group_id(pk)
+    if model is Group or pk is None:
+        return pk
+    shards = all_shards()
+    # Try the shard the ID was created on first.
+    origin = (pk >> ID_RANGE_BITS) - 1
+    if 0 <= origin < len(settings.SHARDS):
+        shards.remove(settings.SHARDS[origin])
+        shards.insert(0, settings.SHARDS[origin])
+    for alias in shards:
+        group_id = model._base_manager.using(alias).filter(pk=pk).values_list(
+            'expense__group_id' if model in (ExpenseShare, ArchivedExpenseShare) else 'group_id', flat=True
+        ).first()
+        if group_id is not None:
+            return group_id
+    return None
+
+
+def _executor():
+    if _pool['executor'] is None:
+        with _lock:
+            if _pool['executor'] is None:
+                _pool['executor'] = ThreadPoolExecutor(
+                    max_workers=len(all_shards()), thread_name_prefix='shard'
+                )
+    return _pool['executor']
+
+
+def fan_out(function, aliases):
+    """
+    Call ``function(alias)`` for every alias in parallel; return the results in order.
+
+    Every call runs with its shard activated. The worker threads keep their
+    own database connections open between calls.
+    """
+    aliases = list(aliases)
+    if len(aliases) == 1:
+        with use_shard(aliases[0]):
+            return [function(aliases[0])]
+
+    def run(alias):
+        with use_shard(alias):
+            try:
+                return function(alias)
+            finally:
+                connections[alias].close_if_unusable_or_obsolete()
+
+    return list(_executor().map(run, aliases))
+
+
+def merge(results, key='id'):
+    """Merge lists of rows that are each sorted by ``key``."""
+    return list(heapq.merge(*results, key=itemgetter(key)))
+
+
+class ShardRouter:
+    """
+    Database router for sharded group data.
+
+    Global models always use ``default``. Sharded models use the database
+    of the instance in the hints, the shard of its group, or the active
+    shard, in that order; ``default`` when none applies. Migrations run on
+    every database, so all databases share one schema.
+    """
+
+    def _route(self, model, hints):
+        if not is_sharded(model):
+            return GLOBAL
+        instance = hints.get('instance')
+        if instance is not None:
+            if is_sharded(type(instance)) and instance._state.db:
+                return instance._state.db
+            group_id = instance.pk if isinstance(instance, Group) else getattr(instance, 'group_id', None)
+            if group_id is not None:
+                shard = shard_for_group(group_id)
+                if shard:
+                    return shard
+            for related in instance._state.fields_cache.values():
+                if related is not None and is_sharded(type(related)) and related._state.db:
+                    return related._state.db
+        return _active.get() or GLOBAL
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows reference users in the default database.
+        return True
+
+
+class ShardedViewMixin:
+    """
+    ViewSet and view mixin that activates the shard a request is about.
+
+    Detail routes use the shard holding the object (``shard_model`` by
+    ``lookup_field``, or the group in ``shard_group_kwarg``); creates use
+    the shard of the ``group`` in the request body. Writes to a group that is
+    being moved are answered with 503. ``list`` queries the shards holding
+    the user's groups in parallel and merges the rows by ID.
+    """
+    shard_model = None
+    shard_group_kwarg = None
+
+    def request_shard(self, request, kwargs):
+        """Return the shard to activate for the request, or None."""
+        if single():
+            return None
+        lookup = getattr(self, 'lookup_url_kwarg', None) or getattr(self, 'lookup_field', None)
+        if self.shard_group_kwarg and self.shard_group_kwarg in kwargs:
+            group_id = kwargs[self.shard_group_kwarg]
+        elif lookup and kwargs.get(lookup):
+            group_id = locate_group(self.shard_model or self.queryset.model, kwargs[lookup])
+        elif request.method == 'POST' and isinstance(request.data, dict):
+            group_id = request.data.get('group')
+        else:
+            return None
+        if group_id is None:
+            return None
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            check_not_moving(group_id)
+        return shard_for_group(group_id)
+
+    def user_group_ids(self):
+        """Return the IDs of the requesting user's groups, read once per request."""
+        if not hasattr(self, '_user_group_ids'):
+            self._user_group_ids = user_group_ids(self.request.user)
+        return self._user_group_ids
+
+    def list_shards(self):
+        """Return the shards holding the requesting user's groups."""
+        return sorted(shards_for_groups(self.user_group_ids())) or [GLOBAL]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        shard = self.request_shard(request, kwargs)
+        if shard:
+            self._shard_token = _active.set(shard)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _active.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        shards = self.list_shards()
+        if len(shards) == 1:
+            with use_shard(shards[0]):
+                return super().list(request, *args, **kwargs)
+
+        querysets = {alias: self.filter_queryset(self.get_queryset()).using(alias) for alias in shards}
+        # Only the views with the fast list path carry collection ETags.
+        fast = isinstance(self, FastListMixin)
+        etag = collection_etag(request, *querysets.values()) if fast else None
+        if fast and etag_matches(request, etag):
+            return not_modified(etag)
+        serializer_class = self.get_serializer_class()
+        fields, expand = requested(request)
+        # Rows are merged by ID, which a ?fields= fieldset may leave out.
+        keyed = fields is not None and 'id' not in fields
+
+        def rows(alias):
+            queryset = querysets[alias].order_by('pk')
+            if fast:
+                data = self.serialized_rows(queryset)
+            else:
+                data = serializer_class(queryset, many=True, context=self.get_serializer_context()).data
+            if keyed:
+                data = [{'id': pk, 'row': row} for pk, row in zip(queryset.values_list('pk', flat=True), data)]
+            return data
+
+        data = merge(fan_out(rows, shards))
+        response = Response([row['row'] for row in data] if keyed else data)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+
+def delete_everywhere(queryset):
+    """Delete the rows matching ``queryset`` on every shard; return the number deleted."""
+    return sum(queryset.using(alias).delete()[0] for alias in all_shards())
+
+
+@receiver(post_delete, sender=Group)
+def delete_group_entries(sender, instance, using, **kwargs):
+    # Memberships and the directory are in the default database; on a
+    # single database the cascade has already removed the memberships.
+    if using != GLOBAL:
+        Group.members.through.objects.filter(group_id=instance.pk).delete()
+    GroupShard.objects.filter(pk=instance.pk).delete()
+    invalidate()
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_data(sender, instance, using, **kwargs):
+    # The cascade only reaches rows in the user's own database.
+    if single():
+        return
+    for relation in User._meta.related_objects:
+        if is_sharded(relation.related_model) and relation.on_delete is models.CASCADE:
+            for alias in all_shards():
+                if alias != using:
+                    relation.related_model._base_manager.using(alias).filter(
+                        **{relation.field.name: instance}
+                    ).delete()
+
+
+# Children before parents, so the foreign keys within a shard hold.
+PURGE_ORDER = (
+    ArchivedExpenseShare, ExpenseShare, LedgerEntry, BalanceSnapshot, ArchivedExpense, Expense,
+    RecurringExpense, Group,
+)
+
+
+def _group_rows(model, alias, group_id):
+    if model is Group:
+        lookup = 'pk'
+    elif model in (ExpenseShare, ArchivedExpenseShare):
+        lookup = 'expense__group_id'
+    else:
+        lookup = 'group_id'
+    return model._base_manager.using(alias).filter(**{lookup: group_id})
+
+
+def purge_group(group_id, alias):
+    """
+    Delete the rows of a group from ``alias`` only.
+
+    The deletes are raw: the cascade would also remove the memberships in
+    ``default``, and the counters and the ledger must not see them.
+    """
+    for model in PURGE_ORDER:
+        _group_rows(model, alias, group_id)._raw_delete(alias)
+
+
+def _copy_rows(queryset, target, renumber=False, remap=None):
+    """
+    Insert the rows of ``queryset`` into ``target``; return ``{old ID: new ID}``.
+
+    ``remap`` maps attribute names to ``{old ID: new ID}`` of rows copied
+    before. Timestamps are kept, although ``bulk_create`` stamps them.
+    """
+    model = queryset.model
+    rows = list(queryset.order_by('pk'))
+    old_ids = [row.pk for row in rows]
+    stamped = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    stamps = [[getattr(row, field.attname) for field in stamped] for row in rows]
+    for row in rows:
+        for attname, ids in (remap or {}).items():
+            setattr(row, attname, ids.get(getattr(row, attname), getattr(row, attname)))
+        if renumber:
+            row.pk = None
+    model._base_manager.using(target).bulk_create(rows, batch_size=1000)
+    if stamped and rows:
+        for row, row_stamps in zip(rows, stamps):
+            for field, value in zip(stamped, row_stamps):
+                setattr(row, field.attname, value)
+        model._base_manager.using(target).bulk_update(rows, [field.name for field in stamped], batch_size=1000)
+    return dict(zip(old_ids, (row.pk for row in rows)))
+
+
+def _copy_group(group_id, source, target):
+    rows = functools.partial(_group_rows, alias=source, group_id=group_id)
+    _copy_rows(rows(Group), target)
+    recurring = _copy_rows(rows(RecurringExpense), target, renumber=True)
+    expenses = _copy_rows(rows(Expense), target, renumber=True, remap={'recurring_id': recurring})
+    shares = _copy_rows(rows(ExpenseShare), target, renumber=True, remap={'expense_id': expenses})
+    # Archived rows keep the IDs their expense and shares had when archived.
+    _copy_rows(rows(ArchivedExpense), target, remap={'recurring_id': recurring})
+    _copy_rows(rows(ArchivedExpenseShare), target)
+    # New IDs keep the ledger behind the snapshot watermark of the new
+    # shard; the snapshots of the group are dropped and taken again.
+    _copy_rows(rows(LedgerEntry), target, renumber=True, remap={'expense_id': expenses, 'share_id': shares})
+
+
+def move_group(group_id, target, wait=0):
+    """
+    Move a group and all of its rows to the shard ``target``.
+
+    The group is marked as moving, so writes to it are refused while reads
+    still use the old shard; after ``wait`` seconds, for writes that were
+    already running, its rows are copied to ``target``; the
+    directory is flipped; and the rows are deleted from the old shard. A
+    move that was interrupted is cleaned up by ``finish_moves``.
+    """
+    source = GroupShard.objects.values_list('shard', flat=True).get(pk=group_id)
+    if source == target:
+        return
+    GroupShard.objects.filter(pk=group_id).update(moving=True)
+    invalidate()
+    time.sleep(wait)
+    with transaction.atomic(using=target):
+        purge_group(group_id, target)
+        _copy_group(group_id, source, target)
+    GroupShard.objects.filter(pk=group_id).update(shard=target)
+    invalidate()
+    with transaction.atomic(using=source):
+        purge_group(group_id, source)
+    GroupShard.objects.filter(pk=group_id).update(moving=False)
+    invalidate()
+
+
+def finish_moves():
+    """
+    Clean up interrupted moves; return the IDs of the groups concerned.
+
+    The shard in the directory holds the complete copy of a moving group,
+    so the rows on every other shard are deleted.
+    """
+    group_ids = []
+    for group_id, shard in GroupShard.objects.filter(moving=True).values_list('pk', 'shard'):
+        for alias in all_shards():
+            if alias != shard:
+                with transaction.atomic(using=alias):
+                    purge_group(group_id, alias)
+        GroupShard.objects.filter(pk=group_id).update(moving=False)
+        group_ids.append(group_id)
+    if group_ids:
+        invalidate()
+    return group_ids
+
+
+def reserve_id_ranges(alias):
+    """
+    Make the sharded tables of ``alias`` allocate IDs from its own range.
+
+    Only raises the sequences, so it is safe to run repeatedly.
+    """
+    if alias not in settings.SHARDS or alias == GLOBAL:
+        return
+    start = (settings.SHARDS.index(alias) + 1) << ID_RANGE_BITS
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in SHARDED_MODELS:
+            if not isinstance(model._meta.pk, models.AutoField) or model is Group:
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+                elif row[0] < start:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    "GREATEST(%s, (SELECT last_value FROM pg_sequences WHERE sequencename = %s)))",
+                    [table, start, f'{table}_id_seq'],
+                )
+
+
+@receiver(post_migrate)
+def reserve_id_ranges_after_migrate(sender, using, **kwargs):
+    if sender.name == 'api':
+        reserve_id_ranges(using)
@@ -0,0 +1,30 @@
+"""
+Expense splitting helpers for the TrackEase API application.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from decimal import Decimal, ROUND_DOWN
+
+CENT = Decimal('0.01')
+
+
+def split_evenly(amount, user_ids):
+    """
+    Split ``amount`` evenly between ``user_ids``.
+
+    Every share is rounded down to the cent and the remaining cents are
+    handed out one by one from the first user, so the shares always add up
+    to ``amount``. Returns a list of ``(user_id, share)`` tuples.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    base = (amount / len(user_ids)).quantize(CENT, rounding=ROUND_DOWN)
+    remainder = int((amount - base * len(user_ids)) / CENT)
+    return [
+        (user_id, base + CENT if index < remainder else base)
+        for index, user_id in enumerate(user_ids)
+    ]
@@ -0,0 +1,13 @@
+"""
+Tests for the TrackEase API application.
+
+Run them with ``python manage.py test api``, against the single default
+database. The sharding tests need more than one shard and are skipped
+otherwise::
+
+    DB_SHARDS=2 python manage.py test api.tests.test_sharding
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
@@ -0,0 +1,58 @@
+"""
+Shared fixtures for the TrackEase API tests.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api import sharding
+from api.models import Expense, ExpenseShare, Group, User
+
+# Throttles still run, but with no rates configured they never block.
+NO_THROTTLES = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+
+
+def make_user(name, **fields):
+    email = f'{name}@example.com'
+    return User.objects.create_user(
+        username=email, email=email, password='password', first_name=name.title(), **fields
+    )
+
+
+def add_expense(group, paid_by, amount, members=None, **fields):
+    """Create an expense split evenly among ``members`` (default: the group's), on the group's shard."""
+    with sharding.use_shard(sharding.shard_for_group(group.pk)):
+        expense = Expense.objects.create(
+            group=group, description=fields.pop('description', 'Expense'),
+            amount=Decimal(amount), paid_by=paid_by, **fields
+        )
+        members = members or list(group.members.order_by('pk'))
+        share = Decimal(amount) / len(members)
+        for member in members:
+            ExpenseShare.objects.create(expense=expense, user=member, amount=share)
+    return expense
+
+
+@override_settings(REST_FRAMEWORK=NO_THROTTLES)
+class APITestBase(APITestCase):
+    """
+    Two members, ``alice`` and ``bob``, of ``group``, which has two 30.00
+    expenses paid by alice; the client is authenticated as alice.
+    """
+    # Group data lives on the shards when DB_SHARDS is set.
+    databases = '__all__'
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.group = Group.objects.create(name='Flat', created_by=self.alice)
+        self.group.members.add(self.alice, self.bob)
+        self.expenses = [add_expense(self.group, self.alice, '30.00') for _ in range(2)]
+        self.client.force_authenticate(self.alice)
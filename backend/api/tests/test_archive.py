@@ -0,0 +1,60 @@
+"""
+Tests for expense archival (api.archive).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import io
+import json
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from api import counters
+from api.archive import archive_settled
+from api.models import ArchivedExpense, ArchivedExpenseShare, Expense, ExpenseShare
+
+from .base import APITestBase
+
+
+class ArchiveTests(APITestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.settled, self.open = self.expenses
+        share_ids = list(self.settled.shares.values_list('pk', flat=True))
+        self.client.post(f'/api/groups/{self.group.pk}/settle/', {'share_ids': share_ids}, format='json')
+        Expense.objects.update(created_at=timezone.now() - timedelta(days=400))
+
+    def balances(self):
+        return self.client.get(f'/api/groups/{self.group.pk}/balances/').json()['balances']
+
+    def test_only_old_fully_settled_expenses_move(self):
+        self.assertEqual(archive_settled(), 1)
+        self.assertEqual(list(Expense.objects.all()), [self.open])
+        self.assertEqual(ArchivedExpense.objects.get().pk, self.settled.pk)
+        self.assertEqual(ArchivedExpenseShare.objects.filter(expense_id=self.settled.pk).count(), 2)
+        self.assertFalse(ExpenseShare.objects.filter(expense_id=self.settled.pk).exists())
+
+    def test_recent_expenses_stay(self):
+        self.assertEqual(archive_settled(before=timezone.now() - timedelta(days=500)), 0)
+
+    def test_balances_and_counters_are_unchanged(self):
+        before = self.balances()
+        call_command('archive_expenses', stdout=io.StringIO())
+        self.assertEqual(self.balances(), before)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.expense_count, 2)
+        self.assertEqual(counters.check([self.group.pk]), [])
+
+    def test_lists_and_exports_read_the_archive_when_asked(self):
+        archive_settled()
+        listed = self.client.get('/api/expenses/').json()
+        self.assertEqual([expense['id'] for expense in listed], [self.open.pk])
+        for path in ('/api/expenses/?archived=true', f'/api/groups/{self.group.pk}/export/?archived=true'):
+            with self.subTest(path=path):
+                streamed = json.loads(b''.join(self.client.get(path).streaming_content))
+                self.assertEqual({expense['id'] for expense in streamed}, {self.settled.pk, self.open.pk})
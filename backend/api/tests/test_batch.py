@@ -0,0 +1,116 @@
+"""
+Tests for batch requests (api.batch).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.test import override_settings
+from rest_framework.test import APITransactionTestCase
+
+from api.models import Expense, Group
+
+from .base import NO_THROTTLES, APITestBase, make_user
+
+
+class BatchMixin:
+
+    def batch(self, *requests, **options):
+        return self.client.post('/api/batch/', {'requests': list(requests), **options}, format='json')
+
+
+class BatchTests(BatchMixin, APITestBase):
+
+    def test_responses_follow_request_order(self):
+        response = self.batch(
+            {'path': '/api/profile/'},
+            {'path': f'/api/groups/{self.group.pk}/?fields=id,name'},
+            {'path': '/api/expenses/?fields=id'},
+        )
+        self.assertEqual(response.status_code, 200)
+        profile, group, expenses = response.json()['responses']
+        self.assertEqual(profile['status'], 200)
+        self.assertEqual(profile['body']['email'], 'alice@example.com')
+        self.assertEqual(group['body'], {'id': self.group.pk, 'name': 'Flat'})
+        self.assertEqual(sorted(row['id'] for row in expenses['body']), sorted(e.pk for e in self.expenses))
+
+    def test_failures_do_not_stop_the_batch(self):
+        response = self.batch(
+            {'path': '/api/groups/999999/'},
+            {'path': '/api/nowhere/'},
+            {'path': '/api/profile/'},
+        )
+        self.assertEqual([entry['status'] for entry in response.json()['responses']], [404, 404, 200])
+
+    def test_writes_run_in_order(self):
+        response = self.batch(
+            {'method': 'POST', 'path': '/api/groups/', 'body': {'name': 'Trip'}},
+            {'path': '/api/groups/?fields=name'},
+            {'method': 'DELETE', 'path': f'/api/expenses/{self.expenses[0].pk}/'},
+        )
+        created, listed, deleted = response.json()['responses']
+        self.assertEqual(created['status'], 201)
+        self.assertIn({'name': 'Trip'}, listed['body'])
+        self.assertEqual(deleted['status'], 204)
+        self.assertTrue(Group.objects.filter(name='Trip').exists())
+        self.assertFalse(Expense.objects.filter(pk=self.expenses[0].pk).exists())
+
+    def test_sub_requests_check_permissions(self):
+        self.client.force_authenticate(make_user('carol'))
+        response = self.batch({'path': f'/api/groups/{self.group.pk}/'})
+        self.assertIn(response.json()['responses'][0]['status'], (403, 404))
+
+    def test_sub_requests_always_get_json(self):
+        # A format the batch cannot embed would break the whole response.
+        response = self.batch({
+            'path': '/api/expenses/?fields=id',
+            'headers': {'Accept': 'application/vnd.apache.arrow.stream'},
+        })
+        self.assertEqual(response.status_code, 200)
+        entry = response.json()['responses'][0]
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(entry['headers']['Content-Type'], 'application/json')
+        self.assertEqual(len(entry['body']), 2)
+
+
+class ValidationTests(BatchMixin, APITestBase):
+
+    def assertInvalid(self, data, message):
+        response = self.client.post('/api/batch/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(message, str(response.json()))
+
+    def test_requests_are_required(self):
+        self.assertInvalid({}, 'non-empty list')
+        self.assertInvalid({'requests': []}, 'non-empty list')
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_batch_size_is_limited(self):
+        self.assertInvalid({'requests': [{'path': '/api/profile/'}] * 3}, 'at most 2')
+
+    def test_sub_requests_are_checked(self):
+        self.assertInvalid({'requests': [{'method': 'GET'}]}, 'path is required')
+        self.assertInvalid({'requests': [{'method': 'TRACE', 'path': '/api/profile/'}]}, 'unsupported method')
+        self.assertInvalid({'requests': [{'path': 'https://example.com/api/profile/'}]}, 'API path')
+        self.assertInvalid({'requests': [{'path': '/admin/'}]}, 'API path')
+        self.assertInvalid({'requests': [{'path': '/api/profile/', 'headers': {'X-Count': 1}}]}, 'headers')
+        self.assertInvalid({'requests': [{'path': '/api/batch/'}]}, 'cannot be nested')
+
+    def test_batch_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.batch({'path': '/api/profile/'}).status_code, 401)
+
+
+@override_settings(REST_FRAMEWORK=NO_THROTTLES, BATCH_MAX_WORKERS=2)
+class ParallelTests(BatchMixin, APITransactionTestCase):
+    """Parallel reads use connections of their own, which only see committed rows."""
+
+    setUp = APITestBase.setUp
+
+    def test_parallel_reads_keep_order(self):
+        requests = [{'path': f'/api/expenses/{expense.pk}/?fields=id'} for expense in self.expenses]
+        response = self.batch(*requests, {'path': '/api/profile/'}, parallel=True)
+        bodies = [entry['body'] for entry in response.json()['responses']]
+        self.assertEqual(bodies[:2], [{'id': expense.pk} for expense in self.expenses])
+        self.assertEqual(bodies[2]['email'], 'alice@example.com')
@@ -0,0 +1,38 @@
+"""
+Tests for response compression (api.middleware.CompressionMiddleware).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.test import override_settings
+
+from .base import APITestBase, add_expense
+
+
+@override_settings(COMPRESSION_MIN_SIZE=0)
+class CompressedETagTests(APITestBase):
+
+    def setUp(self):
+        super().setUp()
+        for _ in range(10):
+            add_expense(self.group, self.bob, '12.50', description='Groceries for the week')
+
+    def get(self, **headers):
+        return self.client.get('/api/expenses/', HTTP_ACCEPT_ENCODING='gzip', **headers)
+
+    def test_not_modified_keeps_the_encoded_tag(self):
+        response = self.get()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].endswith('-gzip"'))
+
+        revalidated = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+        self.assertIn('Accept-Encoding', revalidated['Vary'])
+
+    def test_not_modified_without_compression_keeps_the_plain_tag(self):
+        etag = self.client.get('/api/expenses/')['ETag']
+        self.assertEqual(self.client.get('/api/expenses/', HTTP_IF_NONE_MATCH=etag)['ETag'], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag)['ETag'], etag)
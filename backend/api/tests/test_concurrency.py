@@ -0,0 +1,90 @@
+"""
+Tests for the adaptive concurrency limit (api.concurrency).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from api import concurrency
+from api.middleware import ConcurrencyLimitMiddleware
+
+from .base import APITestBase
+
+
+def view(request):
+    return HttpResponse()
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+
+    def test_sheds_beyond_the_share_of_a_class(self):
+        limiter = concurrency.AdaptiveLimiter(initial=4, minimum=1, shares={'read': 1.0, 'expensive': 0.5})
+        self.assertTrue(limiter.acquire('expensive'))
+        self.assertTrue(limiter.acquire('expensive'))
+        self.assertFalse(limiter.acquire('expensive'))
+        self.assertTrue(limiter.acquire('read'))
+
+    def test_backs_off_when_latency_grows(self):
+        limiter = concurrency.AdaptiveLimiter(initial=10, minimum=1, backoff=0.5, shares={'read': 1.0})
+        for _ in range(20):
+            limiter.acquire('read')
+            limiter.release('read', 0.01)
+        limiter.acquire('read')
+        limiter.release('read', 1.0)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_failures_back_off(self):
+        limiter = concurrency.AdaptiveLimiter(initial=10, minimum=1, backoff=0.5, shares={'read': 1.0})
+        limiter.acquire('read')
+        limiter.release('read', 0.01, failed=True)
+        self.assertEqual(limiter.limit, 5)
+
+
+class MiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/expenses/')
+
+    def middleware(self, response):
+        def get_response(request):
+            self.assertIsNone(middleware.process_view(request, view, (), {}))
+            return response
+        middleware = ConcurrencyLimitMiddleware(get_response)
+        middleware.limiter = concurrency.AdaptiveLimiter(initial=10, minimum=1)
+        return middleware
+
+    def test_slot_is_returned_with_the_response(self):
+        middleware = self.middleware(HttpResponse())
+        middleware(self.request)
+        self.assertEqual(middleware.limiter.inflight, 0)
+
+    def test_streamed_response_holds_its_slot_until_closed(self):
+        middleware = self.middleware(StreamingHttpResponse(iter([b'a', b'b'])))
+        response = middleware(self.request)
+        self.assertEqual(middleware.limiter.inflight, 1)
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(middleware.limiter.inflight, 0)
+
+
+class BatchTests(APITestBase):
+
+    def test_sub_requests_take_slots_of_their_own(self):
+        limiter = concurrency.limiter()
+        limiter.inflight += 1000
+        try:
+            response = self.client.post('/api/batch/', {'requests': [{'path': '/api/profile/'}]}, format='json')
+        finally:
+            limiter.inflight -= 1000
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['responses'][0]['status'], 503)
+
+    def test_sub_requests_return_their_slots(self):
+        requests = [{'path': '/api/profile/'}, {'path': '/api/groups/'}]
+        response = self.client.post('/api/batch/', {'requests': requests}, format='json')
+        self.assertEqual([entry['status'] for entry in response.json()['responses']], [200, 200])
+        self.assertEqual(concurrency.limiter().inflight, 0)
@@ -0,0 +1,103 @@
+"""
+Tests for conditional GETs and optimistic concurrency (api.conditional).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from api.models import Expense, VersionConflict
+
+from .base import APITestBase
+
+
+class CollectionETagTests(APITestBase):
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/expenses/')
+        etag = response['ETag']
+        response = self.client.get('/api/expenses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_list_is_served_again(self):
+        etag = self.client.get('/api/expenses/')['ETag']
+        self.client.patch(f'/api/expenses/{self.expenses[0].pk}/', {'description': 'Rent'}, format='json')
+        response = self.client.get('/api/expenses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_expanded_list_has_no_etag(self):
+        # Settling a share changes the expanded body but not the expenses.
+        response = self.client.get('/api/expenses/?expand=shares')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        share = self.expenses[0].shares.get(user=self.bob)
+        self.client.post(f'/api/groups/{self.group.pk}/settle/', {'share_ids': [share.pk]}, format='json')
+        response = self.client.get('/api/expenses/?expand=shares', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        shares = {row['id']: row for expense in response.json() for row in expense['shares']}
+        self.assertTrue(shares[share.pk]['is_settled'])
+
+
+class DetailETagTests(APITestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/expenses/{self.expenses[0].pk}/'
+
+    def test_unchanged_object_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertTrue(etag.startswith('"v1-'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Accept', response['Vary'])
+
+    def test_tag_depends_on_user_representation_and_fields(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotEqual(self.client.get(self.url + '?fields=id,amount')['ETag'], etag)
+        self.assertNotEqual(self.client.get(self.url, HTTP_ACCEPT='application/msgpack')['ETag'], etag)
+        self.client.force_authenticate(self.bob)
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+
+class OptimisticConcurrencyTests(APITestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/expenses/{self.expenses[0].pk}/'
+
+    def test_update_with_current_tag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(self.url, {'description': 'Rent'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 2)
+        self.assertTrue(response['ETag'].startswith('"v2-'))
+
+    def test_update_with_stale_tag_fails(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.patch(self.url, {'description': 'Rent'}, format='json')
+        response = self.client.patch(self.url, {'description': 'Food'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.expenses[0].refresh_from_db()
+        self.assertEqual(self.expenses[0].description, 'Rent')
+
+    def test_compressed_tag_is_accepted(self):
+        etag = self.client.get(self.url)['ETag']
+        encoded = f'{etag[:-1]}-gzip"'
+        response = self.client.patch(self.url, {'description': 'Rent'}, format='json', HTTP_IF_MATCH=encoded)
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_with_stale_tag_fails(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.patch(self.url, {'description': 'Rent'}, format='json')
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+
+    def test_concurrent_save_conflicts(self):
+        first = Expense.objects.get(pk=self.expenses[0].pk)
+        second = Expense.objects.get(pk=self.expenses[0].pk)
+        first.description = 'Rent'
+        first.save()
+        second.description = 'Food'
+        with self.assertRaises(VersionConflict):
+            second.save()
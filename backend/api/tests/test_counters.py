@@ -0,0 +1,76 @@
+"""
+Tests for the denormalized group counters (api.counters).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import io
+from decimal import Decimal
+
+from django.core.management import call_command
+
+from api import counters
+from api.models import Group
+
+from .base import APITestBase, add_expense, make_user
+
+
+class CounterTests(APITestBase):
+
+    def assertCounters(self, group, **expected):
+        group.refresh_from_db()
+        self.assertEqual({field: getattr(group, field) for field in expected}, expected)
+        self.assertEqual(counters.check([group.pk]), [])
+
+    def test_expenses_are_counted(self):
+        self.assertCounters(self.group, member_count=2, expense_count=2, total_amount=Decimal('60.00'))
+
+    def test_edits_and_deletions_are_counted(self):
+        expense = self.expenses[0]
+        expense.amount = Decimal('45.50')
+        expense.save()
+        self.assertCounters(self.group, expense_count=2, total_amount=Decimal('75.50'))
+        self.expenses[1].delete()
+        self.assertCounters(self.group, expense_count=1, total_amount=Decimal('45.50'))
+
+    def test_moving_an_expense_counts_in_both_groups(self):
+        other = Group.objects.create(name='Trip', created_by=self.alice)
+        other.members.add(self.alice)
+        expense = self.expenses[0]
+        expense.group = other
+        expense.save()
+        self.assertCounters(self.group, expense_count=1, total_amount=Decimal('30.00'))
+        self.assertCounters(other, expense_count=1, total_amount=Decimal('30.00'))
+
+    def test_memberships_are_counted(self):
+        carol = make_user('carol')
+        self.group.members.add(carol)
+        self.assertCounters(self.group, member_count=3)
+        carol.delete()
+        self.assertCounters(self.group, member_count=2)
+
+    def test_last_member_leaving_counts_zero(self):
+        other = Group.objects.create(name='Solo', created_by=self.alice)
+        other.members.add(self.bob)
+        other.members.clear()
+        self.assertCounters(other, member_count=0)
+        carol = make_user('carol')
+        other.members.add(carol)
+        carol.delete()
+        self.assertCounters(other, member_count=0)
+
+    def test_serialized_with_the_group(self):
+        data = self.client.get(f'/api/groups/{self.group.pk}/').json()
+        self.assertEqual((data['member_count'], data['expense_count'], data['total_amount']), (2, 2, '60.00'))
+        self.assertIsNotNone(data['last_activity_at'])
+
+    def test_repair_rewrites_drifted_counters(self):
+        Group.objects.filter(pk=self.group.pk).update(expense_count=99, total_amount=0)
+        out = io.StringIO()
+        call_command('check_group_counters', '--repair', stdout=out)
+        self.assertIn(f'Group {self.group.pk}: expense_count 99 != 2', out.getvalue())
+        self.assertCounters(self.group, expense_count=2, total_amount=Decimal('60.00'))
+        add_expense(self.group, self.bob, '1.00')
+        self.assertCounters(self.group, expense_count=3, total_amount=Decimal('61.00'))
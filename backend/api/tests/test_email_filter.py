@@ -0,0 +1,64 @@
+"""
+Tests for the email-existence filter (api.email_filter).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.test import SimpleTestCase
+
+from api import email_filter
+from api.email_filter import BloomFilter, email_exists
+from api.models import User
+
+from .base import APITestBase
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'user{i}@example.com')
+        self.assertTrue(all(f'user{i}@example.com' in bloom for i in range(1000)))
+        false_positives = sum(f'other{i}@example.com' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertAlmostEqual(bloom.expected_error_rate(), 0.01, delta=0.005)
+
+
+class EmailExistsTests(APITestBase):
+
+    def setUp(self):
+        super().setUp()
+        email_filter._state.update(filter=None, built_at=0.0, last_pk=0, next_poll=0.0)
+        self.addCleanup(email_filter._state.update, filter=None, built_at=0.0, last_pk=0, next_poll=0.0)
+        email_filter.get_filter()
+        # Polling for other workers' users is tested on its own.
+        email_filter._state['next_poll'] = float('inf')
+
+    def test_existing_email(self):
+        self.assertTrue(email_exists('alice@example.com'))
+
+    def test_absent_email_needs_no_query(self):
+        with self.assertNumQueries(0):
+            self.assertFalse(email_exists('someone@example.com'))
+
+    def test_users_created_in_this_process_are_added(self):
+        User.objects.create_user(username='carol@example.com', email='carol@example.com', password='password')
+        with self.assertNumQueries(1):
+            self.assertTrue(email_exists('carol@example.com'))
+
+    def test_users_created_by_other_workers_are_polled(self):
+        # bulk_create sends no post_save, like a save in another process.
+        User.objects.bulk_create([User(username='dave@example.com', email='dave@example.com')])
+        self.assertFalse(email_exists('dave@example.com'))
+        email_filter._state['next_poll'] = 0.0
+        self.assertTrue(email_exists('dave@example.com'))
+
+    def test_check_email_endpoint(self):
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/auth/check-email/', {'email': 'bob@example.com'}, format='json')
+        self.assertEqual(response.json(), {'exists': True})
+        response = self.client.post('/api/auth/check-email/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,71 @@
+"""
+Tests for sparse fieldsets and relation expansion (api.fieldsets).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from .base import APITestBase
+
+
+class FieldsTests(APITestBase):
+
+    def test_list_returns_requested_fields(self):
+        response = self.client.get('/api/expenses/?fields=id,amount')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(row) for row in response.json()], [{'id', 'amount'}] * 2)
+
+    def test_detail_returns_requested_fields(self):
+        response = self.client.get(f'/api/expenses/{self.expenses[0].pk}/?fields=id,description')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'id', 'description'})
+
+    def test_nested_field_expands_relation(self):
+        response = self.client.get(f'/api/expenses/{self.expenses[0].pk}/?fields=id,paid_by.email')
+        self.assertEqual(response.json(), {'id': self.expenses[0].pk, 'paid_by': {'email': 'alice@example.com'}})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/expenses/?fields=id,nonsense')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nonsense', str(response.json()))
+
+    def test_writes_get_full_representation(self):
+        response = self.client.patch(
+            f'/api/expenses/{self.expenses[0].pk}/?fields=id', {'description': 'Rent'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['description'], 'Rent')
+        self.assertIn('amount', response.json())
+
+
+class ExpandTests(APITestBase):
+
+    def test_list_expands_payer(self):
+        response = self.client.get('/api/expenses/?expand=paid_by')
+        self.assertEqual(response.status_code, 200)
+        for row in response.json():
+            self.assertEqual(row['paid_by']['id'], self.alice.pk)
+            self.assertEqual(row['paid_by']['email'], 'alice@example.com')
+
+    def test_detail_expands_shares(self):
+        response = self.client.get(f'/api/expenses/{self.expenses[0].pk}/?expand=shares.user')
+        self.assertEqual(response.status_code, 200)
+        users = {share['user']['id'] for share in response.json()['shares']}
+        self.assertEqual(users, {self.alice.pk, self.bob.pk})
+
+    def test_unexpandable_relation_is_rejected(self):
+        response = self.client.get('/api/expenses/?expand=amount')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', str(response.json()))
+
+    def test_detail_tag_follows_expanded_relation(self):
+        # Renaming the payer changes the expanded body but not the expense.
+        url = f'/api/expenses/{self.expenses[0].pk}/?expand=paid_by'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.alice.first_name = 'Alicia'
+        self.alice.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['paid_by']['first_name'], 'Alicia')
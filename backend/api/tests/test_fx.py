@@ -0,0 +1,106 @@
+"""
+Tests for currency conversion (api.fx).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import io
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db.models import Sum
+
+from api import fx
+from api.models import Expense, ExchangeRate, Group
+
+from .base import APITestBase, add_expense
+
+
+class RatesTestBase(APITestBase):
+    """EUR rates for 2024, and a 100.00 EUR expense in March on top of the base fixture."""
+
+    def setUp(self):
+        super().setUp()
+        ExchangeRate.objects.create(currency='EUR', date=date(2024, 1, 1), rate=Decimal('1.10'))
+        ExchangeRate.objects.create(currency='EUR', date=date(2024, 6, 1), rate=Decimal('1.20'))
+        fx.invalidate()
+        self.addCleanup(fx.invalidate)
+        # Entered today for a dinner in March, when EUR was at 1.10.
+        self.expense = add_expense(self.group, self.alice, '100.00', currency='EUR', date=date(2024, 3, 15))
+
+    def converted(self, queryset):
+        return queryset.aggregate(total=Sum(fx.converted_amount()))['total']
+
+
+class ConversionTests(RatesTestBase):
+
+    def test_rate_of_the_expense_date_is_used(self):
+        expenses = Expense.objects.filter(pk=self.expense.pk)
+        self.assertEqual(fx.convert(Decimal('100.00'), 'EUR', self.expense.date), Decimal('110.0000'))
+        self.assertEqual(Decimal(self.converted(expenses)).quantize(Decimal('0.01')), Decimal('110.00'))
+
+    def test_counters_use_the_rate_of_the_expense_date(self):
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.total_amount, Decimal('170.00'))
+
+    def test_changing_the_date_restates_the_amount(self):
+        self.expense.date = date(2024, 7, 1)
+        self.expense.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.total_amount, Decimal('180.00'))
+
+    def test_currency_without_rates_is_reported(self):
+        with self.assertRaises(fx.UnknownCurrency):
+            fx.convert(Decimal('1.00'), 'JPY', date(2024, 1, 1))
+        with self.assertLogs('api.fx', 'WARNING'):
+            self.assertIsNone(fx.to_base(Decimal('1.00'), 'JPY', date(2024, 1, 1)))
+
+    def test_currency_without_rates_is_left_out_of_totals(self):
+        ExchangeRate.objects.all().delete()
+        fx.invalidate()
+        self.assertIsNone(self.converted(Expense.objects.filter(pk=self.expense.pk)))
+        self.assertEqual(self.converted(Expense.objects.filter(group=self.group)), Decimal('60.00'))
+        with self.assertLogs('api.fx', 'WARNING'):
+            self.expense.delete()
+
+    def test_base_currency_needs_no_rates(self):
+        other = Group.objects.create(name='Base', created_by=self.alice)
+        other.members.add(self.alice)
+        add_expense(other, self.alice, '5.00')
+        self.assertEqual(self.converted(Expense.objects.filter(group=other)), Decimal('5.00'))
+
+
+class ReportingTests(RatesTestBase):
+    """Balances and totals reported in a chosen currency."""
+
+    def test_balances_in_another_currency(self):
+        # Today's 60.00 USD at 1.20 and the March 100.00 EUR at its own rate.
+        response = self.client.get(f'/api/groups/{self.group.pk}/balances/?currency=eur')
+        self.assertEqual(response.json()['currency'], 'EUR')
+        self.assertEqual(
+            {entry['user']: entry['balance'] for entry in response.json()['balances']},
+            {self.alice.pk: '75.00', self.bob.pk: '-75.00'},
+        )
+
+    def test_dashboard_in_the_base_currency(self):
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.json()['currency'], 'USD')
+        self.assertEqual(Decimal(response.json()['owed_to_user']), Decimal('85.00'))
+
+    def test_unknown_currency_is_rejected(self):
+        response = self.client.get(f'/api/groups/{self.group.pk}/balances/?currency=XYZ')
+        self.assertEqual(response.status_code, 400)
+
+    def test_loading_rates_refreshes_the_cache(self):
+        self.assertNotIn('GBP', fx.currencies())
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as rates_file:
+            rates_file.write('date,currency,rate\n2024-01-01,GBP,1.25\n2024-01-01,EUR,1.05\n')
+        self.addCleanup(os.remove, rates_file.name)
+        call_command('load_fx_rates', rates_file.name, stdout=io.StringIO())
+        self.assertIn('GBP', fx.currencies())
+        self.assertEqual(fx.rate('EUR', date(2024, 3, 15)), Decimal('1.05'))
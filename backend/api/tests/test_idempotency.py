@@ -0,0 +1,82 @@
+"""
+Tests for Idempotency-Key handling (api.idempotency).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITransactionTestCase
+
+from api.models import Group, IdempotencyKey
+from api.views import GroupViewSet
+
+from .base import NO_THROTTLES, APITestBase
+
+
+class CreateGroupMixin:
+
+    def create(self, name='Trip', key='key-1'):
+        return self.client.post('/api/groups/', {'name': name}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+
+class IdempotencyTests(CreateGroupMixin, APITestBase):
+
+    def test_retry_replays_the_response(self):
+        first = self.create()
+        retry = self.create()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Group.objects.filter(name='Trip').count(), 1)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.create()
+        response = self.create(name='Other')
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Group.objects.filter(name='Other').exists())
+
+    def test_failed_write_frees_the_key(self):
+        response = self.client.post('/api/groups/', {}, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.create().status_code, 201)
+
+    def test_abandoned_pending_key_is_taken_over(self):
+        self.create()
+        IdempotencyKey.objects.update(
+            status_code=None, response=None, created_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(self.create().status_code, 201)
+        self.assertEqual(Group.objects.filter(name='Trip').count(), 2)
+
+
+@override_settings(REST_FRAMEWORK=NO_THROTTLES)
+class InFlightTests(CreateGroupMixin, APITransactionTestCase):
+    """Runs without a wrapping transaction, so commits are real."""
+
+    setUp = APITestBase.setUp
+
+    def test_retry_while_the_first_request_runs_conflicts(self):
+        seen = []
+        save = GroupViewSet.perform_create
+
+        def perform_create(view, serializer):
+            # The key row is committed before the write starts, so other
+            # workers see it; the retry here stands in for one of them.
+            seen.append((connection.in_atomic_block, IdempotencyKey.objects.get().status_code))
+            seen.append(self.create().status_code)
+            save(view, serializer)
+
+        with mock.patch.object(GroupViewSet, 'perform_create', perform_create):
+            first = self.create()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(seen, [(False, None), 409])
+        self.assertEqual(Group.objects.filter(name='Trip').count(), 1)
@@ -0,0 +1,82 @@
+"""
+Tests for the balance ledger and its snapshots (api.ledger).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from decimal import Decimal
+
+from django.test import override_settings
+from django.utils import timezone
+
+from api import ledger
+from api.models import BalanceSnapshot, LedgerEntry
+
+from .base import APITestBase, add_expense
+
+
+@override_settings(LEDGER_SNAPSHOT_DELAY=0)
+class LedgerTests(APITestBase):
+
+    def balances(self, **params):
+        response = self.client.get(f'/api/groups/{self.group.pk}/balances/', params)
+        return {entry['user']: entry['balance'] for entry in response.json()['balances']}
+
+    def ledger_balances(self):
+        return {
+            user_id: f'{balance.quantize(ledger.CENT)}'
+            for user_id, balance in ledger.balances_from(LedgerEntry.objects.filter(group=self.group)).items()
+            if balance.quantize(ledger.CENT)
+        }
+
+    def settle_bob(self):
+        share_ids = [self.expenses[0].shares.get(user=self.bob).pk]
+        self.client.post(f'/api/groups/{self.group.pk}/settle/', {'share_ids': share_ids}, format='json')
+
+    def test_entries_follow_every_change(self):
+        expected = {self.alice.pk: '30.00', self.bob.pk: '-30.00'}
+        self.assertEqual(self.ledger_balances(), expected)
+        self.settle_bob()
+        self.assertEqual(self.ledger_balances(), self.balances())
+        expense = self.expenses[1]
+        expense.paid_by = self.bob
+        expense.save()
+        self.assertEqual(self.ledger_balances(), self.balances())
+        add_expense(self.group, self.bob, '9.00')
+        self.expenses[1].shares.get(user=self.alice).delete()
+        self.assertEqual(self.ledger_balances(), self.balances())
+
+    def test_balances_at_a_past_moment(self):
+        before = timezone.now()
+        self.settle_bob()
+        self.assertEqual(ledger.take_snapshots(), 1)
+        add_expense(self.group, self.bob, '10.00')
+        self.assertEqual(self.balances(at=before.isoformat()), {self.alice.pk: '30.00', self.bob.pk: '-30.00'})
+        self.assertEqual(self.balances(at=timezone.now().isoformat()), self.balances())
+
+    def test_snapshots_only_cover_changed_groups(self):
+        self.assertEqual(ledger.take_snapshots(), 1)
+        self.assertEqual(ledger.take_snapshots(), 0)
+        self.settle_bob()
+        self.assertEqual(ledger.take_snapshots(), 1)
+        latest = BalanceSnapshot.objects.filter(group=self.group).latest('taken_at')
+        self.assertEqual(
+            {int(user_id): Decimal(balance) for user_id, balance in latest.balances.items()},
+            {self.alice.pk: Decimal(15), self.bob.pk: Decimal(-15)},
+        )
+
+    def test_rebuild_recreates_the_same_balances(self):
+        self.settle_bob()
+        current = self.ledger_balances()
+        # Two entries for each of bob's shares, and two for the settlement.
+        self.assertEqual(ledger.rebuild([self.group.pk]), 6)
+        self.assertEqual(self.ledger_balances(), current)
+
+    def test_ledger_endpoint_pages_newest_first(self):
+        response = self.client.get(f'/api/groups/{self.group.pk}/ledger/')
+        self.assertEqual(response.status_code, 200)
+        ids = [entry['id'] for entry in response.json()['results']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 4)
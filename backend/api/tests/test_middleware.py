@@ -0,0 +1,42 @@
+"""
+Tests for the split of the middleware chain (api.middleware.BrowserMiddleware).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.conf import settings
+from django.test import override_settings
+
+from .base import APITestBase
+
+# The admin pages link static files, which have no manifest before collectstatic.
+PLAIN_STATIC = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+
+
+@override_settings(STORAGES=PLAIN_STATIC)
+class BrowserMiddlewareTests(APITestBase):
+
+    def test_api_requests_skip_the_browser_middleware(self):
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_admin_gets_the_full_stack(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_admin_login_uses_a_session(self):
+        self.alice.is_staff = True
+        self.alice.is_superuser = True
+        self.alice.save()
+        self.client.force_authenticate(None)
+        self.client.login(username='alice@example.com', password='password')
+        response = self.client.get('/admin/api/group/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Flat')
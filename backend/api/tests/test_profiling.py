@@ -0,0 +1,55 @@
+"""
+Tests for the worker profiling endpoints (api.profiling).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import shutil
+import tempfile
+import time
+
+from django.test import override_settings
+
+from api import profiling
+
+from .base import APITestBase
+
+
+class ProfilingTests(APITestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice.is_staff = True
+        self.alice.save()
+
+    def test_refused_with_a_process_local_cache(self):
+        response = self.client.post('/api/debug/profile/?seconds=1')
+        self.assertEqual(response.status_code, 503)
+
+    def test_session_results_are_collected_in_a_second_request(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=caches, PROFILING_POLL_SECONDS=0):
+            started = self.client.post('/api/debug/profile/?seconds=0.2&interval=0.01')
+            self.assertEqual(started.status_code, 202)
+            session_id = started.json()['session']
+            self.assertEqual(started['Location'], f'/api/debug/profile/{session_id}/')
+
+            pending = self.client.get(f'/api/debug/profile/{session_id}/')
+            self.assertEqual(pending.status_code, 202)
+            self.assertIn('Retry-After', pending)
+
+            time.sleep(max(0.0, profiling.ready_at(profiling.get_session(session_id)) - time.time()))
+            done = self.client.get(f'/api/debug/profile/{session_id}/?output=speedscope')
+            self.assertEqual(done.status_code, 200)
+            self.assertEqual(done['X-Profiled-Workers'], '1')
+            self.assertEqual(done.json()['exporter'], 'trackease')
+
+            self.assertEqual(self.client.get('/api/debug/profile/unknown/').status_code, 404)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.post('/api/debug/profile/').status_code, 403)
@@ -0,0 +1,104 @@
+"""
+Tests for recurring expense scheduling (api.recurring).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from api.models import Expense, RecurringExpense
+from api.recurring import due_dates, materialize_due, shift
+
+from .base import APITestBase, make_user
+
+MONTHLY = RecurringExpense.MONTHLY
+
+
+class ShiftTests(SimpleTestCase):
+
+    def test_month_ends_are_clamped_without_drifting(self):
+        start = date(2024, 1, 31)
+        self.assertEqual(
+            [shift(start, MONTHLY, periods) for periods in range(4)],
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+
+    def test_leap_day_in_yearly_schedules(self):
+        start = date(2024, 2, 29)
+        self.assertEqual(shift(start, RecurringExpense.YEARLY, 1), date(2025, 2, 28))
+        self.assertEqual(shift(start, RecurringExpense.YEARLY, 4), date(2028, 2, 29))
+
+    def test_due_dates_start_at_next_due(self):
+        template = RecurringExpense(
+            frequency=MONTHLY, start_date=date(2024, 1, 31), next_due=date(2024, 3, 31)
+        )
+        dates, next_due = due_dates(template, date(2024, 5, 15))
+        self.assertEqual(dates, [date(2024, 3, 31), date(2024, 4, 30)])
+        self.assertEqual(next_due, date(2024, 5, 31))
+
+    def test_due_dates_stop_at_end_date(self):
+        template = RecurringExpense(
+            frequency=RecurringExpense.WEEKLY, start_date=date(2024, 1, 1),
+            next_due=date(2024, 1, 1), end_date=date(2024, 1, 10),
+        )
+        dates, next_due = due_dates(template, date(2024, 2, 1))
+        self.assertEqual(dates, [date(2024, 1, 1), date(2024, 1, 8)])
+        self.assertEqual(next_due, date(2024, 1, 15))
+
+
+class MaterializeTests(APITestBase):
+
+    def schedule(self, **fields):
+        return RecurringExpense.objects.create(**{
+            'group': self.group, 'description': 'Rent', 'amount': Decimal('100.00'), 'paid_by': self.alice,
+            'frequency': MONTHLY, 'start_date': date(2024, 1, 31), 'next_due': date(2024, 1, 31), **fields,
+        })
+
+    def test_missed_periods_are_created_once(self):
+        template = self.schedule()
+        self.assertEqual(materialize_due(date(2024, 3, 31)), 3)
+        self.assertEqual(materialize_due(date(2024, 3, 31)), 0)
+        occurrences = Expense.objects.filter(recurring=template).order_by('occurrence_date')
+        self.assertEqual(
+            [expense.date for expense in occurrences], [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)]
+        )
+        self.assertEqual([share.amount for share in occurrences[0].shares.all()], [Decimal('50.00')] * 2)
+        template.refresh_from_db()
+        self.assertEqual(template.next_due, date(2024, 4, 30))
+
+    def test_template_ends_after_its_end_date(self):
+        template = self.schedule(end_date=date(2024, 2, 15))
+        materialize_due(date(2024, 6, 1))
+        template.refresh_from_db()
+        self.assertFalse(template.is_active)
+        self.assertEqual(Expense.objects.filter(recurring=template).count(), 1)
+
+    def test_payer_who_left_the_group_is_skipped(self):
+        template = self.schedule()
+        self.group.members.remove(self.alice)
+        self.assertEqual(materialize_due(date(2024, 3, 31)), 0)
+        template.refresh_from_db()
+        self.assertEqual(template.next_due, date(2024, 4, 30))
+
+    def test_outsiders_cannot_schedule_for_a_group(self):
+        self.client.force_authenticate(make_user('carol'))
+        response = self.client.post('/api/recurring-expenses/', {
+            'group': self.group.pk, 'description': 'Rent', 'amount': '100.00', 'frequency': MONTHLY,
+            'start_date': '2024-01-31',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecurringExpense.objects.exists())
+
+    def test_members_schedule_from_the_start_date(self):
+        response = self.client.post('/api/recurring-expenses/', {
+            'group': self.group.pk, 'description': 'Rent', 'amount': '100.00', 'frequency': MONTHLY,
+            'start_date': '2024-01-31',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['next_due'], '2024-01-31')
+        self.assertEqual(response.json()['paid_by'], self.alice.pk)
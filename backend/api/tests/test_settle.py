@@ -0,0 +1,58 @@
+"""
+Tests for the batch settle endpoint (GroupViewSet.settle).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from api.models import ExpenseShare, Group
+
+from .base import APITestBase, add_expense, make_user
+
+
+class SettleTests(APITestBase):
+
+    def settle(self, data, group=None):
+        return self.client.post(f'/api/groups/{(group or self.group).pk}/settle/', data, format='json')
+
+    def bob_shares(self):
+        return ExpenseShare.objects.filter(expense__group=self.group, user=self.bob)
+
+    def test_settles_the_listed_shares(self):
+        share = self.bob_shares().first()
+        response = self.settle({'share_ids': [share.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['settled'], 1)
+        self.assertEqual(
+            {entry['user']: entry['balance'] for entry in response.json()['balances']},
+            {self.alice.pk: '15.00', self.bob.pk: '-15.00'},
+        )
+        self.assertEqual(self.bob_shares().filter(is_settled=True).count(), 1)
+
+    def test_settles_everything_the_payer_owes_the_payee(self):
+        response = self.settle({'payer': self.bob.pk, 'payee': self.alice.pk})
+        self.assertEqual(response.json()['settled'], 2)
+        self.assertEqual(response.json()['balances'], [])
+        self.assertFalse(self.bob_shares().filter(is_settled=False).exists())
+
+    def test_leaves_other_groups_alone(self):
+        other = Group.objects.create(name='Other', created_by=self.bob)
+        other.members.add(self.alice, self.bob)
+        share = add_expense(other, self.alice, '10.00').shares.get(user=self.bob)
+        self.assertEqual(self.settle({'share_ids': [share.pk]}).json()['settled'], 0)
+        share.refresh_from_db()
+        self.assertFalse(share.is_settled)
+
+    def test_invalid_share_ids_are_rejected(self):
+        for share_ids in (['abc'], 'abc', [None]):
+            with self.subTest(share_ids=share_ids):
+                self.assertEqual(self.settle({'share_ids': share_ids}).status_code, 400)
+
+    def test_invalid_payer_or_payee_is_rejected(self):
+        self.assertEqual(self.settle({'payer': 'bob', 'payee': self.alice.pk}).status_code, 400)
+        self.assertEqual(self.settle({'payer': self.bob.pk}).status_code, 400)
+
+    def test_outsiders_cannot_settle(self):
+        self.client.force_authenticate(make_user('carol'))
+        self.assertEqual(self.settle({'payer': self.bob.pk, 'payee': self.alice.pk}).status_code, 404)
@@ -0,0 +1,95 @@
+"""
+Tests for horizontal sharding of group data (api.sharding).
+
+The multi-shard tests only run with several shards configured::
+
+    DB_SHARDS=2 python manage.py test api.tests.test_sharding
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import unittest
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITransactionTestCase
+
+from api import sharding
+from api.models import Expense, ExpenseShare, Group, GroupShard, LedgerEntry
+
+from .base import NO_THROTTLES, APITestBase, add_expense
+
+
+class SingleShardTests(SimpleTestCase):
+
+    @override_settings(SHARDS=['default'])
+    def test_everything_lives_in_default(self):
+        self.assertTrue(sharding.single())
+        self.assertEqual(sharding.shard_for_group(123), 'default')
+        self.assertEqual(sharding.shards_for_groups([1, 2]), {'default': [1, 2]})
+
+
+class ShardedFixtureMixin:
+
+    def setUp(self):
+        sharding.invalidate()
+        self.addCleanup(sharding.invalidate)
+        APITestBase.setUp(self)
+        self.shard = sharding.shard_for_group(self.group.pk)
+        self.other_shard = next(alias for alias in settings.SHARDS if alias != self.shard)
+
+    def new_group(self):
+        group = Group.objects.create(name='Trip', created_by=self.alice)
+        group.members.add(self.alice, self.bob)
+        return group
+
+
+@unittest.skipIf(len(settings.SHARDS) < 2, 'needs DB_SHARDS=2 or more')
+class ShardingTests(ShardedFixtureMixin, APITestBase):
+    databases = '__all__'
+
+    def test_group_data_lives_on_the_group_shard(self):
+        self.assertEqual(GroupShard.objects.get(pk=self.group.pk).shard, self.shard)
+        self.assertEqual(Expense.objects.using(self.shard).filter(group=self.group).count(), 2)
+        self.assertFalse(Expense.objects.using(self.other_shard).filter(group=self.group).exists())
+        self.assertTrue(LedgerEntry.objects.using(self.shard).filter(group=self.group).exists())
+
+    def test_ids_are_unique_across_shards(self):
+        other = self.new_group()
+        while sharding.shard_for_group(other.pk) == self.shard:
+            other = self.new_group()
+        expense = add_expense(other, self.bob, '10.00')
+        self.assertNotIn(expense.pk, {e.pk for e in self.expenses})
+        self.assertEqual(sharding.locate_group(Expense, expense.pk), other.pk)
+
+    def test_move_group_keeps_its_data_and_ids(self):
+        balances = self.client.get(f'/api/groups/{self.group.pk}/balances/').json()
+        sharding.move_group(self.group.pk, self.other_shard)
+        self.assertEqual(sharding.shard_for_group(self.group.pk), self.other_shard)
+        self.assertTrue(Group.objects.using(self.other_shard).filter(pk=self.group.pk).exists())
+        self.assertFalse(Expense.objects.using(self.shard).filter(group_id=self.group.pk).exists())
+        self.assertEqual(ExpenseShare.objects.using(self.other_shard).filter(expense__group_id=self.group.pk).count(), 4)
+        self.assertEqual(self.client.get(f'/api/groups/{self.group.pk}/balances/').json(), balances)
+
+    def test_writes_to_a_moving_group_are_refused(self):
+        GroupShard.objects.filter(pk=self.group.pk).update(moving=True)
+        sharding.invalidate()
+        response = self.client.patch(f'/api/groups/{self.group.pk}/', {'name': 'Home'}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.client.get(f'/api/groups/{self.group.pk}/').status_code, 200)
+        self.assertEqual(sharding.finish_moves(), [self.group.pk])
+
+
+@unittest.skipIf(len(settings.SHARDS) < 2, 'needs DB_SHARDS=2 or more')
+@override_settings(REST_FRAMEWORK=NO_THROTTLES)
+class FanOutTests(ShardedFixtureMixin, APITransactionTestCase):
+    """Lists query the shards from worker threads, which only see committed rows."""
+    databases = '__all__'
+
+    def test_lists_merge_every_shard(self):
+        groups = [self.group] + [self.new_group() for _ in range(3)]
+        self.assertGreater(len({sharding.shard_for_group(group.pk) for group in groups}), 1)
+        listed = self.client.get('/api/groups/').json()
+        self.assertEqual([group['id'] for group in listed], sorted(group.pk for group in groups))
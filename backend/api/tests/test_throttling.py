@@ -0,0 +1,65 @@
+"""
+Tests for the token bucket throttles (api.throttling).
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from api import throttling
+
+from .base import make_user
+
+
+class LocalBucketStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.store = throttling.LocalBucketStore()
+        self.store.clock = lambda: self.now
+
+    def test_takes_tokens_until_empty(self):
+        self.assertEqual(self.store.consume('a', 2, 1.0, 1), 0)
+        self.assertEqual(self.store.consume('a', 2, 1.0, 1), 0)
+        self.assertEqual(self.store.consume('a', 2, 1.0, 1), 1.0)
+
+    def test_sweep_drops_full_buckets_only(self):
+        self.store.consume('idle', 10, 1.0, 1)
+        self.now = 50.0
+        self.store.consume('busy', 100, 1.0, 100)
+        self.now = self.store.sweep_interval
+        self.store.consume('new', 10, 1.0, 1)
+        self.assertEqual(set(self.store._buckets), {'busy', 'new'})
+
+
+RATES = {'ip': '1000/min', 'auth': '1/min', 'email_check': '5/min'}
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': RATES})
+class ThrottleTests(APITestCase):
+
+    def setUp(self):
+        throttling._stores.clear()
+        make_user('alice')
+
+    def tearDown(self):
+        throttling._stores.clear()
+
+    def login(self, **headers):
+        return self.client.post(
+            '/api/auth/login/', {'username': 'alice@example.com', 'password': 'wrong'}, format='json', **headers
+        )
+
+    def test_forwarded_for_does_not_pick_a_new_bucket(self):
+        self.assertNotEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.1').status_code, 429)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.2').status_code, 429)
+
+    def test_check_email_has_its_own_budget(self):
+        self.login()
+        self.assertEqual(self.login().status_code, 429)
+        response = self.client.post('/api/auth/check-email/', {'email': 'alice@example.com'}, format='json')
+        self.assertNotEqual(response.status_code, 429)
@@ -0,0 +1,214 @@
+"""
+Request throttling for the TrackEase API application.
+
+Throttles are token buckets: every bucket holds up to ``num`` tokens and
+refills at ``num`` tokens per period, as configured with DRF's usual rate
+strings (e.g. ``'20/min'``) in ``DEFAULT_THROTTLE_RATES``. Each request
+takes ``throttle_cost`` tokens from every bucket that applies to it, so
+expensive endpoints (password hashing, bulk writes, exports) use up the
+budget faster than cheap reads.
+
+Three throttles are provided:
+1. IPThrottle - one bucket per client IP, rate ``ip``
+2. UserThrottle - one bucket per authenticated user, rate ``user``
+3. ScopedThrottle - one bucket per endpoint class and client, rate named by
+   the view's ``throttle_scope``
+
+Buckets live in-process by default. Set ``THROTTLE_BUCKET_STORE = 'cache'``
+to keep them in the ``THROTTLE_CACHE`` cache backend so that all workers
+share one budget. A bucket that has refilled is the same as no bucket, so
+both stores forget buckets once they are full again.
+
+Clients are told apart by ``REMOTE_ADDR`` unless ``NUM_PROXIES`` is set,
+so a client cannot pick its own bucket with ``X-Forwarded-For``.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return ``(capacity, tokens per second)`` for a rate such as ``'20/min'``."""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class LocalBucketStore:
+    """
+    Token buckets kept in a dictionary of the current process.
+
+    Every ``sweep_interval`` seconds, buckets that have refilled to capacity
+    are dropped, so the dictionary only holds clients seen recently.
+    """
+
+    clock = staticmethod(time.monotonic)
+    sweep_interval = 60
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0
+
+    def consume(self, key, capacity, refill, cost):
+        """
+        Take ``cost`` tokens from the bucket ``key``.
+
+        Returns 0 if the tokens were taken, otherwise the number of seconds
+        until enough tokens will be available.
+        """
+        with self._lock:
+            now = self.clock()
+            if now >= self._next_sweep:
+                self._sweep(now)
+            tokens, stamp, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - stamp) * refill)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill)
+            return 0 if allowed else (cost - tokens) / refill
+
+    def _sweep(self, now):
+        """Drop the buckets that are full again. Called with the lock held."""
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._next_sweep = now + self.sweep_interval
+
+
+class CacheBucketStore:
+    """
+    Token buckets kept in a shared Django cache backend.
+
+    The read and write of a bucket are not atomic, so concurrent requests
+    from the same client may occasionally both be let through; the budget
+    is enforced approximately, which is enough to stop floods.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill, cost):
+        now = self.clock()
+        tokens, stamp = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - stamp) * refill)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        # The entry can expire once the bucket would be full again.
+        self.cache.set(key, (tokens, now), int((capacity - tokens) / refill) + 1)
+        return 0 if allowed else (cost - tokens) / refill
+
+
+_stores = {}
+
+
+def get_store():
+    """Return the bucket store selected by ``THROTTLE_BUCKET_STORE``."""
+    name = getattr(settings, 'THROTTLE_BUCKET_STORE', 'local')
+    if name not in _stores:
+        if name == 'local':
+            _stores[name] = LocalBucketStore()
+        elif name == 'cache':
+            _stores[name] = CacheBucketStore(getattr(settings, 'THROTTLE_CACHE', 'default'))
+        else:
+            raise ImproperlyConfigured(f"Unknown THROTTLE_BUCKET_STORE '{name}'")
+    return _stores[name]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class for token bucket throttles.
+
+    Subclasses define ``get_scope`` (the name of the rate to apply) and
+    ``get_key`` (the bucket of the current request).
+    """
+
+    def get_scope(self, request, view):
+        raise NotImplementedError('.get_scope() must be overridden')
+
+    def get_key(self, request, view, scope):
+        raise NotImplementedError('.get_key() must be overridden')
+
+    def allow_request(self, request, view):
+        self._wait = None
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        cost = min(getattr(view, 'throttle_cost', 1), capacity)
+        wait = get_store().consume(
+            f'throttle:{self.get_key(request, view, scope)}', capacity, refill, cost
+        )
+        if wait:
+            self._wait = wait
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class IPThrottle(TokenBucketThrottle):
+    """Budget shared by every request from one client IP."""
+
+    def get_scope(self, request, view):
+        return 'ip'
+
+    def get_key(self, request, view, scope):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserThrottle(TokenBucketThrottle):
+    """Budget shared by every request of one authenticated user."""
+
+    def get_scope(self, request, view):
+        return 'user' if request.user and request.user.is_authenticated else None
+
+    def get_key(self, request, view, scope):
+        return f'user:{request.user.pk}'
+
+
+class ScopedThrottle(TokenBucketThrottle):
+    """Budget for one endpoint class, per user or per IP for anonymous clients."""
+
+    def get_scope(self, request, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_key(self, request, view, scope):
+        if request.user and request.user.is_authenticated:
+            return f'{scope}:user:{request.user.pk}'
+        return f'{scope}:ip:{self.get_ident(request)}'
+
+
+def throttle(scope=None, cost=1):
+    """
+    Set the throttle scope and cost of a function-based view.
+
+    Apply it above ``@api_view`` so it can reach the generated view class::
+
+        @throttle('auth', cost=5)
+        @api_view(['POST'])
+        def login_view(request):
+            ...
+    """
+    def decorator(view):
+        view.cls.throttle_scope = scope
+        view.cls.throttle_cost = cost
+        return view
+    return decorator
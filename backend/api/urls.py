@@ -6,6 +6,7 @@ This module defines the URL patterns for the API endpoints:
 2. Group endpoints - Group creation and management
 3. Expense endpoints - Expense tracking and sharing
 4. ExpenseShare endpoints - Managing expense settlements
+5. Batch endpoint - Several API requests in one round trip
 
 @author Nandeesh Kantli
 @date April 4, 2024
@@ -17,11 +18,16 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ExpenseViewSet, 
     GroupViewSet, 
+    RecurringExpenseViewSet,
     RegisterAPI,
     LoginAPI,
     check_email,
     user_profile_view,
-    update_profile_view
+    update_profile_view,
+    dashboard_view,
+    batch_view,
+    profile_workers,
+    profile_results
 )
 from knox import views as knox_views
 
@@ -31,6 +37,7 @@ router = DefaultRouter()
 # Register viewsets with the router
 router.register(r'expenses', ExpenseViewSet)
 router.register(r'groups', GroupViewSet)
+router.register(r'recurring-expenses', RecurringExpenseViewSet)
 
 # URL patterns for the API
 urlpatterns = [
@@ -46,4 +53,12 @@ urlpatterns = [
     # User endpoints
     path('profile/', user_profile_view, name='profile'),
     path('profile/update/', update_profile_view, name='update-profile'),
+    path('dashboard/', dashboard_view, name='dashboard'),
+
+    # Several requests in one round trip
+    path('batch/', batch_view, name='batch'),
+
+    # Staff endpoints
+    path('debug/profile/', profile_workers, name='profile-workers'),
+    path('debug/profile/<str:session_id>/', profile_results, name='profile-results'),
 ]
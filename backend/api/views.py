@@ -12,28 +12,49 @@ This module defines the view classes and functions that handle API requests:
 @version 1.0.0
 """
 
-from rest_framework import viewsets, status, generics, permissions
+import math
+import threading
+import time
+
+from rest_framework import viewsets, status, generics, permissions, serializers
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
-from .models import Group, Expense, UserProfile, User
-from .serializers import GroupSerializer, ExpenseSerializer, UserSerializer, RegisterSerializer, LoginSerializer
-from django.http import JsonResponse
+from .models import Group, Expense, ExpenseShare, ArchivedExpense, LedgerEntry, RecurringExpense, UserProfile, User
+from .serializers import GroupSerializer, ExpenseSerializer, UserSerializer, RegisterSerializer, LoginSerializer, BalanceSerializer, LedgerEntrySerializer, RecurringExpenseSerializer, ArchivedExpenseSerializer, ExpenseShareSerializer, validate_currency_code
 from django.views.decorators.csrf import csrf_exempt
-import json
+from django.http import HttpResponse
 from django.contrib.auth import authenticate, login
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.authtoken.models import Token
 from django.conf import settings
-import requests
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from knox.models import AuthToken
 from knox.views import LoginView as KnoxLoginView
-
-
-class GroupViewSet(viewsets.ModelViewSet):
+from .balances import group_balances, settle_shares, user_totals
+from .breakdowns import DIMENSIONS, breakdown
+from .throttling import throttle
+from .concurrency import route_class
+from .pagination import LedgerPagination, MemberPagination
+from .fast_serialization import FastListMixin
+from .fieldsets import FieldsetViewMixin
+from .conditional import VersionedUpdateMixin
+from .archive import include_archived
+from . import batch, fx, ledger, profiling
+from .sharding import ShardedViewMixin
+from .idempotency import idempotent
+from .email_filter import email_exists, shared_cache
+
+
+def requested_currency(request):
+    """Return the currency requested with the ``currency`` query parameter."""
+    currency = request.query_params.get('currency')
+    return validate_currency_code(currency) if currency else settings.BASE_CURRENCY
+
+
+class GroupViewSet(ShardedViewMixin, FastListMixin, FieldsetViewMixin, VersionedUpdateMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling group operations.
     
@@ -46,52 +67,246 @@ class GroupViewSet(viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = None
+    throttle_cost = 1
+    pagination_class = None
 
     def get_queryset(self):
         """Return groups where the user is a member or creator."""
-        return Group.objects.filter(
-            models.Q(members=self.request.user) | 
-            models.Q(created_by=self.request.user)
-        ).distinct()
-
-    @action(detail=True, methods=['get'])
+        return Group.objects.filter(pk__in=self.user_group_ids())
+
+    def resolve_members(self, data):
+        """
+        Resolve ``user_ids`` and ``emails`` from request data with one IN query.
+
+        Returns a ``(user_ids, not_found)`` tuple where ``not_found`` lists the
+        IDs and emails that did not match any user.
+        """
+        ids = data.get('user_ids') or []
+        emails = data.get('emails') or []
+        if 'user_id' in data:
+            ids = [data.get('user_id')]
+        if not isinstance(ids, list) or not isinstance(emails, list):
+            raise serializers.ValidationError({'error': 'user_ids and emails must be lists'})
+        if not ids and not emails:
+            raise serializers.ValidationError({'error': 'user_ids or emails are required'})
+        try:
+            ids = {int(user_id) for user_id in ids}
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'error': 'user_ids must be integers'})
+
+        found = User.objects.filter(
+            models.Q(id__in=ids) | models.Q(email__in=emails)
+        ).values_list('id', 'email')
+        found_ids = {user_id for user_id, email in found}
+        found_emails = {email for user_id, email in found}
+        not_found = sorted(ids - found_ids) + [email for email in emails if email not in found_emails]
+        return found_ids, not_found
+
+    @action(detail=True, methods=['get'], pagination_class=MemberPagination)
     def users(self, request, pk=None):
+        """List group members, one keyset-paginated page at a time."""
         group = self.get_object()
-        users = group.users.all()
-        return Response([{
+        users = group.members.only('id', 'username', 'email', 'first_name', 'last_name')
+        page = self.paginate_queryset(users)
+        return self.get_paginated_response([{
             'id': user.id,
             'name': user.get_full_name() or user.username,
             'email': user.email
-        } for user in users])
+        } for user in page])
+
+    @action(detail=True, methods=['post', 'delete'], throttle_scope='bulk', throttle_cost=5)
+    @idempotent
+    def members(self, request, pk=None):
+        """
+        Add (POST) or remove (DELETE) members in bulk.
+
+        Accepts ``user_ids`` and/or ``emails`` lists. Users are resolved with
+        one query and the membership rows are written with one statement.
+        """
+        group = self.get_object()
+        user_ids, not_found = self.resolve_members(request.data)
+        if request.method == 'POST':
+            group.members.add(*user_ids)
+        else:
+            group.members.remove(*user_ids)
+        return Response({
+            'added' if request.method == 'POST' else 'removed': sorted(user_ids),
+            'not_found': not_found
+        })
 
     @action(detail=True, methods=['post'])
     def add_user(self, request, pk=None):
         group = self.get_object()
-        user_id = request.data.get('user_id')
-        try:
-            user = User.objects.get(id=user_id)
-            group.users.add(user)
-            return Response({'message': 'User added to group'})
-        except User.DoesNotExist:
+        user_ids, not_found = self.resolve_members(request.data)
+        if not_found:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        group.members.add(*user_ids)
+        return Response({'message': 'User added to group'})
 
     @action(detail=True, methods=['delete'])
     def remove_user(self, request, pk=None):
         group = self.get_object()
-        user_id = request.data.get('user_id')
-        try:
-            user = User.objects.get(id=user_id)
-            group.users.remove(user)
-            return Response({'message': 'User removed from group'})
-        except User.DoesNotExist:
+        user_ids, not_found = self.resolve_members(request.data)
+        if not_found:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        group.members.remove(*user_ids)
+        return Response({'message': 'User removed from group'})
+
+    @action(detail=True, methods=['post'], throttle_scope='bulk', throttle_cost=5)
+    @idempotent
+    def settle(self, request, pk=None):
+        """
+        Settle outstanding shares of the group in a single UPDATE.
+
+        The settled shares are read first, in the same transaction, so their
+        settlement can be recorded in the balance ledger. Accepts either
+        ``share_ids`` (a list of share IDs) or a ``payer`` and ``payee``
+        pair, in which case every unsettled share owed by the payer on
+        expenses paid by the payee is settled. Returns the number of
+        settled shares and the group balances after the settlement, in the
+        ``currency`` query parameter or the base currency.
+        """
+        group = self.get_object()
+        currency = requested_currency(request)
+        shares = ExpenseShare.objects.filter(expense__group=group, is_settled=False)
+
+        share_ids = request.data.get('share_ids')
+        payer = request.data.get('payer')
+        payee = request.data.get('payee')
+        if share_ids is not None:
+            try:
+                share_ids = serializers.ListField(child=serializers.IntegerField()).run_validation(share_ids)
+            except serializers.ValidationError:
+                return Response({'error': 'share_ids must be a list of share IDs'}, status=status.HTTP_400_BAD_REQUEST)
+            shares = shares.filter(id__in=share_ids)
+        elif payer and payee:
+            try:
+                payer, payee = (serializers.IntegerField().run_validation(value) for value in (payer, payee))
+            except serializers.ValidationError:
+                return Response({'error': 'payer and payee must be user IDs'}, status=status.HTTP_400_BAD_REQUEST)
+            shares = shares.filter(user_id=payer, expense__paid_by_id=payee)
+        else:
+            return Response(
+                {'error': 'Either share_ids or payer and payee are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic(using=group._state.db):
+            settled = len(settle_shares(shares))
+            balances = group_balances(group.id, currency)
+
+        return Response({
+            'settled': settled,
+            'currency': currency,
+            'balances': BalanceSerializer(balances, many=True).data
+        })
+
+    @action(detail=True, methods=['get'], throttle_scope='bulk', throttle_cost=10)
+    def export(self, request, pk=None):
+        """
+        Export the whole expense ledger of the group.
+
+        Served as JSON, MessagePack (``application/msgpack``) or an Arrow IPC
+        stream (``application/vnd.apache.arrow.stream``) by content negotiation,
+        streamed in chunks so the ledger is never held in memory at once.
+        Archived expenses are included, before current ones, with
+        ``?archived=true``.
+        """
+        group = self.get_object()
+        sources = [(Expense.objects.filter(group=group), ExpenseSerializer)]
+        if include_archived(request):
+            sources.insert(0, (ArchivedExpense.objects.filter(group=group), ArchivedExpenseSerializer))
+        return self.streaming_list(request, *sources)
+
+    @action(detail=True, methods=['get'])
+    def balances(self, request, pk=None):
+        """
+        Return member balances in the ``currency`` query parameter or the base currency.
+
+        With an ``at`` query parameter (an ISO 8601 date and time) the
+        balances at that moment are read from the balance ledger. They are
+        converted at the rate of that day rather than the rate of each
+        expense's day.
+        """
+        group = self.get_object()
+        currency = requested_currency(request)
+        at = request.query_params.get('at')
+        if at is None:
+            balances = group_balances(group.id, currency)
+        else:
+            moment = parse_datetime(at)
+            if moment is None:
+                return Response(
+                    {'error': 'at must be an ISO 8601 date and time'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            balances = [
+                {**row, 'balance': fx.convert(row['balance'], settings.BASE_CURRENCY, moment.date(), to=currency)}
+                for row in ledger.balance_at(group.id, moment)
+            ]
+        return Response({
+            'currency': currency,
+            'balances': BalanceSerializer(balances, many=True).data
+        })
+
+    @action(detail=True, methods=['get'])
+    def breakdown(self, request, pk=None):
+        """
+        Return the group's expenses totalled by ``category``, ``month`` or ``member``.
+
+        ``by`` picks the breakdown (``category`` by default); ``start`` and
+        ``end`` (ISO 8601 dates, inclusive) limit the expenses by date.
+        Totals are in the ``currency`` query parameter or the base currency,
+        archived expenses included.
+        """
+        group = self.get_object()
+        currency = requested_currency(request)
+        by = request.query_params.get('by', 'category')
+        if by not in DIMENSIONS:
+            return Response(
+                {'error': f"by must be one of {', '.join(DIMENSIONS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        dates = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                dates[name] = None
+            if value and dates[name] is None:
+                return Response(
+                    {'error': f'{name} must be an ISO 8601 date'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        rows = breakdown(group.id, by, currency, **dates)
+        return Response({
+            'currency': currency,
+            'by': by,
+            'breakdown': [{**row, 'total': str(row['total'])} for row in rows],
+        })
+
+    @action(detail=True, methods=['get'], pagination_class=LedgerPagination)
+    def ledger(self, request, pk=None):
+        """List the balance ledger of the group, newest entries first, one keyset-paginated page at a time."""
+        group = self.get_object()
+        page = self.paginate_queryset(LedgerEntry.objects.filter(group=group))
+        return self.get_paginated_response(LedgerEntrySerializer(page, many=True).data)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Create a group; a retry with the same Idempotency-Key replays the response."""
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Create a new group and set the creator."""
         serializer.save(created_by=self.request.user)
 
 
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(ShardedViewMixin, FastListMixin, FieldsetViewMixin, VersionedUpdateMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling expense operations.
     
@@ -107,16 +322,60 @@ class ExpenseViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Return expenses for groups where the user is a member."""
-        return Expense.objects.filter(
-            models.Q(group__members=self.request.user) | 
-            models.Q(group__created_by=self.request.user)
-        ).distinct()
+        return Expense.objects.filter(group_id__in=self.user_group_ids())
+
+    def list(self, request, *args, **kwargs):
+        """
+        List expenses, preceded by archived expenses with ``?archived=true``.
+
+        With several shards the archived and current expenses are each
+        listed shard by shard.
+        """
+        if not include_archived(request):
+            return super().list(request, *args, **kwargs)
+        shards = self.list_shards()
+        archived = ArchivedExpense.objects.filter(group_id__in=self.user_group_ids())
+        current = self.filter_queryset(self.get_queryset())
+        return self.streaming_list(
+            request,
+            *[(archived.using(alias), ArchivedExpenseSerializer) for alias in shards],
+            *[(current.using(alias), ExpenseSerializer) for alias in shards]
+        )
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Create an expense; a retry with the same Idempotency-Key replays the response."""
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Create a new expense and set the payer."""
         serializer.save(paid_by=self.request.user)
 
 
+class RecurringExpenseViewSet(ShardedViewMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for handling recurring expense templates.
+
+    Provides CRUD operations for templates. Occurrences are created by the
+    ``materialize_recurring`` management command.
+    """
+    queryset = RecurringExpense.objects.all()
+    serializer_class = RecurringExpenseSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Return templates for groups where the user is a member."""
+        return RecurringExpense.objects.filter(group_id__in=self.user_group_ids())
+
+    def perform_create(self, serializer):
+        """Create a new template paid by the user, first due on its start date."""
+        serializer.save(
+            paid_by=self.request.user,
+            next_due=serializer.validated_data['start_date']
+        )
+
+
+@throttle('auth', cost=10)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @csrf_exempt
@@ -162,7 +421,7 @@ def signup_view(request):
         user.save()
 
         # Create a token for the new user
-        token, created = Token.objects.get_or_create(user=user)
+        token = AuthToken.objects.create(user)[1]
 
         # The UserProfile will be automatically created by the signal
 
@@ -170,7 +429,7 @@ def signup_view(request):
             {
                 "success": True,
                 "message": "User created successfully",
-                "token": token.key,
+                "token": token,
                 "user": {
                     "id": user.id,
                     "username": user.username,
@@ -190,6 +449,7 @@ def signup_view(request):
         )
 
 
+@throttle('auth', cost=10)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @csrf_exempt
@@ -213,13 +473,14 @@ def login_view(request):
         user = authenticate(username=username, password=password)
         
         if user:
-            login(request, user)
-            token, created = Token.objects.get_or_create(user=user)
+            if hasattr(request, 'session'):
+                login(request, user)
+            token = AuthToken.objects.create(user)[1]
             serializer = UserSerializer(user)
             return Response({
                 "success": True,
                 "message": "Login successful",
-                "token": token.key,
+                "token": token,
                 "user": serializer.data
             })
         else:
@@ -239,12 +500,20 @@ def dashboard_view(request):
     try:
         # Return a simple response for the dashboard
         user = request.user
+        currency = requested_currency(request)
+        totals = user_totals(user.id, currency)
         data = {
             "message": f"Welcome to the dashboard, {user.username}!",
             "user_id": user.id,
             "username": user.username,
+            "currency": currency,
+            "total_paid": str(totals['paid']),
+            "owed_to_user": str(totals['owed_to_user']),
+            "owed_by_user": str(totals['owed_by_user']),
         }
         return Response(data)
+    except serializers.ValidationError:
+        raise
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
@@ -270,6 +539,7 @@ def user_profile_view(request):
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
+@throttle('auth', cost=5)
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def google_auth_view(request):
@@ -293,11 +563,11 @@ def google_auth_view(request):
             )
             user.save()
 
-        # Create or get token
-        token, created = Token.objects.get_or_create(user=user)
+        # Create a knox token for the session
+        token = AuthToken.objects.create(user)[1]
 
         return Response({
-            "token": token.key,
+            "token": token,
             "user": {
                 "id": user.id,
                 "username": user.username,
@@ -314,6 +584,7 @@ def google_auth_view(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
 
+@throttle('auth', cost=5)
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def apple_auth_view(request):
@@ -337,11 +608,11 @@ def apple_auth_view(request):
             )
             user.save()
 
-        # Create or get token
-        token, created = Token.objects.get_or_create(user=user)
+        # Create a knox token for the session
+        token = AuthToken.objects.create(user)[1]
 
         return Response({
-            "token": token.key,
+            "token": token,
             "user": {
                 "id": user.id,
                 "username": user.username,
@@ -416,7 +687,7 @@ def update_profile_view(request):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class GroupExpensesView(APIView):
+class GroupExpensesView(ShardedViewMixin, APIView):
     """
     View for handling group expense operations.
     
@@ -426,21 +697,32 @@ class GroupExpensesView(APIView):
     - Member balance calculations
     """
     permission_classes = [IsAuthenticated]
+    shard_group_kwarg = 'group_id'
 
     def get(self, request, group_id):
-        """Get all expenses for a specific group."""
+        """
+        Get all expenses for a specific group, archived ones too with ``?archived=true``.
+
+        Supports ``?fields=`` and ``?expand=`` (see ``api.fieldsets``).
+        """
         try:
             group = Group.objects.get(id=group_id)
-            expenses = Expense.objects.filter(group=group)
-            serializer = ExpenseSerializer(expenses, many=True)
-            return Response(serializer.data)
+            context = {'request': request}
+            expenses = ExpenseSerializer(context=context).prepare(Expense.objects.filter(group=group))
+            data = ExpenseSerializer(expenses, many=True, context=context).data
+            if include_archived(request):
+                archived = ArchivedExpenseSerializer(context=context).prepare(
+                    ArchivedExpense.objects.filter(group=group)
+                )
+                data = ArchivedExpenseSerializer(archived, many=True, context=context).data + data
+            return Response(data)
         except Group.DoesNotExist:
             return Response(
                 {'error': 'Group not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
 
-class ExpenseSharesView(APIView):
+class ExpenseSharesView(ShardedViewMixin, APIView):
     """
     View for handling expense share operations.
     
@@ -451,13 +733,16 @@ class ExpenseSharesView(APIView):
     - Share statistics
     """
     permission_classes = [IsAuthenticated]
+    shard_model = Expense
+    lookup_field = 'expense_id'
 
     def get(self, request, expense_id):
-        """Get all shares for a specific expense."""
+        """Get all shares for a specific expense, with ``?fields=`` and ``?expand=user`` support."""
         try:
             expense = Expense.objects.get(id=expense_id)
-            shares = ExpenseShare.objects.filter(expense=expense)
-            serializer = ExpenseShareSerializer(shares, many=True)
+            context = {'request': request}
+            shares = ExpenseShareSerializer(context=context).prepare(ExpenseShare.objects.filter(expense=expense))
+            serializer = ExpenseShareSerializer(shares, many=True, context=context)
             return Response(serializer.data)
         except Expense.DoesNotExist:
             return Response(
@@ -468,6 +753,8 @@ class ExpenseSharesView(APIView):
 class RegisterAPI(generics.GenericAPIView):
     serializer_class = RegisterSerializer
     permission_classes = (permissions.AllowAny,)
+    throttle_scope = 'auth'
+    throttle_cost = 10
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -484,12 +771,19 @@ class RegisterAPI(generics.GenericAPIView):
 
 class LoginAPI(KnoxLoginView):
     permission_classes = (permissions.AllowAny,)
+    throttle_scope = 'auth'
+    throttle_cost = 10
 
     def post(self, request, format=None):
         serializer = LoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data
-        login(request, user)
+        # Sessions are for browser pages; API-only deployments keep none on
+        # /api/. Either way KnoxLoginView issues the token to request.user.
+        if hasattr(request, 'session'):
+            login(request, user)
+        else:
+            request.user = user
         
         response = super(LoginAPI, self).post(request, format=None)
         token = response.data['token']
@@ -501,6 +795,7 @@ class LoginAPI(KnoxLoginView):
             "user": UserSerializer(user).data
         })
 
+@throttle('email_check')
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def check_email(request):
@@ -510,7 +805,95 @@ def check_email(request):
             'error': 'Email is required'
         }, status=status.HTTP_400_BAD_REQUEST)
         
-    exists = User.objects.filter(email=email).exists()
+    exists = email_exists(email)
     return Response({
         'exists': exists
-    })
\ No newline at end of file
+    })
+
+@route_class(None)
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def profile_workers(request):
+    """
+    Start sampling the request threads of all workers (staff only).
+
+    ``seconds`` (default 10) is the length of the session and ``interval``
+    the sampling interval in seconds. Answers 202 at once with the session
+    id; the flame graph is fetched from ``profile_results`` once the session
+    is over. Refused with 503 when the cache is local to each process, since
+    neither the other workers nor the results request would see the session.
+    """
+    if not shared_cache():
+        return Response(
+            {'error': 'Profiling needs a cache backend shared by all workers, configure one in CACHES'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    try:
+        seconds = float(request.query_params.get('seconds', 10))
+        interval = float(request.query_params.get('interval', settings.PROFILING_INTERVAL))
+    except ValueError:
+        return Response({'error': 'seconds and interval must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < seconds <= settings.PROFILING_MAX_SECONDS or interval <= 0:
+        return Response(
+            {'error': f'seconds must be between 0 and {settings.PROFILING_MAX_SECONDS}, interval positive'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    session = profiling.start_session(seconds, interval)
+    # The request thread starting the session has nothing worth sampling.
+    profiling.untrack(threading.get_ident())
+    profiling.join(session)
+    retry_after = max(1, math.ceil(profiling.ready_at(session) - time.time()))
+    return Response(
+        {'session': session['id'], 'retry_after': retry_after},
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': f"{request.path}{session['id']}/", 'Retry-After': str(retry_after)}
+    )
+
+
+@route_class(None)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def profile_results(request, session_id):
+    """
+    Return the flame graph of a profiling session started with ``profile_workers`` (staff only).
+
+    ``output`` is ``collapsed`` (collapsed stacks as text, the default) or
+    ``speedscope`` (a speedscope JSON file). Answers 202 with Retry-After
+    while the session is still running.
+    """
+    output = request.query_params.get('output', 'collapsed')
+    if output not in ('collapsed', 'speedscope'):
+        return Response({'error': 'output must be collapsed or speedscope'}, status=status.HTTP_400_BAD_REQUEST)
+    session = profiling.get_session(session_id)
+    if session is None:
+        return Response({'error': 'Profiling session not found'}, status=status.HTTP_404_NOT_FOUND)
+    wait = profiling.ready_at(session) - time.time()
+    if wait > 0:
+        retry_after = math.ceil(wait)
+        return Response(
+            {'session': session_id, 'retry_after': retry_after},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Retry-After': str(retry_after)}
+        )
+
+    counts, workers = profiling.results(session)
+    body, content_type = profiling.render(counts, output, session['interval'])
+    response = HttpResponse(body, content_type=content_type)
+    response['X-Profiled-Workers'] = str(workers)
+    return response
+
+
+# Every sub-request takes a concurrency slot of its own (see api.batch).
+@route_class(None)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_view(request):
+    """
+    Run several API requests in one round trip, see ``api.batch``.
+
+    The body lists the sub-requests under ``requests``; ``parallel`` lets
+    consecutive read-only ones run concurrently.
+    """
+    items = batch.parse(request.data)
+    return Response({'responses': batch.run(request, items, parallel=bool(request.data.get('parallel')))})
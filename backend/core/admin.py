@@ -0,0 +1,27 @@
+"""
+Admin configuration for the TrackEase core application.
+
+Users are registered mainly so the expense admins (see ``api.admin``) can
+pick them with autocomplete widgets, which search the fields below by
+prefix instead of rendering every user.
+
+@author Nandeesh Kantli
+@date April 4, 2024
+@version 1.0.0
+"""
+
+from django.contrib import admin
+
+from .models import User
+
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    list_display = ['id', 'email', 'username', 'first_name', 'last_name', 'is_staff', 'is_active']
+    list_filter = ['is_staff', 'is_active']
+    search_fields = ['^email', '^username', '^first_name', '^last_name']
+    ordering = ['-pk']
+    show_full_result_count = False
+    exclude = ['password']
+    readonly_fields = ['date_joined', 'last_login']
+    filter_horizontal = ['groups', 'user_permissions']
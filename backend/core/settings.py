@@ -16,13 +16,25 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
-load_dotenv()
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Load a local .env file from the backend or repository root. python-dotenv
+# is only imported when such a file exists, so deployments that configure
+# real environment variables skip it at start-up.
+for env_file in (BASE_DIR / '.env', BASE_DIR.parent / '.env'):
+    if env_file.is_file():
+        from dotenv import load_dotenv
+        load_dotenv(env_file)
+        break
+
+# API-only deployments leave out the admin, the browsable API and the apps
+# only they need, which keeps worker start-up and memory down
+API_ONLY = os.getenv('API_ONLY', '').lower() in ('1', 'true', 'yes')
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
@@ -54,24 +66,57 @@ INSTALLED_APPS = [
     'api',
 ]
 
+if API_ONLY:
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS
+        if app not in ('django.contrib.admin', 'django.contrib.messages', 'django.contrib.staticfiles')
+    ]
+
 # Custom user model
 AUTH_USER_MODEL = 'core.User'
 
 # Middleware configuration
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.AssetMiddleware',
+    'api.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
     'django.middleware.common.CommonMiddleware',
+    'api.middleware.BrowserMiddleware',
+    'api.middleware.ConcurrencyLimitMiddleware',
+    'api.middleware.ProfilingMiddleware',
+]
+
+# API requests authenticate with knox tokens; sessions, CSRF checks, the
+# session user, messages and frame options only run for the pages outside
+# /api/ (the admin, the browsable API login and the frontend), in place of
+# api.middleware.BrowserMiddleware above
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# The admin and deployment checks look for this middleware in MIDDLEWARE
+# only; it runs for /admin/ and the other pages through BROWSER_MIDDLEWARE
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410', 'security.W002', 'security.W003']
+
+if API_ONLY:
+    BROWSER_MIDDLEWARE.remove('django.contrib.messages.middleware.MessageMiddleware')
+    # The sessions that remain live in signed cookies rather than the database
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+# Response compression (api.middleware.CompressionMiddleware); zstd and
+# brotli are used when the zstandard and brotli packages are installed
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 4, 'zstd': 3}
+
 # CORS configuration
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # REST Framework configuration
 REST_FRAMEWORK = {
@@ -81,8 +126,36 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Token bucket throttles, see api/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.IPThrottle',
+        'api.throttling.UserThrottle',
+        'api.throttling.ScopedThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'ip': '600/min',
+        'user': '1200/min',
+        'auth': '60/min',
+        'email_check': '120/min',
+        'bulk': '120/min',
+    },
+    # Number of reverse proxies in front of the app. With 0, throttles key
+    # clients on REMOTE_ADDR and ignore the spoofable X-Forwarded-For.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
+if API_ONLY:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = ['api.renderers.FastJSONRenderer']
+
+# Where throttle token buckets are kept: 'local' (per process) or 'cache'
+# (shared by all workers through the THROTTLE_CACHE cache backend)
+THROTTLE_BUCKET_STORE = os.getenv('THROTTLE_BUCKET_STORE', 'local')
+THROTTLE_CACHE = 'default'
+
 # Root URL configuration
 ROOT_URLCONF = 'core.urls'
 
@@ -114,6 +187,18 @@ DATABASES = {
     }
 }
 
+# Group data can be spread over DB_SHARDS extra databases (see api.sharding);
+# users, auth and tokens stay in 'default'. Every database is migrated with
+# the same schema: python manage.py migrate --database shard0
+DB_SHARDS = int(os.getenv('DB_SHARDS', '0'))
+for index in range(DB_SHARDS):
+    DATABASES[f'shard{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f"db_shard{index}.sqlite3",
+    }
+SHARDS = [f'shard{index}' for index in range(DB_SHARDS)] or ['default']
+DATABASE_ROUTERS = ['api.sharding.ShardRouter']
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -140,10 +225,75 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Production build of the React app (npm run build). collectstatic collects
+# its static files with content-hashed names and gzip/brotli versions, and
+# api.middleware.AssetMiddleware serves them and the app (see api.assets)
+FRONTEND_BUILD_DIR = BASE_DIR.parent / 'frontend' / 'build'
+STATICFILES_DIRS = [FRONTEND_BUILD_DIR / 'static'] if (FRONTEND_BUILD_DIR / 'static').is_dir() else []
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'api.assets.CompressedManifestStaticFilesStorage'},
+}
+
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Currency that balances are reported in and exchange rates are quoted against
+BASE_CURRENCY = os.getenv('BASE_CURRENCY', 'USD')
+
+# Bloom filter of user emails in front of the email-existence checks
+# (api.email_filter): target false positive rate, rebuild interval and, when
+# the default cache is not shared by the workers, how often they look for
+# users created by the others
+EMAIL_FILTER_ERROR_RATE = 0.01
+EMAIL_FILTER_REBUILD_SECONDS = 300
+EMAIL_FILTER_POLL_SECONDS = 1
+
+# On-demand sampling profiler (api.profiling): how often workers look for a
+# profiling session, the longest session and the default sampling interval
+PROFILING_POLL_SECONDS = 1
+PROFILING_MAX_SECONDS = 60
+PROFILING_INTERVAL = 0.005
+
+# How long (in seconds) a stored Idempotency-Key response is replayed
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# After how long (in seconds) a key still waiting for its response is
+# considered abandoned by a crashed request and may be used again
+IDEMPOTENCY_PENDING_TIMEOUT = 5 * 60
+
+# The snapshot_balances management command leaves ledger entries younger
+# than this many seconds for its next run (see api.ledger.take_snapshots)
+LEDGER_SNAPSHOT_DELAY = 60
+
+# Fully settled expenses older than this many days are moved to the archive
+# tables by the archive_expenses management command
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+
+# Admin changelists (api.admin) count at most this many rows and estimate
+# larger totals
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Adaptive concurrency limit per worker process (api.concurrency): the
+# starting, lowest and highest limit, the slowdown over the no-load latency
+# that counts as overload, how much the limit shrinks then, the requests
+# per baseline window, the share of the limit each route class may use and
+# the Retry-After seconds of shed requests
+CONCURRENCY_LIMIT_ENABLED = os.getenv('CONCURRENCY_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CONCURRENCY_INITIAL_LIMIT = 20
+CONCURRENCY_MIN_LIMIT = 4
+CONCURRENCY_MAX_LIMIT = 200
+CONCURRENCY_LATENCY_TOLERANCE = 2.0
+CONCURRENCY_BACKOFF = 0.9
+CONCURRENCY_WINDOW = 500
+CONCURRENCY_SHARES = {'read': 1.0, 'write': 0.8, 'expensive': 0.5}
+CONCURRENCY_RETRY_AFTER = 1
+
+# Batch requests (api.batch): most sub-requests per batch, and most threads
+# running the read-only ones of a parallel batch
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -9,24 +9,29 @@ The `urlpatterns` list routes URLs to views. For more information please see:
 @version 1.0.0
 """
 
-from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 
 # URL patterns for the project
 urlpatterns = [
-    # Admin interface URL
-    path('admin/', admin.site.urls),
-    
     # API endpoints
     path('api/', include('api.urls')),
-    
-    # Authentication endpoints
-    path('auth/', include('rest_framework.urls')),
 ]
 
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+# Admin interface and browsable API login, left out of API-only deployments
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns += [
+        path('admin/', admin.site.urls),
+        path('auth/', include('rest_framework.urls')),
+    ]
+
+# Static files and media are served by api.middleware.AssetMiddleware; every
+# other page URL is a route of the React app
+if (settings.FRONTEND_BUILD_DIR / 'index.html').is_file():
+    from api.assets import frontend
+
+    urlpatterns += [
+        re_path(r'^(?!(?:api|admin|auth|static|media)(?:/|$))', frontend),
+    ]